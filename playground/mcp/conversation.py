@@ -0,0 +1,167 @@
+import json
+import re
+from typing import Dict, List
+
+from json_stream import extract_json
+
+# 每次请求（系统提示 + 摘要 + 最近对话）的 token 上限，超出时把最早的几轮对话折叠进摘要
+CONTEXT_MAX_TOKENS = 6000
+# 摘要本身的 token 上限，超出时丢弃最早的摘要行
+SUMMARY_MAX_TOKENS = 800
+# 单条工具结果写入上下文的最大字符数
+TOOL_RESULT_MAX_CHARS = 2000
+# 折叠后的工具记录中每个结果保留的字符数
+TOOL_RECORD_MAX_CHARS = 200
+# 摘要中每轮用户问题 / 助手回复保留的字符数
+SUMMARY_TEXT_MAX_CHARS = 80
+# 每条消息的固定开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TOOL_RESULT_PREFIX = "Tool execution result: "
+
+_CJK = re.compile(r"[　-〿㐀-鿿＀-￯]")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的 token 数：安装了 tiktoken 时精确计算，否则中文按每字 1 个、其余按每 4 个字符 1 个估算"""
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(call["function"]["name"]) + count_tokens(call["function"]["arguments"])
+    return tokens
+
+
+def truncate(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else f"{text[:limit]}…"
+
+
+def compact_tool_records(messages: List[Dict]) -> str:
+    """把一轮对话中间的工具调用和结果折叠成一条紧凑记录
+
+    支持两种模式：原生函数调用（assistant.tool_calls + tool 消息）和
+    JSON 协议（assistant 返回 {"tool":..., "arguments":...}，结果作为 system 消息）。
+    """
+    records = []
+    pending: Dict[str, Dict] = {}
+    for message in messages:
+        if message["role"] == "assistant" and message.get("tool_calls"):
+            for call in message["tool_calls"]:
+                record = {"call": f"{call['function']['name']}({call['function']['arguments']})", "result": None}
+                records.append(record)
+                pending[call["id"]] = record
+        elif message["role"] == "assistant":
+            try:
+                tool_call = extract_json(message.get("content") or "", expect="object", leading=True)
+                arguments = json.dumps(tool_call.get("arguments"), ensure_ascii=False)
+                records.append({"call": f"{tool_call.get('tool')}({arguments})", "result": None})
+            except json.JSONDecodeError:
+                continue
+        elif message["role"] == "tool" and message.get("tool_call_id") in pending:
+            pending[message["tool_call_id"]]["result"] = message["content"]
+        elif message["role"] == "system" and records and records[-1]["result"] is None:
+            content = message["content"]
+            records[-1]["result"] = content[len(TOOL_RESULT_PREFIX):] if content.startswith(TOOL_RESULT_PREFIX) else content
+
+    return "；".join(
+        f"{record['call']} → {truncate(record['result'] or '无结果', TOOL_RECORD_MAX_CHARS)}"
+        for record in records
+    )
+
+
+class ConversationContext:
+    """对话上下文：控制每次请求的大小
+
+    - 每轮对话结束后，中间的工具调用 / 结果折叠成一条 system 记录
+    - 总 token 数超过 max_tokens 时，最早的几轮对话移出窗口，压缩成一行摘要附在系统提示后
+    - 当前进行中的一轮始终完整保留
+    """
+
+    def __init__(self, system_message: str, max_tokens: int = CONTEXT_MAX_TOKENS,
+                 summary_max_tokens: int = SUMMARY_MAX_TOKENS) -> None:
+        self.system_message = system_message
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        # 每轮对话一个列表，以用户消息开头
+        self.turns: List[List[Dict]] = []
+        self.summary: List[str] = []
+        self.evicted_turns = 0
+
+    def begin_turn(self, user_input: str) -> None:
+        self.turns.append([{"role": "user", "content": user_input}])
+
+    def add(self, message: Dict) -> None:
+        """追加当前一轮的消息，过长的工具结果会被截断"""
+        if message["role"] in ("tool", "system") and len(message.get("content") or "") > TOOL_RESULT_MAX_CHARS:
+            content = message["content"]
+            message = {**message, "content": f"{content[:TOOL_RESULT_MAX_CHARS]}…（已截断，共 {len(content)} 字符）"}
+        self.turns[-1].append(message)
+
+    def end_turn(self) -> None:
+        """当前一轮结束：中间的工具调用和结果折叠成一条记录，只保留用户问题和助手的最终回复"""
+        turn = self.turns[-1]
+        last = turn[-1]
+        # 工具调用轮数超限时一轮可能没有最终回复，工具消息也一并折叠
+        final = last if last["role"] == "assistant" and not last.get("tool_calls") and len(turn) > 1 else None
+        middle = turn[1:-1] if final else turn[1:]
+        if not middle:
+            return
+        compacted = [turn[0]]
+        record = compact_tool_records(middle)
+        if record:
+            compacted.append({"role": "system", "content": f"工具调用记录：{record}"})
+        if final:
+            compacted.append(final)
+        self.turns[-1] = compacted
+
+    def _system(self) -> Dict:
+        content = self.system_message
+        if self.summary:
+            content += "\n\n此前对话摘要（较早的对话已省略）：\n" + "\n".join(self.summary)
+        return {"role": "system", "content": content}
+
+    def _summarize(self, turn: List[Dict]) -> str:
+        question = truncate(turn[0]["content"], SUMMARY_TEXT_MAX_CHARS)
+        answer = turn[-1].get("content") if turn[-1]["role"] == "assistant" else None
+        line = f"- 用户：{question}"
+        if answer:
+            line += f" → 助手：{truncate(answer, SUMMARY_TEXT_MAX_CHARS)}"
+        return line
+
+    def _evict(self) -> None:
+        """把最早的对话移入摘要，直到总 token 数不超过上限（至少保留当前一轮）"""
+        turn_tokens = [sum(message_tokens(m) for m in turn) for turn in self.turns]
+        total = message_tokens(self._system()) + sum(turn_tokens)
+        while total > self.max_tokens and len(self.turns) > 1:
+            line = self._summarize(self.turns.pop(0))
+            total -= turn_tokens.pop(0)
+            self.summary.append(line)
+            total += count_tokens(line) + 1
+            self.evicted_turns += 1
+            while len(self.summary) > 1 and count_tokens("\n".join(self.summary)) > self.summary_max_tokens:
+                total -= count_tokens(self.summary.pop(0)) + 1
+
+    def build(self) -> List[Dict]:
+        """本次请求要发送的消息列表"""
+        self._evict()
+        return [self._system()] + [message for turn in self.turns for message in turn]
+
+    def tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.build())
+
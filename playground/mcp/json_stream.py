@@ -0,0 +1,178 @@
+import json
+from typing import Any, AsyncIterable, Callable, Iterable, List, Optional, Tuple
+
+
+OPENERS = {"object": "{", "array": "["}
+CLOSERS = {"{": "}", "[": "]"}
+FENCE = "```json"
+# 单个提取器最多尝试解析的候选数，避免异常输出中大量嵌套的括号片段被逐一解析
+MAX_PARSE_ATTEMPTS = 64
+
+
+class JsonStreamExtractor:
+    """从流式输出中增量提取第一个完整的JSON对象或数组
+
+    每收到一段文本调用 feed()，找到括号配平且能解析的JSON后 done 为 True，调用方即可停止读取。
+    字符串内的括号和转义会被正确跳过；Markdown 代码块标记、前面的说明文字和后面多余的内容都会被忽略。
+    整段文本只扫描一遍：候选失败时（括号不匹配、无法解析或不符合 accept）改为尝试它内部
+    已闭合的片段，再从失败的位置继续向后扫描，不会回退重扫。
+
+    - expect："object" / "array" 只接受对应类型，None 两者都接受
+    - leading：JSON 必须出现在开头（允许空白和 ```json 标记），否则 failed 为 True，
+      适用于"要么是纯JSON、要么是自然语言"的响应，遇到自然语言时不再尝试解析
+    - accept：对解析结果的额外检查（如"由对象组成的数组"），不通过的候选会被跳过
+    """
+
+    def __init__(self, expect: Optional[str] = None, leading: bool = False,
+                 accept: Optional[Callable[[Any], bool]] = None):
+        if expect is not None and expect not in OPENERS:
+            raise ValueError(f"不支持的JSON类型: {expect}，请使用 object 或 array")
+        self.openers = OPENERS[expect] if expect else "{["
+        self.leading = leading
+        self.accept = accept
+        self.text = ""
+        self.value: Any = None
+        self.done = False
+        self.failed = False
+        self.end = -1
+        self._pos = 0
+        self._attempts = 0
+        self._reset()
+
+    def _reset(self):
+        # 当前候选中尚未闭合的括号 [(括号, 位置)]，第一个是候选的起点
+        self._stack: List[Tuple[str, int]] = []
+        # 当前候选内部已闭合、类型符合 expect 的片段 [(起点, 终点)]，候选失败时按起点顺序尝试
+        self._spans: List[Tuple[int, int]] = []
+        self._in_string = False
+        self._escape = False
+
+    def _try(self, start: int, end: int) -> bool:
+        """解析 text[start:end]，成功且通过 accept 时记录结果"""
+        if self._attempts >= MAX_PARSE_ATTEMPTS:
+            return False
+        self._attempts += 1
+        try:
+            value = json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            return False
+        if self.accept is not None and not self.accept(value):
+            return False
+        self.value = value
+        self.done = True
+        self.end = end
+        return True
+
+    def _fail_candidate(self):
+        """当前候选不是需要的JSON：尝试它内部已闭合的片段，然后从当前位置继续扫描"""
+        if self.leading:
+            self.failed = True
+            return
+        spans = sorted(self._spans)
+        self._reset()
+        for start, end in spans:
+            if self._try(start, end):
+                return
+
+    def feed(self, chunk: str) -> bool:
+        """追加一段文本，返回是否已经得到完整的JSON"""
+        self.text += chunk
+        if not self.done and not self.failed:
+            self._scan()
+        return self.done
+
+    def _scan(self):
+        text = self.text
+        while self._pos < len(text) and not self.done and not self.failed:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+
+            if not self._stack:
+                if c in self.openers:
+                    self._stack.append((c, i))
+                elif (self.leading and not c.isspace()
+                      and not FENCE.startswith(text[:i + 1].strip().lower())):
+                    self.failed = True
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._stack.append((c, i))
+            elif c in "}]":
+                opener, start = self._stack.pop()
+                if CLOSERS[opener] != c:
+                    # 括号不匹配：包含它的所有候选都不可能是合法JSON
+                    self._fail_candidate()
+                elif not self._stack:
+                    if not self._try(start, i + 1):
+                        self._fail_candidate()
+                elif opener in self.openers:
+                    self._spans.append((start, i + 1))
+
+    def finish(self) -> bool:
+        """输入结束：未闭合的候选（如说明文字中的单个括号）放弃，改为尝试它内部已闭合的片段"""
+        if not self.done and not self.failed and self._stack:
+            self._fail_candidate()
+        return self.done
+
+    @property
+    def trailing(self) -> str:
+        """JSON 之后多余的文本"""
+        return self.text[self.end:] if self.done else ""
+
+
+def is_object_list(value: Any) -> bool:
+    """非空、且每一项都是对象的数组（批量评测结果的结构）"""
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def extract_json(text: str, expect: Optional[str] = None, leading: bool = False,
+                 accept: Optional[Callable[[Any], bool]] = None) -> Any:
+    """从完整文本中提取第一个JSON，找不到时抛出 json.JSONDecodeError"""
+    extractor = JsonStreamExtractor(expect, leading, accept)
+    extractor.feed(text)
+    if not extractor.finish():
+        raise json.JSONDecodeError("未找到完整的JSON", text, 0)
+    return extractor.value
+
+
+def consume_stream(chunks: Iterable[str], expect: Optional[str] = None, leading: bool = False,
+                   accept: Optional[Callable[[Any], bool]] = None) -> JsonStreamExtractor:
+    """读取文本流直到得到完整的JSON（之后的内容不再读取），返回提取器
+
+    chunks 有 close() 时提前结束会调用它，以便尽快断开连接、停止生成。
+    """
+    extractor = JsonStreamExtractor(expect, leading, accept)
+    try:
+        for chunk in chunks:
+            if chunk and extractor.feed(chunk):
+                break
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    extractor.finish()
+    return extractor
+
+
+async def consume_stream_async(chunks: AsyncIterable[str], expect: Optional[str] = None, leading: bool = False,
+                               accept: Optional[Callable[[Any], bool]] = None) -> JsonStreamExtractor:
+    """consume_stream 的异步版本"""
+    extractor = JsonStreamExtractor(expect, leading, accept)
+    try:
+        async for chunk in chunks:
+            if chunk and extractor.feed(chunk):
+                break
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+    extractor.finish()
+    return extractor
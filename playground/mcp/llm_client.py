@@ -1,9 +1,42 @@
 import json
-from typing import List, Dict
+import importlib.util
+from typing import Callable, List, Dict, Optional
 import asyncio
 
+import openai
 from fastmcp import Client
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from json_stream import JsonStreamExtractor, consume_stream
+
+# 所有 LLMClient 共用一个连接池：保持长连接，安装了 h2 时使用 HTTP/2
+_http_client: Optional[openai.DefaultAsyncHttpxClient] = None
+
+
+def get_http_client() -> openai.DefaultAsyncHttpxClient:
+    """共享的异步 HTTP 连接池（第一次使用时创建）
+
+    通过 openai SDK 创建，使用 SDK 自身依赖的 HTTP 库，不额外引入依赖。
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        # Limits 类型取自 SDK 的默认连接限制，兼容 SDK 使用的不同 HTTP 库
+        limits_type = type(openai.DEFAULT_CONNECTION_LIMITS)
+        _http_client = openai.DefaultAsyncHttpxClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=limits_type(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            timeout=openai.Timeout(120, connect=10)
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """程序退出前关闭共享连接池"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 class LLMClient:
 
@@ -13,12 +46,87 @@ class LLMClient:
         self.model_name: str = model_name
         self.url: str = url
         self.client = OpenAI(api_key=api_key, base_url=url)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=url, http_client=get_http_client())
 
     def get_response(self, messages: list[dict[str, str]]) -> str:
-        """发送消息给LLM并获取响应"""
-        response = self.client.chat.completions.create(
+        """发送消息给LLM并获取响应
+
+        流式读取：响应以工具调用JSON开头时，JSON完整后立即断开，不再等待模型输出后面的内容；
+        普通的自然语言回复照常读取完整。
+        """
+        with self.client.chat.completions.create(
             model=self.model_name,
             messages=messages,
-            stream=False
+            stream=True
+        ) as stream:
+            extractor = consume_stream(
+                (chunk.choices[0].delta.content for chunk in stream if chunk.choices),
+                expect="object", leading=True
+            )
+        return extractor.text
+
+    async def get_response_async(self, messages: list[dict[str, str]],
+                                 on_token: Optional[Callable[[str], None]] = None) -> str:
+        """异步流式获取响应，不阻塞事件循环（MCP 连接的心跳照常进行）
+
+        自然语言回复逐段交给 on_token（用于边生成边输出）；响应以工具调用JSON开头时不输出，
+        JSON完整后立即断开。开头是否为JSON在收到第一个非空白字符时就能确定。
+        """
+        extractor = JsonStreamExtractor(expect="object", leading=True)
+        emitted = 0
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stream=True
+        )
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if extractor.feed(chunk.choices[0].delta.content):
+                    break
+                if extractor.failed and on_token is not None:
+                    on_token(extractor.text[emitted:])
+                    emitted = len(extractor.text)
+        extractor.finish()
+        if extractor.failed and on_token is not None and emitted < len(extractor.text):
+            on_token(extractor.text[emitted:])
+        return extractor.text
+
+    async def get_tool_response_async(self, messages: list[dict], tools: List[dict],
+                                      on_token: Optional[Callable[[str], None]] = None) -> dict:
+        """原生函数调用：流式获取响应，返回 assistant 消息（可直接追加到 messages）
+
+        文本内容逐段交给 on_token；分片返回的 tool_calls 按 index 拼接完整后放在消息的 tool_calls 中。
+        """
+        content = []
+        tool_calls: Dict[int, dict] = {}
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            tools=tools,
+            stream=True
         )
-        return response.choices[0].message.content
\ No newline at end of file
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    if on_token is not None:
+                        on_token(delta.content)
+                for part in delta.tool_calls or []:
+                    call = tool_calls.setdefault(part.index, {
+                        "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+                    })
+                    if part.id:
+                        call["id"] = part.id
+                    if part.function is not None:
+                        call["function"]["name"] += part.function.name or ""
+                        call["function"]["arguments"] += part.function.arguments or ""
+
+        message = {"role": "assistant", "content": "".join(content) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        return message
@@ -1,28 +1,43 @@
-import json
+import os
+import sys
 from typing import List, Dict
 import asyncio
-from llm_client import LLMClient
-from mcp_client import UserClient
+from llm_client import LLMClient, close_http_client
+from mcp_client import ToolCatalog, UserClient
 # from math_client import MathClient
 from fastmcp import Client
 from openai import OpenAI
 
+# 原生函数调用模式的系统提示：工具定义通过 API 的 tools 参数传递，无需在提示中列出
+NATIVE_SYSTEM_MESSAGE = '''
+                你是一个智能助手。需要计算时调用提供的工具，不要自行心算；
+                多个互不依赖的计算请在同一轮中同时发起工具调用；
+                对一组数字求和、逐项相乘等批量计算，使用批量工具一次完成，不要逐个调用标量工具。
+                收到工具结果后，用简洁、自然的语言回答用户，数值保持原始精度。
+                '''
+
+
 async def main():
-    async with Client("http://127.0.0.1:8001/sse") as mcp_client:
+    # python main.py --native-tools 使用模型原生的函数调用（一轮可并发执行多个工具）
+    native_tools = "--native-tools" in sys.argv
+
+    # 工具目录缓存，同时接收服务端的工具列表变更通知
+    catalog = ToolCatalog()
+    async with Client("http://127.0.0.1:8001/sse", message_handler=catalog) as mcp_client:
         # 初始化LLM客户端，使用deepseek
         llm_client = LLMClient(model_name='deepseek-chat', api_key=os.getenv("DP_API_KEY"),
                                url='https://api.deepseek.com')
 
-        # 获取可用工具列表并格式化为系统提示的一部分
-        tools = await mcp_client.list_tools()
-        dict_list = [tool.__dict__ for tool in tools]
-        tools_description = json.dumps(dict_list, ensure_ascii=False)
+        # 获取可用工具列表并格式化为系统提示的一部分（签名、简介和参数说明，不包含完整的 JSON Schema）
+        await catalog.get_tools(mcp_client)
+        tools_description = catalog.describe()
 
         # 系统提示，指导LLM如何使用工具和返回响应
         system_message = f'''
                 你是一个智能助手，严格遵循以下协议返回响应：
 
-                可用工具：{tools_description}
+                可用工具：
+{tools_description}
 
                 响应规则：
                 1、当需要计算时，返回严格符合以下格式的纯净JSON：
@@ -40,7 +55,7 @@ async def main():
 
                 校验流程：
                 ✓ 参数数量与工具定义一致
-                ✓ 数值类型为number
+                ✓ 数值类型为number（批量工具的数组参数为number列表）
                 ✓ JSON格式有效性检查
 
                 正确示例：
@@ -52,16 +67,30 @@ async def main():
                 错误响应：总价500元 → 含自然语言
                 错误响应：```json{{...}}``` → 含Markdown
 
-                3、在收到工具的响应后：
+                3、对一组数字的批量计算（求和、平均、逐项运算、单价×数量合计等），
+                   使用 elementwise / vector_sum / vector_mean / dot / evaluate_expression 一次完成
+
+                4、在收到工具的响应后：
                  - 将原始数据转化为自然、对话式的回应
                  - 保持回复简洁但信息丰富
                  - 聚焦于最相关的信息
                  - 使用用户问题中的适当上下文
                  - 避免简单重复使用原始数据
                 '''
+        if native_tools:
+            system_message = NATIVE_SYSTEM_MESSAGE
+
         # 启动聊天会话
-        chat_session = UserClient(llm_client=llm_client, mcp_client=mcp_client)
-        await chat_session.start(system_message=system_message)
+        chat_session = UserClient(llm_client=llm_client, mcp_client=mcp_client, catalog=catalog,
+                                  native_tools=native_tools)
+        try:
+            await chat_session.start(system_message=system_message)
+        finally:
+            await close_http_client()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # 会话已在 UserClient.start 中输出退出信息，这里只避免打印堆栈
+        pass
\ No newline at end of file
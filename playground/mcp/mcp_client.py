@@ -1,76 +1,380 @@
 import json
-from typing import List, Dict
+import logging
+import threading
+import time
+from typing import List, Dict, Optional
 import asyncio
 from llm_client import LLMClient
+from json_stream import extract_json
+from conversation import ConversationContext
 from fastmcp import Client
+from fastmcp.client.messages import MessageHandler
 from openai import OpenAI
 
+# 工具目录缓存有效期（秒），服务端发送 tools/list_changed 通知时立即失效
+TOOL_CATALOG_TTL = 300
+
+# 原生函数调用模式下，一次用户提问最多进行的工具调用轮数
+MAX_TOOL_ROUNDS = 8
+
+JSON_TYPES = {
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+    "null": type(None),
+}
+
+
+def tool_schema(tool) -> dict:
+    """工具的参数 JSON Schema（兼容 MCP SDK 的新旧字段名）"""
+    return getattr(tool, "input_schema", None) or tool.inputSchema or {}
+
+
+def schema_type(schema: dict) -> str:
+    """参数类型的简写，如 number、number[]、string|null"""
+    if "anyOf" in schema:
+        return "|".join(schema_type(option) for option in schema["anyOf"])
+    if "enum" in schema:
+        return "|".join(json.dumps(value, ensure_ascii=False) for value in schema["enum"])
+    types = schema.get("type", "any")
+    if isinstance(types, list):
+        return "|".join(types)
+    if types == "array":
+        return f"{schema_type(schema.get('items', {}))}[]"
+    if types == "object" and schema.get("properties"):
+        fields = ", ".join(f"{name}: {schema_type(prop)}" for name, prop in schema["properties"].items())
+        return f"{{{fields}}}"
+    if types == "object" and isinstance(schema.get("additionalProperties"), dict):
+        return f"{{string: {schema_type(schema['additionalProperties'])}}}"
+    return types
+
+
+def parameter_notes(description: str) -> List[str]:
+    """工具描述中"参数:"一节的逐项说明（缩进的续行合并到上一项）
+
+    可选值、表达式语法等调用所必需的信息都写在这里，精简工具目录时需要保留。
+    """
+    notes: List[str] = []
+    in_params = False
+    for line in description.splitlines()[1:]:
+        stripped = line.strip()
+        if stripped in ("参数:", "参数：", "Args:"):
+            in_params = True
+        elif not in_params:
+            continue
+        elif not stripped:
+            if notes:
+                break
+        elif line[:1].isspace() and notes:
+            notes[-1] += stripped
+        else:
+            notes.append(stripped)
+    return notes
+
+
+def schema_errors(value, schema: dict, path: str = "arguments") -> List[str]:
+    """按 JSON Schema 的常用子集（type / anyOf / enum / properties / required / items）检查参数"""
+    if "anyOf" in schema:
+        if any(not schema_errors(value, option, path) for option in schema["anyOf"]):
+            return []
+        return [f"{path} does not match any allowed type"]
+
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        # bool 是 int 的子类，number / integer 不接受 true / false
+        matched = any(
+            isinstance(value, JSON_TYPES[t]) and not (t in ("number", "integer") and isinstance(value, bool))
+            for t in types if t in JSON_TYPES
+        )
+        if not matched:
+            return [f"{path} should be {' or '.join(types)}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} should be one of {schema['enum']}"]
+
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}.{name} is required")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(schema_errors(item, properties[name], f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{name} is not allowed")
+    elif isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for i, item in enumerate(value):
+            errors.extend(schema_errors(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+async def ainput(prompt: str) -> str:
+    """在后台线程中读取输入，等待用户输入时事件循环（MCP 连接）照常运行
+
+    使用守护线程而不是线程池，Ctrl+C 退出时不会因为 input() 仍在等待而卡住。
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def read():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(deliver, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(deliver, future.set_result, line)
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+
+class ToolCatalog(MessageHandler):
+    """MCP 工具目录缓存：工具名 → 工具定义
+
+    第一次使用时从服务端拉取，之后直接查本地字典；超过 ttl 或收到服务端的
+    tools/list_changed 通知后，下次使用时重新拉取。创建 Client 时作为 message_handler 传入即可接收通知。
+    """
+
+    def __init__(self, ttl: float = TOOL_CATALOG_TTL) -> None:
+        super().__init__()
+        self.ttl = ttl
+        self.tools: Dict[str, object] = {}
+        # 原生函数调用使用的 tools 参数（OpenAI 格式），随目录一起刷新
+        self.function_tools: List[dict] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def on_tool_list_changed(self, message) -> None:
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    @property
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    async def get_tools(self, mcp_client: Client) -> Dict[str, object]:
+        """返回缓存的工具目录，过期时重新拉取（并发调用只拉取一次）"""
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    tools = await mcp_client.list_tools()
+                    self.tools = {tool.name: tool for tool in tools}
+                    self.function_tools = [
+                        {
+                            "type": "function",
+                            "function": {
+                                "name": tool.name,
+                                "description": tool.description or "",
+                                "parameters": tool_schema(tool)
+                            }
+                        }
+                        for tool in tools
+                    ]
+                    self._loaded_at = time.monotonic()
+        return self.tools
+
+    def describe(self) -> str:
+        """紧凑的工具目录（用于系统提示）：每个工具一行签名和描述的第一行，
+        下面缩进列出各参数的说明（可选值、格式等），省略返回值、异常等其余描述"""
+        lines = []
+        for tool in self.tools.values():
+            schema = tool_schema(tool)
+            properties = schema.get("properties", {})
+            required = set(schema.get("required", []))
+            params = ", ".join(
+                f"{name}{'' if name in required else '?'}: {schema_type(prop)}"
+                for name, prop in properties.items()
+            )
+            description = (tool.description or "").strip()
+            summary = description.splitlines()[0].strip() if description else ""
+            lines.append(f"- {tool.name}({params})" + (f"：{summary}" if summary else ""))
+
+            notes = parameter_notes(description)
+            # 文档中没有说明、但 schema 带 description 的参数
+            documented = {note.split(":", 1)[0].strip() for note in notes}
+            notes += [f"{name}: {prop['description']}" for name, prop in properties.items()
+                      if prop.get("description") and name not in documented]
+            lines.extend(f"    {note}" for note in notes)
+        return "\n".join(lines)
+
+    def validate(self, name: str, arguments) -> Optional[str]:
+        """检查工具是否存在、参数是否符合 inputSchema，返回错误信息（通过时返回 None）"""
+        tool = self.tools.get(name)
+        if tool is None:
+            return f"No server found with tool: {name}"
+        if not isinstance(arguments, dict):
+            return f"Invalid arguments for tool {name}: arguments should be an object"
+        errors = schema_errors(arguments, tool_schema(tool))
+        if errors:
+            return f"Invalid arguments for tool {name}: {'; '.join(errors)}"
+        return None
+
+
+def tool_result_text(result) -> str:
+    """工具执行结果中的文本内容"""
+    texts = [item.text for item in getattr(result, "content", None) or [] if hasattr(item, "text")]
+    return "\n".join(texts) if texts else str(result)
+
+
 class UserClient:
     """聊天会话，处理用户输入和LLM响应，并与MCP工具交互"""
 
-    def __init__(self, llm_client: LLMClient, mcp_client: Client, ) -> None:
+    def __init__(self, llm_client: LLMClient, mcp_client: Client, catalog: Optional[ToolCatalog] = None,
+                 native_tools: bool = False) -> None:
         self.mcp_client: Client = mcp_client
         self.llm_client: LLMClient = llm_client
+        # 未传入时只按 TTL 刷新（收不到 list_changed 通知）
+        self.catalog: ToolCatalog = catalog or ToolCatalog()
+        # True：使用模型原生的 tools / tool_calls，一轮返回的多个工具调用并发执行
+        # False：模型按系统提示返回 {"tool": ..., "arguments": ...}，每轮一个工具
+        self.native_tools: bool = native_tools
+        self.context: Optional[ConversationContext] = None
 
     async def process_llm_response(self, llm_response: str) -> str:
         """处理LLM响应，解析工具调用并执行"""
         try:
-            # 尝试移除可能的markdown格式
-            if llm_response.startswith('```json'):
-                llm_response = llm_response.strip('```json').strip('```').strip()
-            tool_call = json.loads(llm_response)
+            # 工具调用JSON必须位于开头（允许```json代码块标记），之后多余的内容忽略
+            tool_call = extract_json(llm_response, expect="object", leading=True)
             if"tool"in tool_call and"arguments"in tool_call:
-                # 检查工具是否可用
-                tools = await self.mcp_client.list_tools()
-                if any(tool.name == tool_call["tool"] for tool in tools):
-                    try:
-                        # 执行工具调用
-                        result = await self.mcp_client.call_tool(
-                            tool_call["tool"], tool_call["arguments"]
-                        )
-
-                        return f"Tool execution result: {result}"
-                    except Exception as e:
-                        error_msg = f"Error executing tool: {str(e)}"
-                        logging.error(error_msg)
-                        return error_msg
-                return f"No server found with tool: {tool_call['tool']}"
+                # 检查工具是否可用、参数是否合法（查本地缓存，不请求服务端）
+                await self.catalog.get_tools(self.mcp_client)
+                error_msg = self.catalog.validate(tool_call["tool"], tool_call["arguments"])
+                if error_msg is not None:
+                    return error_msg
+                try:
+                    # 执行工具调用
+                    result = await self.mcp_client.call_tool(
+                        tool_call["tool"], tool_call["arguments"]
+                    )
+
+                    return f"Tool execution result: {tool_result_text(result)}"
+                except Exception as e:
+                    error_msg = f"Error executing tool: {str(e)}"
+                    logging.error(error_msg)
+                    return error_msg
             return llm_response
         except json.JSONDecodeError:
             # 如果不是JSON格式，直接返回原始响应
             return llm_response
 
+    async def get_llm_response(self, messages) -> str:
+        """流式获取LLM响应，自然语言回复边生成边输出"""
+        print("助手: ", end="", flush=True)
+        streamed = False
+
+        def on_token(token: str) -> None:
+            nonlocal streamed
+            streamed = True
+            print(token, end="", flush=True)
+
+        llm_response = await self.llm_client.get_response_async(messages, on_token=on_token)
+        if streamed:
+            print()
+        else:
+            # 工具调用JSON不逐字输出，完整后一次打印
+            print(llm_response.strip())
+        return llm_response
+
+    async def execute_tool_call(self, tool_call: dict) -> str:
+        """执行一个原生工具调用，返回作为 tool 消息内容的文本（错误也以文本返回给模型）"""
+        name = tool_call["function"]["name"]
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+        except json.JSONDecodeError as e:
+            return f"Invalid arguments for tool {name}: {e}"
+
+        error_msg = self.catalog.validate(name, arguments)
+        if error_msg is not None:
+            return error_msg
+        try:
+            result = await self.mcp_client.call_tool(name, arguments)
+            return tool_result_text(result)
+        except Exception as e:
+            error_msg = f"Error executing tool: {str(e)}"
+            logging.error(error_msg)
+            return error_msg
+
+    async def run_tool_turns(self, context: ConversationContext) -> None:
+        """原生函数调用模式下处理一次提问：模型返回工具调用时并发执行，直到给出最终回复"""
+        await self.catalog.get_tools(self.mcp_client)
+        for _ in range(MAX_TOOL_ROUNDS):
+            streamed = False
+
+            def on_token(token: str) -> None:
+                nonlocal streamed
+                if not streamed:
+                    print("助手: ", end="", flush=True)
+                    streamed = True
+                print(token, end="", flush=True)
+
+            message = await self.llm_client.get_tool_response_async(
+                context.build(), self.catalog.function_tools, on_token=on_token
+            )
+            context.add(message)
+            if streamed:
+                print()
+            tool_calls = message.get("tool_calls")
+            if not tool_calls:
+                return
+
+            calls = ", ".join(f"{call['function']['name']}({call['function']['arguments']})" for call in tool_calls)
+            print(f"助手: 调用工具 {calls}")
+            # 同一轮的工具调用互不依赖，并发执行
+            results = await asyncio.gather(*(self.execute_tool_call(call) for call in tool_calls))
+            for call, result in zip(tool_calls, results):
+                context.add({"role": "tool", "tool_call_id": call["id"], "content": result})
+
+        logging.warning(f"工具调用超过 {MAX_TOOL_ROUNDS} 轮，停止本次回答")
+        print(f"助手: 工具调用超过 {MAX_TOOL_ROUNDS} 轮仍未得到最终回答，已停止。请简化问题或拆分成几步后重试")
+
     async def start(self, system_message) -> None:
         """启动聊天会话的主循环"""
-        messages = [{"role": "system", "content": system_message}]
+        # 每次请求只发送系统提示、较早对话的摘要和最近几轮对话，请求大小不随会话增长
+        self.context = context = ConversationContext(system_message)
         while True:
             try:
                 # 获取用户输入
-                user_input = input("用户: ").strip().lower()
+                user_input = (await ainput("用户: ")).strip().lower()
                 if user_input in ["quit", "exit", "退出"]:
                     print('AI助手退出')
                     break
-                messages.append({"role": "user", "content": user_input})
+                context.begin_turn(user_input)
+
+                if self.native_tools:
+                    await self.run_tool_turns(context)
+                    context.end_turn()
+                    continue
 
                 # 获取LLM的初始响应
-                llm_response = self.llm_client.get_response(messages)
-                print("助手: ", llm_response)
+                llm_response = await self.get_llm_response(context.build())
 
                 # 处理可能的工具调用
                 result = await self.process_llm_response(llm_response)
 
                 # 如果处理结果与原始响应不同，说明执行了工具调用，需要进一步处理
                 while result != llm_response:
-                    messages.append({"role": "assistant", "content": llm_response})
-                    messages.append({"role": "system", "content": result})
+                    context.add({"role": "assistant", "content": llm_response})
+                    context.add({"role": "system", "content": result})
 
                     # 将工具执行结果发送回LLM获取新响应
-                    llm_response = self.llm_client.get_response(messages)
+                    llm_response = await self.get_llm_response(context.build())
                     result = await self.process_llm_response(llm_response)
-                    print("助手: ", llm_response)
 
-                messages.append({"role": "assistant", "content": llm_response})
+                context.add({"role": "assistant", "content": llm_response})
+                context.end_turn()
 
-            except KeyboardInterrupt:
-                print('AI助手退出')
-                break
\ No newline at end of file
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                # 等待输入时按 Ctrl+C，asyncio.run 会以取消主任务的方式中断
+                print('\nAI助手退出')
+                break
@@ -1,7 +1,55 @@
+import ast
+from typing import Dict, List, Union
+
+import numpy as np
 from fastmcp import FastMCP
 
 mcp = FastMCP(name="MyAssistantServer")
 
+# 批量工具的输入限制：单个数组的最大长度、表达式中数组总元素数、表达式长度和语法节点数
+MAX_ARRAY_SIZE = 100_000
+MAX_TOTAL_ELEMENTS = 1_000_000
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPRESSION_NODES = 200
+
+ELEMENTWISE_OPS = {
+    "add": np.add,
+    "subtract": np.subtract,
+    "multiply": np.multiply,
+    "divide": np.divide,
+    "power": np.power,
+}
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+    ast.Mod: np.mod,
+}
+
+UNARY_OPERATORS = {
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+}
+
+# 表达式中允许调用的函数：函数名 → {参数个数: 实现}
+# min / max 一个参数时求数组的最小 / 最大值，两个参数时逐元素取较小 / 较大值
+EXPRESSION_FUNCTIONS = {
+    "sum": {1: np.sum},
+    "mean": {1: np.mean},
+    "min": {1: np.min, 2: np.minimum},
+    "max": {1: np.max, 2: np.maximum},
+    "abs": {1: np.abs},
+    "sqrt": {1: np.sqrt},
+    "round": {1: np.round, 2: np.round},
+    "dot": {2: np.dot},
+}
+
+# round 第二个参数（保留小数位数）的取值范围
+MAX_ROUND_DECIMALS = 15
+
 
 @mcp.tool()
 def add(a: float, b: float) -> float:
@@ -64,5 +112,181 @@ def divide(a: float, b: float) -> float:
     return a / b
 
 
+def to_array(values: List[float], name: str = "values") -> np.ndarray:
+    """把输入列表转换为 float64 数组，并检查长度和数值"""
+    if len(values) > MAX_ARRAY_SIZE:
+        raise ValueError(f"{name} 长度 {len(values)} 超过上限 {MAX_ARRAY_SIZE}")
+    array = np.asarray(values, dtype=np.float64)
+    if array.ndim != 1:
+        raise ValueError(f"{name} 必须是一维数字列表")
+    if not np.all(np.isfinite(array)):
+        raise ValueError(f"{name} 包含非有限数值")
+    return array
+
+
+def to_result(value) -> Union[float, List[float]]:
+    """把 NumPy 计算结果转换为 JSON 可序列化的结果，结果无效（除零、溢出）时抛出异常"""
+    array = np.asarray(value, dtype=np.float64)
+    if not np.all(np.isfinite(array)):
+        raise ValueError("计算结果包含无穷大或非数值（可能除以零或溢出）")
+    return float(array) if array.ndim == 0 else array.tolist()
+
+
+def eval_node(node: ast.AST, arrays: Dict[str, np.ndarray]):
+    """只允许数字、数组名、四则运算、乘方、取模和 EXPRESSION_FUNCTIONS 中的函数"""
+    if isinstance(node, ast.Expression):
+        return eval_node(node.body, arrays)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        # 统一按浮点数计算，避免整数乘方溢出后静默回绕
+        try:
+            return float(node.value)
+        except OverflowError:
+            raise ValueError(f"数字超出浮点数范围: {str(node.value)[:20]}…")
+    if isinstance(node, ast.Name):
+        if node.id not in arrays:
+            raise ValueError(f"未定义的数组: {node.id}")
+        return arrays[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return BINARY_OPERATORS[type(node.op)](eval_node(node.left, arrays), eval_node(node.right, arrays))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](eval_node(node.operand, arrays))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in EXPRESSION_FUNCTIONS and not node.keywords):
+        return eval_call(node, arrays)
+    raise ValueError(f"表达式中不支持的语法: {ast.dump(node)[:50]}")
+
+
+def eval_call(node: ast.Call, arrays: Dict[str, np.ndarray]):
+    """按参数个数选择函数实现；round 的小数位数必须是整数常量"""
+    name = node.func.id
+    overloads = EXPRESSION_FUNCTIONS[name]
+    if len(node.args) not in overloads:
+        counts = " 或 ".join(str(count) for count in overloads)
+        raise ValueError(f"函数 {name} 需要 {counts} 个参数，实际 {len(node.args)} 个")
+
+    if name == "round" and len(node.args) == 2:
+        decimals = node.args[1]
+        if not (isinstance(decimals, ast.Constant) and type(decimals.value) is int
+                and abs(decimals.value) <= MAX_ROUND_DECIMALS):
+            raise ValueError(f"round 的小数位数必须是 -{MAX_ROUND_DECIMALS} 到 {MAX_ROUND_DECIMALS} 之间的整数")
+        return np.round(eval_node(node.args[0], arrays), decimals.value)
+
+    return overloads[len(node.args)](*(eval_node(arg, arrays) for arg in node.args))
+
+
+@mcp.tool()
+def elementwise(op: str, a: List[float], b: Union[List[float], float]) -> List[float]:
+    """批量逐元素运算（一次调用完成整组计算）
+
+    参数:
+    op: 运算类型，add / subtract / multiply / divide / power
+    a: 数字列表
+    b: 与 a 等长的数字列表，或一个数字（与 a 中每个元素运算）
+
+    返回:
+    逐元素运算结果列表，如 multiply([1, 2], [3, 4]) → [3, 8]
+
+    异常:
+    ValueError: 运算类型不支持、长度不一致或除数为零时
+    """
+    if op not in ELEMENTWISE_OPS:
+        raise ValueError(f"不支持的运算: {op}，请使用 {' / '.join(ELEMENTWISE_OPS)}")
+    left = to_array(a, "a")
+    right = to_array(b, "b") if isinstance(b, list) else to_array([b], "b")[0]
+    if isinstance(b, list) and left.shape != right.shape:
+        raise ValueError(f"a 和 b 长度不一致: {len(left)} != {len(right)}")
+    if op == "divide" and np.any(right == 0):
+        raise ValueError("除数不能为零")
+    with np.errstate(all="ignore"):
+        return to_result(ELEMENTWISE_OPS[op](left, right))
+
+
+@mcp.tool()
+def vector_sum(values: List[float]) -> float:
+    """求和
+
+    参数:
+    values: 数字列表
+
+    返回:
+    所有数字之和
+    """
+    return to_result(np.sum(to_array(values)))
+
+
+@mcp.tool()
+def vector_mean(values: List[float]) -> float:
+    """求平均值
+
+    参数:
+    values: 数字列表（不能为空）
+
+    返回:
+    所有数字的平均值
+    """
+    array = to_array(values)
+    if array.size == 0:
+        raise ValueError("values 不能为空")
+    return to_result(np.mean(array))
+
+
+@mcp.tool()
+def dot(a: List[float], b: List[float]) -> float:
+    """点积（如单价列表与数量列表的总金额）
+
+    参数:
+    a: 数字列表
+    b: 与 a 等长的数字列表
+
+    返回:
+    sum(a[i] * b[i])
+    """
+    left, right = to_array(a, "a"), to_array(b, "b")
+    if left.shape != right.shape:
+        raise ValueError(f"a 和 b 长度不一致: {len(left)} != {len(right)}")
+    with np.errstate(all="ignore"):
+        return to_result(np.dot(left, right))
+
+
+@mcp.tool()
+def evaluate_expression(expression: str, arrays: Dict[str, List[float]]) -> Union[float, List[float]]:
+    """对命名数组计算表达式（逐元素运算，支持聚合函数）
+
+    参数:
+    expression: 表达式，可使用 + - * / ** %、括号、数字、arrays 中的数组名，
+                以及函数 sum / mean / min / max / abs / sqrt / round / dot，
+                min(x, y) / max(x, y) 逐元素比较，round(x, 2) 保留两位小数，
+                如 "sum(price * qty * (1 - discount))"、"round(sum(max(price - 2, 0)), 2)"
+    arrays: 数组名 → 数字列表，参与逐元素运算的数组长度需一致
+
+    返回:
+    结果为单个数字时返回数字，否则返回数字列表
+
+    异常:
+    ValueError: 表达式包含不支持的语法、数组超出大小限制或结果无效（除零、溢出）时
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"表达式长度超过上限 {MAX_EXPRESSION_LENGTH}")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误: {e.msg}")
+    if sum(1 for _ in ast.walk(tree)) > MAX_EXPRESSION_NODES:
+        raise ValueError(f"表达式过于复杂（超过 {MAX_EXPRESSION_NODES} 个语法节点）")
+
+    values = {name: to_array(array, name) for name, array in arrays.items()}
+    if sum(array.size for array in values.values()) > MAX_TOTAL_ELEMENTS:
+        raise ValueError(f"数组总元素数超过上限 {MAX_TOTAL_ELEMENTS}")
+
+    # 除零、溢出等统一在 to_result 中检查
+    try:
+        with np.errstate(all="ignore"):
+            result = eval_node(tree, values)
+    except (TypeError, OverflowError) as e:
+        # NumPy 对不合法参数抛出的类型错误、Python 数值溢出统一转换为 ValueError
+        raise ValueError(f"表达式计算失败: {e}")
+    return to_result(result)
+
+
 if __name__ == "__main__":
     mcp.run(transport='sse', host="127.0.0.1", port=8001)
@@ -0,0 +1,66 @@
+import pytest
+
+import mcp_server
+
+
+def call(tool, *args):
+    """FastMCP 装饰后的工具对象通过 .fn 访问原函数"""
+    return getattr(tool, "fn", tool)(*args)
+
+
+def evaluate(expression, **arrays):
+    return call(mcp_server.evaluate_expression, expression, arrays)
+
+
+def test_round_with_decimals():
+    assert evaluate("round(price, 2)", price=[1.234, 5.678]) == [1.23, 5.68]
+    assert evaluate("round(sum(price), 1)", price=[1.26, 1.0]) == 2.3
+    assert evaluate("round(price)", price=[1.4, 1.6]) == [1.0, 2.0]
+
+
+def test_two_argument_min_max_are_elementwise():
+    assert evaluate("sum(max(price - 2, 0))", price=[1, 3, 5]) == 4.0
+    assert evaluate("min(a, b)", a=[1, 5], b=[3, 2]) == [1.0, 2.0]
+    assert evaluate("max(a)", a=[1, 5, 3]) == 5.0
+
+
+def test_pricing_expression():
+    result = evaluate("sum(price * qty * (1 - discount))",
+                      price=[10, 20], qty=[1, 2], discount=[0.1, 0.5])
+    assert result == pytest.approx(29.0)
+
+
+@pytest.mark.parametrize("expression", [
+    "round(price, 2.5)",
+    "round(price, x)",
+    "round(price, 99)",
+    "sum(price, price)",
+    "dot(price)",
+    "min(price, price, price)",
+    "price.sum()",
+    "__import__('os')",
+    "price / 0",
+    "unknown + 1",
+    "9" * 400,
+    "price * " + "9" * 400,
+])
+def test_invalid_expressions_raise_value_error(expression):
+    with pytest.raises(ValueError):
+        evaluate(expression, price=[1.0, 2.0], x=[1.0, 2.0])
+
+
+def test_size_limits():
+    with pytest.raises(ValueError):
+        call(mcp_server.vector_sum, [1.0] * (mcp_server.MAX_ARRAY_SIZE + 1))
+    with pytest.raises(ValueError):
+        evaluate("a" + " + a" * mcp_server.MAX_EXPRESSION_LENGTH, a=[1.0])
+
+
+def test_vector_tools():
+    assert call(mcp_server.dot, [1, 2, 3], [4, 5, 6]) == 32.0
+    assert call(mcp_server.vector_mean, [1, 2, 3]) == 2.0
+    assert call(mcp_server.elementwise, "multiply", [1, 2], 3) == [3.0, 6.0]
+    with pytest.raises(ValueError):
+        call(mcp_server.elementwise, "divide", [1, 2], [1, 0])
+    with pytest.raises(ValueError):
+        call(mcp_server.elementwise, "add", [1, 2], [1])
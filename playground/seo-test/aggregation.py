@@ -0,0 +1,202 @@
+from typing import Dict, Iterable, List, Optional
+
+
+# (输出字段后缀, 评测字段)
+SCORE_FIELDS = [
+    ("total", "total_score"),
+    ("accuracy", "accuracy_score"),
+    ("ad", "ad_score"),
+    ("quality", "quality_score"),
+    ("ux", "ux_score"),
+]
+
+
+class ScoreSums:
+    """一组评测得分的累加器"""
+
+    def __init__(self, keep_comments: bool = False):
+        self.count = 0
+        self.sums = {name: 0.0 for name, _ in SCORE_FIELDS}
+        self.comments: Optional[List[str]] = [] if keep_comments else None
+
+    def add(self, evaluation: Dict):
+        self.count += 1
+        for name, field in SCORE_FIELDS:
+            self.sums[name] += evaluation.get(field, 0)
+        if self.comments is not None:
+            self.comments.append(evaluation.get("comment", ""))
+
+    def averages(self) -> Dict:
+        """{"avg_total": ..., "avg_accuracy": ..., ...}"""
+        return {
+            f"avg_{name}": (self.sums[name] / self.count) if self.count else 0
+            for name, _ in SCORE_FIELDS
+        }
+
+    def to_dict(self) -> Dict:
+        """序列化计数和总和（不含评价摘录）"""
+        return {"count": self.count, "sums": self.sums}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScoreSums":
+        sums = cls()
+        sums.count = data["count"]
+        sums.sums = dict(data["sums"])
+        return sums
+
+
+class EngineAggregate:
+    """单个搜索引擎的聚合结果"""
+
+    def __init__(self, engine: str, group_names: Iterable[str], keep_records: bool = True):
+        self.engine = engine
+        self.records: Optional[List[Dict]] = [] if keep_records else None
+        self.status_counts: Dict[str, int] = {}
+        # 所有带评测的记录（用于详细结果中的平均分）
+        self.evaluated = ScoreSums()
+        # 成功且已评测的记录（用于综合排名）
+        self.scored = ScoreSums()
+        # 成功、已评测且总分不为 0 的记录（排除评测失败，用于分析总结）
+        self.valid = ScoreSums(keep_comments=True)
+        # 按关键词分类的得分（同 scored 口径）
+        self.groups = {name: ScoreSums() for name in group_names}
+
+    def to_dict(self) -> Dict:
+        """序列化统计量（不含记录和评价摘录），用于增量报告的状态文件"""
+        return {
+            "status_counts": self.status_counts,
+            "evaluated": self.evaluated.to_dict(),
+            "scored": self.scored.to_dict(),
+            "valid": self.valid.to_dict(),
+            "groups": {name: sums.to_dict() for name, sums in self.groups.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, engine: str, data: Dict) -> "EngineAggregate":
+        agg = cls(engine, data["groups"].keys(), keep_records=False)
+        agg.status_counts = dict(data["status_counts"])
+        agg.evaluated = ScoreSums.from_dict(data["evaluated"])
+        agg.scored = ScoreSums.from_dict(data["scored"])
+        agg.valid = ScoreSums.from_dict(data["valid"])
+        agg.groups = {name: ScoreSums.from_dict(sums) for name, sums in data["groups"].items()}
+        return agg
+
+
+class Aggregates:
+    """一次遍历得到的全部统计结果"""
+
+    def __init__(self, group_names: Iterable[str]):
+        self.group_names = list(group_names)
+        self.total = 0
+        self.status_counts: Dict[str, int] = {}
+        self.evaluated = 0
+        self.engines: Dict[str, EngineAggregate] = {}
+
+    @classmethod
+    def from_engines(cls, engines: List[EngineAggregate], group_names: Iterable[str]) -> "Aggregates":
+        """由各搜索引擎的聚合结果合并出总体结果"""
+        result = cls(group_names)
+        for agg in engines:
+            result.engines[agg.engine] = agg
+            for status, count in agg.status_counts.items():
+                result.status_counts[status] = result.status_counts.get(status, 0) + count
+                result.total += count
+            result.evaluated += agg.evaluated.count
+        return result
+
+    def statistics(self) -> Dict:
+        """总体统计（ReportGenerator 的 statistics 字段）"""
+        successful = self.status_counts.get("success", 0)
+        return {
+            "total_tests": self.total,
+            "successful_tests": successful,
+            "failed_tests": self.status_counts.get("failed", 0),
+            "captcha_tests": self.status_counts.get("captcha", 0),
+            "evaluated_tests": self.evaluated,
+            "success_rate": (successful / self.total * 100) if self.total > 0 else 0
+        }
+
+    def rankings(self) -> List[Dict]:
+        """按综合得分排序的搜索引擎排名（成功且已评测的记录）"""
+        rankings = [
+            {"engine": engine, **agg.scored.averages(), "count": agg.scored.count}
+            for engine, agg in self.engines.items()
+            if agg.scored.count
+        ]
+        rankings.sort(key=lambda x: x["avg_total"], reverse=True)
+        return rankings
+
+    def valid_summaries(self) -> List[Dict]:
+        """排除评测失败后的搜索引擎汇总（含评价摘录），按综合得分排序"""
+        summaries = [
+            {
+                "engine": engine,
+                "count": agg.valid.count,
+                **agg.valid.averages(),
+                "comments": agg.valid.comments
+            }
+            for engine, agg in self.engines.items()
+            if agg.valid.count
+        ]
+        summaries.sort(key=lambda x: x["avg_total"], reverse=True)
+        return summaries
+
+    def group_rankings(self) -> Dict[str, List[Dict]]:
+        """按关键词分类的搜索引擎得分"""
+        return {
+            group: sorted(
+                (
+                    {"engine": engine, **agg.groups[group].averages(), "count": agg.groups[group].count}
+                    for engine, agg in self.engines.items()
+                    if agg.groups[group].count
+                ),
+                key=lambda x: x["avg_total"],
+                reverse=True
+            )
+            for group in self.group_names
+        }
+
+    def by_engine(self) -> List[Dict]:
+        """按搜索引擎组织的原始记录（需要 keep_records）"""
+        return [{"engine": engine, "results": agg.records} for engine, agg in self.engines.items()]
+
+
+def aggregate(records: Iterable[Dict], keyword_groups: Optional[Dict[str, List[str]]] = None,
+              keep_records: bool = True) -> Aggregates:
+    """单次遍历记录，计算按状态、搜索引擎和关键词分类的全部统计"""
+    keyword_groups = keyword_groups or {}
+    group_of = {kw: group for group, keywords in keyword_groups.items() for kw in keywords}
+    result = Aggregates(keyword_groups.keys())
+
+    for record in records:
+        engine = record["engine"]
+        status = record["status"]
+        evaluation = record.get("evaluation")
+
+        agg = result.engines.get(engine)
+        if agg is None:
+            agg = result.engines[engine] = EngineAggregate(engine, result.group_names, keep_records)
+        if agg.records is not None:
+            agg.records.append(record)
+
+        result.total += 1
+        result.status_counts[status] = result.status_counts.get(status, 0) + 1
+        agg.status_counts[status] = agg.status_counts.get(status, 0) + 1
+
+        if not evaluation:
+            continue
+
+        result.evaluated += 1
+        agg.evaluated.add(evaluation)
+
+        if status != "success":
+            continue
+
+        agg.scored.add(evaluation)
+        group = group_of.get(record["keyword"])
+        if group is not None:
+            agg.groups[group].add(evaluation)
+        if evaluation.get("total_score", 0) != 0:
+            agg.valid.add(evaluation)
+
+    return result
@@ -1,68 +1,16 @@
 import json
 import sys
-from data_manager import DataManager
+from data_manager import create_data_manager
+from aggregation import aggregate
 
 
 def analyze_search_data():
     """分析搜索引擎评测数据并生成总结"""
-    data_manager = DataManager()
+    data_manager = create_data_manager()
     
-    # 按搜索引擎分组统计
-    engine_stats = {}
-    
-    for result in data_manager.data["results"]:
-        if result["status"] != "success" or not result.get("evaluation"):
-            continue
-        
-        engine = result["engine"]
-        eval_data = result["evaluation"]
-        
-        # 跳过评测失败的数据
-        if eval_data.get("total_score", 0) == 0:
-            continue
-        
-        if engine not in engine_stats:
-            engine_stats[engine] = {
-                "count": 0,
-                "accuracy_scores": [],
-                "ad_scores": [],
-                "quality_scores": [],
-                "ux_scores": [],
-                "total_scores": [],
-                "comments": []
-            }
-        
-        stats = engine_stats[engine]
-        stats["count"] += 1
-        stats["accuracy_scores"].append(eval_data.get("accuracy_score", 0))
-        stats["ad_scores"].append(eval_data.get("ad_score", 0))
-        stats["quality_scores"].append(eval_data.get("quality_score", 0))
-        stats["ux_scores"].append(eval_data.get("ux_score", 0))
-        stats["total_scores"].append(eval_data.get("total_score", 0))
-        stats["comments"].append(eval_data.get("comment", ""))
-    
-    # 计算平均分
-    engine_summaries = []
-    for engine, stats in engine_stats.items():
-        if stats["count"] == 0:
-            continue
-        
-        summary = {
-            "engine": engine,
-            "count": stats["count"],
-            "avg_accuracy": sum(stats["accuracy_scores"]) / stats["count"],
-            "avg_ad": sum(stats["ad_scores"]) / stats["count"],
-            "avg_quality": sum(stats["quality_scores"]) / stats["count"],
-            "avg_ux": sum(stats["ux_scores"]) / stats["count"],
-            "avg_total": sum(stats["total_scores"]) / stats["count"],
-            "comments": stats["comments"]
-        }
-        engine_summaries.append(summary)
-    
-    # 按总分排序
-    engine_summaries.sort(key=lambda x: x["avg_total"], reverse=True)
-    
-    return engine_summaries
+    # 按搜索引擎分组统计（跳过评测失败的数据），按总分排序
+    aggregates = aggregate(data_manager.iter_records(), keep_records=False)
+    return aggregates.valid_summaries()
 
 
 def generate_summary_prompt(engine_summaries):
@@ -0,0 +1,143 @@
+import re
+from typing import Dict, Optional, Tuple
+
+from search_config import CAPTCHA_KEYWORDS, ERROR_KEYWORDS, DEFAULT_ENGINE_RULE, ENGINE_RULES
+
+
+def _compile_keywords(keywords):
+    """把关键词列表编译成一个正则，一次扫描即可找到最先出现的关键词"""
+    # 长关键词优先，避免 "验证码" 被更短的前缀抢先匹配
+    ordered = sorted(keywords, key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in ordered), re.IGNORECASE)
+
+
+CAPTCHA_PATTERN = _compile_keywords(CAPTCHA_KEYWORDS)
+ERROR_PATTERN = _compile_keywords(ERROR_KEYWORDS)
+
+# 可见文本最多取这么长，验证码和错误页面的提示都在页面开头
+MAX_TEXT_LENGTH = 5000
+
+# 元素是否真正可见：有非零尺寸、位于页面范围内且未被样式隐藏。
+# 结果页里常嵌有隐藏、零尺寸或移到屏幕外的验证码容器，这些都不算
+VISIBLE_ELEMENT_JS = """
+    const isVisible = (el) => {
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) return false;
+        const doc = document.documentElement;
+        const right = rect.right + window.scrollX;
+        const bottom = rect.bottom + window.scrollY;
+        if (right <= 0 || bottom <= 0) return false;
+        if (rect.left + window.scrollX >= doc.scrollWidth || rect.top + window.scrollY >= doc.scrollHeight) return false;
+        const style = window.getComputedStyle(el);
+        return style.visibility !== "hidden" && style.display !== "none" && parseFloat(style.opacity) > 0;
+    };
+"""
+
+# 在页面内一次性收集检测所需的全部信息（只读可见文本，不含脚本和样式）
+PAGE_PROBE_JS = """
+(rule) => {""" + VISIBLE_ELEMENT_JS + """
+    const body = document.body;
+    const text = body ? body.innerText || "" : "";
+    const find = (selector) => {
+        if (!selector) return [];
+        try {
+            return Array.from(document.querySelectorAll(selector));
+        } catch (e) {
+            return [];
+        }
+    };
+    const exists = (selector) => find(selector).length > 0;
+    const visible = (selector) => find(selector).some(isVisible);
+    return {
+        title: document.title || "",
+        text: text.slice(0, rule.max_text_length),
+        text_length: text.length,
+        has_results: exists(rule.result_selector),
+        has_captcha_element: visible(rule.captcha_selector)
+    };
+}
+"""
+
+
+def get_engine_rule(engine_name: str) -> Dict:
+    """合并默认规则与搜索引擎专属规则"""
+    rule = dict(DEFAULT_ENGINE_RULE)
+    rule.update(ENGINE_RULES.get(engine_name, {}))
+    rule["max_text_length"] = MAX_TEXT_LENGTH
+    return rule
+
+
+def classify_page(probe: Dict, rule: Dict) -> Tuple[str, Optional[str]]:
+    """根据页面探测结果判断状态，返回 (status, error_message)"""
+    title = probe["title"]
+
+    # 有结果容器时认为已加载；没有配置选择器时按正文长度兜底
+    if rule["result_selector"]:
+        has_results = probe["has_results"]
+    else:
+        has_results = probe["text_length"] >= rule["min_text_length"]
+    # 只有结果容器能证明页面是结果页，正文长度兜底时验证码提示和验证码元素优先
+    results_confirmed = has_results and bool(rule["result_selector"])
+
+    # 标题命中一定是验证码；正文命中和验证码元素只在结果容器不存在时才算，
+    # 避免搜索结果里恰好出现 "verify" 之类的词或嵌有验证码容器被误判
+    match = CAPTCHA_PATTERN.search(title)
+    if match is None and not results_confirmed:
+        match = CAPTCHA_PATTERN.search(probe["text"])
+    if match is not None:
+        return "captcha", f"检测到验证码：{match.group(0).lower()}"
+    if probe["has_captcha_element"] and not results_confirmed:
+        return "captcha", "检测到验证码：页面包含验证码元素"
+
+    # 检测错误页面
+    match = ERROR_PATTERN.search(title)
+    if match is not None:
+        return "failed", f"检测到错误页面：{match.group(0).lower()}"
+
+    if not has_results:
+        return "failed", "页面未正常加载，缺少搜索结果元素"
+
+    return "success", None
+
+
+# 页面就绪信号：搜索结果出现返回 "results"，出现验证码或错误页面时立即返回对应状态，
+# 都没有出现时返回 false 继续轮询
+PAGE_READY_JS = """
+(rule) => {""" + VISIBLE_ELEMENT_JS + """
+    const title = (document.title || "").toLowerCase();
+    if (rule.error_keywords.some((k) => title.includes(k))) return "error";
+    if (rule.captcha_keywords.some((k) => title.includes(k))) return "captcha";
+
+    const body = document.body;
+    if (rule.result_selector) {
+        try {
+            if (document.querySelector(rule.result_selector)) return "results";
+        } catch (e) {}
+    }
+
+    // 没有搜索结果容器时，可见的验证码元素说明是验证码页面
+    let captchaElements = [];
+    try {
+        captchaElements = Array.from(document.querySelectorAll(rule.captcha_selector));
+    } catch (e) {}
+    if (captchaElements.some(isVisible)) return "captcha";
+
+    // 正文中的验证码提示：有选择器的引擎等页面完全加载仍没有结果时再看，
+    // 按正文长度兜底的引擎则在判定为结果之前先看
+    const innerText = body ? body.innerText || "" : "";
+    if (!rule.result_selector || document.readyState === "complete") {
+        const text = innerText.slice(0, rule.max_text_length).toLowerCase();
+        if (rule.captcha_keywords.some((k) => text.includes(k))) return "captcha";
+    }
+    if (!rule.result_selector && innerText.length >= rule.min_text_length) return "results";
+    return false;
+}
+"""
+
+
+def get_ready_rule(engine_name: str) -> Dict:
+    """PAGE_READY_JS 使用的规则（附带小写关键词列表）"""
+    rule = get_engine_rule(engine_name)
+    rule["captcha_keywords"] = [k.lower() for k in CAPTCHA_KEYWORDS]
+    rule["error_keywords"] = [k.lower() for k in ERROR_KEYWORDS]
+    return rule
@@ -0,0 +1,441 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from cli import get_int_arg, get_str_arg
+from data_manager import create_data_manager
+from eval_cache import EvalCache, file_sha256, make_cache_key
+from evaluator import (
+    EVAL_PROMPT, MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, error_evaluation, get_cache_model,
+    get_current_provider, get_eval_cache_max_entries, get_provider_name, is_cacheable,
+    is_retryable_error, prepare_images, print_evaluation, print_evaluation_summary
+)
+from image_preprocess import PREPROCESS_STATS
+from json_stream import extract_json, is_object_list
+from providers import get_provider
+from rate_limiter import RateLimiter
+
+
+# 一次请求中打包的截图数
+DEFAULT_BATCH_SIZE = 4
+
+# 离线批处理的状态文件（记录已提交的批次和请求与记录的对应关系）
+BATCH_STATE_FILE = "eval_batch.state.json"
+
+BATCH_PROMPT = EVAL_PROMPT + """
+本次请求会依次给出多张截图，每张截图前标有编号、搜索引擎和关键词。
+请逐张独立评分，只返回一个JSON数组，每个元素是上面格式的对象并额外包含 "index" 字段（截图编号，从 1 开始）：
+[
+  {"index": 1, "accuracy_score": x, "ad_score": x, "quality_score": x, "ux_score": x, "total_score": x, "comment": "..."},
+  ...
+]
+"""
+
+
+def batch_item_text(index, engine, keyword):
+    return f"【第 {index} 张】\n搜索引擎：{engine}\n关键词：{keyword}"
+
+
+def get_batch_cache_key(image_path, keyword, engine):
+    """批量模式的缓存键（提示词与单张评测不同，单独缓存）"""
+    prompt = f"{BATCH_PROMPT}\n\n{batch_item_text(1, engine, keyword)}"
+    return make_cache_key(file_sha256(image_path), prompt, get_provider_name(), get_cache_model())
+
+
+def build_batch_parts(records):
+    """每张截图前加编号说明，作为一次请求的多段内容"""
+    return [
+        (batch_item_text(index, record["engine"], record["keyword"]), prepare_images(record["screenshot_path"]))
+        for index, record in enumerate(records, 1)
+    ]
+
+
+def build_openai_batch_body(records):
+    """OpenAI chat.completions 请求体（离线 Batch API 使用）"""
+    return get_provider("openai").build_request(BATCH_PROMPT, build_batch_parts(records), batch=True)
+
+
+async def call_batch_provider_async(records, executor=None, limiter=None):
+    """调用当前AI提供商批量评测，返回模型原始文本（异常直接抛出）
+
+    指定 limiter 时，按各张截图的尺寸 / 切片数估算的 token 数取得配额，请求完成后按实际用量校正。
+    """
+    provider = get_current_provider()
+    loop = asyncio.get_running_loop()
+    parts = await loop.run_in_executor(executor, build_batch_parts, records)
+
+    reserved = None
+    if limiter is not None:
+        estimate = await loop.run_in_executor(executor, provider.estimate_tokens, BATCH_PROMPT, parts, True)
+        reserved = await limiter.acquire(estimate)
+
+    usage = {}
+    start = time.perf_counter()
+    try:
+        return await provider.evaluate_async(BATCH_PROMPT, parts, batch=True, executor=executor, usage=usage)
+    finally:
+        PREPROCESS_STATS.add_request(provider.name, time.perf_counter() - start)
+        if reserved is not None:
+            limiter.reconcile(reserved, usage.get("total_tokens"))
+
+
+def parse_batch_evaluation(content, count):
+    """解析模型返回的JSON数组，按 index 对应到各条记录；缺失的项返回评测异常，下次重新评测"""
+    try:
+        items = extract_json(content, expect="array", accept=is_object_list)
+    except json.JSONDecodeError:
+        items = None
+    if items is None:
+        print(f"⚠️ 批量结果解析失败，原始内容：{content[:200]}")
+        return [error_evaluation("批量结果解析失败") for _ in range(count)]
+
+    results: List[Optional[Dict]] = [None] * count
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        index = item.pop("index", position + 1)
+        if isinstance(index, int) and 1 <= index <= count and results[index - 1] is None:
+            results[index - 1] = item
+
+    return [
+        result if result is not None else error_evaluation(f"批量结果缺少第 {i} 张")
+        for i, result in enumerate(results, 1)
+    ]
+
+
+async def evaluate_batch_async(records, limiter, executor, cache=None, max_retries=MAX_RETRIES):
+    """批量评测一组记录：缓存命中的直接返回，其余打包成一次请求（限流 + 指数退避重试）"""
+    loop = asyncio.get_running_loop()
+    evaluations: List[Optional[Dict]] = [None] * len(records)
+
+    keys = [None] * len(records)
+    if cache is not None:
+        for i, record in enumerate(records):
+            keys[i] = await loop.run_in_executor(
+                executor, get_batch_cache_key, record["screenshot_path"], record["keyword"], record["engine"]
+            )
+            evaluations[i] = cache.get(keys[i])
+
+    pending = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+    if not pending:
+        return evaluations
+    batch = [records[i] for i in pending]
+
+    for attempt in range(max_retries + 1):
+        try:
+            content = await call_batch_provider_async(batch, executor, limiter)
+            results = parse_batch_evaluation(content, len(batch))
+            break
+        except Exception as e:
+            if attempt < max_retries and is_retryable_error(e):
+                delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY) + random.uniform(0, 1)
+                print(f"⏳ 批量评测（{len(batch)} 张）触发限流或服务端错误，{delay:.1f} 秒后重试（{attempt + 1}/{max_retries}）")
+                await asyncio.sleep(delay)
+                continue
+            print(f"✗ 批量评测失败：{str(e)}")
+            results = [error_evaluation(e) for _ in batch]
+            break
+
+    for i, evaluation in zip(pending, results):
+        evaluations[i] = evaluation
+        if keys[i] is not None and is_cacheable(evaluation):
+            cache.put(keys[i], evaluation)
+    return evaluations
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def select_records(data_manager, evaluate_all=False):
+    """需要评测、且截图文件存在的记录"""
+    records = data_manager.get_successful_tests() if evaluate_all else data_manager.get_unevaluated_tests()
+    existing = []
+    for record in records:
+        if os.path.exists(record["screenshot_path"]):
+            existing.append(record)
+        else:
+            print(f"✗ 文件不存在：{record['screenshot_path']}")
+    return existing
+
+
+def apply_evaluation(data_manager, record, evaluation, counts, total=None):
+    """写回一条评测结果并输出"""
+    data_manager.update_evaluation(record["engine"], record["keyword"], evaluation)
+    counts["done"] += 1
+    progress = f"{counts['done']}/{total}" if total else f"{counts['done']}"
+    print(f"\n进度：{progress}")
+    print(f"🔍 评测：{record['engine']} / {record['keyword']}")
+    if print_evaluation(evaluation):
+        counts["success"] += 1
+    else:
+        counts["failed"] += 1
+
+
+async def run_batch_evaluation(batch_size=DEFAULT_BATCH_SIZE, concurrency=2, use_cache=True, evaluate_all=False):
+    """在线批量评测：每次请求打包 batch_size 张截图，最多 concurrency 个请求同时进行"""
+    concurrency = max(1, concurrency)
+    data_manager = create_data_manager()
+    records = select_records(data_manager, evaluate_all)
+    if not records:
+        print("✓ 没有需要评测的数据")
+        data_manager.print_summary()
+        return
+
+    limiter = RateLimiter.for_provider(get_provider_name())
+    cache = EvalCache(max_entries=get_eval_cache_max_entries()) if use_cache else None
+    batches = chunked(records, max(1, batch_size))
+    print(f"\n🤖 开始批量AI评测，共 {len(records)} 个项目，{len(batches)} 个请求（每个请求 {batch_size} 张）")
+    print(f"⚡ 并发数：{concurrency}，限流：{limiter.rpm} 请求/分钟，{limiter.tpm} tokens/分钟")
+    print("="*50)
+
+    counts = {"done": 0, "success": 0, "failed": 0}
+    queue = asyncio.Queue()
+    for batch in batches:
+        queue.put_nowait(batch)
+
+    async def worker(executor):
+        while True:
+            try:
+                batch = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            evaluations = await evaluate_batch_async(batch, limiter, executor, cache)
+            for record, evaluation in zip(batch, evaluations):
+                apply_evaluation(data_manager, record, evaluation, counts, len(records))
+            # 每个批次完成后保存检查点
+            data_manager.save_data()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*[worker(executor) for _ in range(concurrency)])
+
+    data_manager.save_data(compact=True)
+    print_evaluation_summary(counts, cache)
+    if cache is not None:
+        cache.close()
+    data_manager.print_summary()
+
+
+class OpenAIBatchBackend:
+    """OpenAI 离线 Batch API：上传 JSONL、创建批次、完成后下载结果（通常 24 小时内，费用减半）"""
+
+    name = "openai"
+
+    def submit(self, input_file):
+        client = get_provider("openai").client
+        with open(input_file, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """返回 (状态, 输出 JSONL 文本或 None)"""
+        client = get_provider("openai").client
+        batch = client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            return batch.status, None
+        output = client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+        return batch.status, output
+
+
+class LocalBatchBackend:
+    """本地模拟的批处理后端：不发起网络请求，立即生成与 Batch API 格式相同的结果
+
+    得分由请求内容的哈希确定，仅用于验证提交 / 收集流程，不要用于正式数据。
+    """
+
+    name = "local"
+
+    def __init__(self, root="eval_batches"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def submit(self, input_file):
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        lines = []
+        with open(input_file, "r", encoding="utf-8") as f:
+            for line in f:
+                request = json.loads(line)
+                count = sum(1 for part in request["body"]["messages"][1]["content"]
+                            if part["type"] == "text")
+                seed = file_sha256(input_file) + request["custom_id"]
+                items = []
+                for index in range(1, count + 1):
+                    rng = random.Random(f"{seed}:{index}")
+                    scores = [rng.randint(3, 9) for _ in range(4)]
+                    items.append({
+                        "index": index,
+                        "accuracy_score": scores[0],
+                        "ad_score": scores[1],
+                        "quality_score": scores[2],
+                        "ux_score": scores[3],
+                        "total_score": sum(scores) / 4,
+                        "comment": "本地模拟批处理结果"
+                    })
+                lines.append(json.dumps({
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"content": json.dumps(items, ensure_ascii=False)}}]}
+                    }
+                }, ensure_ascii=False))
+        with open(os.path.join(self.root, f"{batch_id}.output.jsonl"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return batch_id
+
+    def poll(self, batch_id):
+        with open(os.path.join(self.root, f"{batch_id}.output.jsonl"), "r", encoding="utf-8") as f:
+            return "completed", f.read()
+
+
+BATCH_BACKENDS = {"openai": OpenAIBatchBackend, "local": LocalBatchBackend}
+
+
+def _load_batch_state():
+    if not os.path.exists(BATCH_STATE_FILE):
+        return {"batches": []}
+    with open(BATCH_STATE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_batch_state(state):
+    tmp_file = BATCH_STATE_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, BATCH_STATE_FILE)
+
+
+def submit_offline_batch(backend_name="openai", batch_size=DEFAULT_BATCH_SIZE, evaluate_all=False):
+    """把需要评测的记录写成 Batch API 的 JSONL 并提交，批次信息记录在状态文件中"""
+    provider = get_provider_name()
+    if backend_name == "openai" and provider != "openai":
+        print(f"✗ 离线批处理目前只支持 OpenAI（当前提供商：{provider}），可使用 --backend local 验证流程")
+        return
+
+    data_manager = create_data_manager()
+    state = _load_batch_state()
+    # 已提交但尚未收集的记录不再重复提交
+    submitted = {
+        (engine, keyword)
+        for batch in state["batches"]
+        for items in batch["requests"].values()
+        for engine, keyword in items
+    }
+    records = [r for r in select_records(data_manager, evaluate_all)
+               if (r["engine"], r["keyword"]) not in submitted]
+    if not records:
+        print("✓ 没有需要提交的数据")
+        return
+
+    os.makedirs("eval_batches", exist_ok=True)
+    input_file = os.path.join("eval_batches", f"input_{int(time.time())}.jsonl")
+    requests = {}
+    with open(input_file, "w", encoding="utf-8") as f:
+        for i, batch in enumerate(chunked(records, max(1, batch_size))):
+            custom_id = f"req-{i}"
+            requests[custom_id] = [[r["engine"], r["keyword"]] for r in batch]
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": build_openai_batch_body(batch)
+            }, ensure_ascii=False) + "\n")
+
+    backend = BATCH_BACKENDS[backend_name]()
+    batch_id = backend.submit(input_file)
+    state["batches"].append({
+        "id": batch_id,
+        "backend": backend_name,
+        "input_file": input_file,
+        "submitted_at": time.time(),
+        "requests": requests
+    })
+    _save_batch_state(state)
+    print(f"✓ 已提交批次 {batch_id}：{len(records)} 个项目，{len(requests)} 个请求（{backend_name}）")
+
+
+def collect_offline_batches():
+    """查询已提交的批次，完成的批次写回评测结果并从状态文件中移除"""
+    state = _load_batch_state()
+    if not state["batches"]:
+        print("✓ 没有待收集的批次")
+        return
+
+    data_manager = create_data_manager()
+    counts = {"done": 0, "success": 0, "failed": 0}
+    remaining = []
+    for batch in state["batches"]:
+        status, output = BATCH_BACKENDS[batch["backend"]]().poll(batch["id"])
+        if output is None:
+            if status in ("failed", "expired", "cancelled"):
+                print(f"✗ 批次 {batch['id']}：{status}，相关项目下次提交时会重新评测")
+            else:
+                print(f"⏳ 批次 {batch['id']}：{status}")
+                remaining.append(batch)
+            continue
+
+        print(f"✓ 批次 {batch['id']} 已完成")
+        answered = set()
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            items = batch["requests"].get(result["custom_id"])
+            if items is None:
+                continue
+            answered.add(result["custom_id"])
+            response = result.get("response") or {}
+            if response.get("status_code") == 200:
+                content = response["body"]["choices"][0]["message"]["content"]
+                evaluations = parse_batch_evaluation(content, len(items))
+            else:
+                evaluations = [error_evaluation(f"批处理请求失败：{result.get('error')}") for _ in items]
+            for (engine, keyword), evaluation in zip(items, evaluations):
+                record = data_manager.get_test_record(engine, keyword)
+                if record is not None:
+                    apply_evaluation(data_manager, record, evaluation, counts)
+
+        missing = len(batch["requests"]) - len(answered)
+        if missing:
+            print(f"⚠️  批次 {batch['id']} 有 {missing} 个请求没有结果，下次提交时会重新评测")
+
+    state["batches"] = remaining
+    _save_batch_state(state)
+    data_manager.save_data(compact=True)
+    print_evaluation_summary(counts)
+    data_manager.print_summary()
+
+
+async def main():
+    """命令行：
+    python batch_evaluator.py [--batch-size 4] [--concurrency 2]   在线批量评测
+    python batch_evaluator.py --submit [--backend openai|local]    提交离线批处理
+    python batch_evaluator.py --collect                            收集离线批处理结果
+    """
+    batch_size = get_int_arg("--batch-size", DEFAULT_BATCH_SIZE)
+    evaluate_all = "--all" in sys.argv
+    if "--submit" in sys.argv:
+        submit_offline_batch(get_str_arg("--backend", "openai"), batch_size, evaluate_all)
+    elif "--collect" in sys.argv:
+        collect_offline_batches()
+    else:
+        await run_batch_evaluation(
+            batch_size=batch_size,
+            concurrency=get_int_arg("--concurrency", 2),
+            use_cache="--no-cache" not in sys.argv,
+            evaluate_all=evaluate_all
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,17 @@
+import sys
+
+
+def get_str_arg(name, default=None):
+    """读取形如 --name=value 或 --name value 的字符串参数"""
+    for i, arg in enumerate(sys.argv):
+        if arg.startswith(f"{name}="):
+            return arg.split("=", 1)[1]
+        if arg == name and i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
+
+
+def get_int_arg(name, default):
+    """读取形如 --name=N 或 --name N 的整数参数"""
+    value = get_str_arg(name)
+    return int(value) if value is not None else default
@@ -1,15 +1,41 @@
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
+
+
+# 日志条数达到快照记录数（至少 COMPACT_MIN_ENTRIES 条）后，save_data 会把日志折叠回快照文件。
+# 阈值随快照大小增长，每次重写快照的开销由之前追加的日志分摊，每个检查点的平均写入量是常数
+COMPACT_MIN_ENTRIES = 200
+
+
+def needs_evaluation(record: Dict) -> bool:
+    """成功截图且尚未评测（或评测异常）的记录需要评测"""
+    evaluation = record.get("evaluation")
+    return record["status"] == "success" and (
+        not evaluation or str(evaluation.get("comment", "")).startswith("评测异常：")
+    )
 
 
 class DataManager:
-    """管理搜索引擎测试数据的持久化存储"""
+    """管理搜索引擎测试数据的持久化存储
+    
+    存储由两部分组成：
+    - 快照文件（search_data.json）：完整数据，只在压缩时整体重写
+    - 日志文件（search_data.journal.jsonl）：每次更新追加一行 JSON
     
-    def __init__(self, data_file: str = "search_data.json"):
+    加载时先读快照再重放日志，因此中途崩溃最多丢失最后一行未写完的日志。
+    """
+    
+    def __init__(self, data_file: str = "search_data.json", journal_file: Optional[str] = None):
         self.data_file = data_file
+        self.journal_file = journal_file or os.path.splitext(data_file)[0] + ".journal.jsonl"
         self.data = self._load_data()
+        # 按 (engine, keyword) 建立的记录索引：{engine: {keyword: record}}
+        self._index: Dict[str, Dict[str, Dict]] = {}
+        self._build_index()
+        self._journal = None
+        self._journal_entries = self._replay_journal()
     
     def _load_data(self) -> Dict:
         """加载现有数据，如果文件不存在则创建新数据结构"""
@@ -32,33 +58,141 @@ class DataManager:
             "results": []
         }
     
-    def save_data(self):
-        """保存数据到文件"""
+    def _build_index(self):
+        """根据已加载的结果构建 (engine, keyword) 索引"""
+        self._index = {}
+        for record in self.data["results"]:
+            # 与线性查找保持一致：重复记录以第一条为准
+            self._index.setdefault(record["engine"], {}).setdefault(record["keyword"], record)
+    
+    def _replay_journal(self) -> int:
+        """将日志中的更新重放到快照数据上，返回重放的条数"""
+        if not os.path.exists(self.journal_file):
+            return 0
+        
+        count = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能只写了一半，跳过即可
+                    print(f"警告：{self.journal_file} 第 {line_no} 行不完整，已跳过")
+                    continue
+                self._apply_entry(entry)
+                count += 1
+        return count
+    
+    def _apply_entry(self, entry: Dict):
+        """将一条日志记录应用到内存数据"""
+        if entry["op"] == "upsert":
+            self._apply_upsert(entry)
+        elif entry["op"] == "evaluation":
+            self._apply_evaluation(entry)
+    
+    def _append_journal(self, entry: Dict):
+        """追加一条日志记录"""
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a+', encoding='utf-8')
+            # 上次崩溃留下的半行没有换行符，先补上，避免与新记录粘连
+            if self._journal.tell() > 0:
+                self._journal.seek(self._journal.tell() - 1)
+                if self._journal.read(1) != "\n":
+                    self._journal.write("\n")
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        # 写入操作系统缓冲区，进程崩溃也不会丢失
+        self._journal.flush()
+        self._journal_entries += 1
+    
+    def save_data(self, compact: bool = False):
+        """保存检查点：同步日志到磁盘，日志过长或指定 compact 时折叠回快照"""
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+        
+        if compact or self._journal_entries >= self.compact_threshold():
+            self.compact()
+        else:
+            print(f"✓ 数据已保存到 {self.journal_file}")
+    
+    def compact_threshold(self) -> int:
+        """触发折叠的日志条数：与快照记录数成正比"""
+        return max(COMPACT_MIN_ENTRIES, len(self.data["results"]))
+    
+    def compact(self):
+        """把当前数据整体写入快照文件，并清空日志"""
         self.data["metadata"]["last_updated"] = datetime.now().isoformat()
-        with open(self.data_file, 'w', encoding='utf-8') as f:
+        
+        # 先写临时文件再原子替换，避免写到一半的快照覆盖旧数据
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(self.data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+        
+        # 快照已包含全部更新；即使在此处崩溃，重放日志也是幂等的
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._journal_entries = 0
+        
         print(f"✓ 数据已保存到 {self.data_file}")
     
+    def close(self):
+        """关闭日志文件句柄"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+    
+    def iter_records(self, engine: Optional[str] = None) -> Iterator[Dict]:
+        """逐条遍历所有记录，指定 engine 时只遍历该搜索引擎的记录"""
+        if engine is not None:
+            return iter(self._index.get(engine, {}).values())
+        return iter(self.data["results"])
+    
+    def get_metadata(self) -> Dict:
+        """获取元数据"""
+        return self.data["metadata"]
+    
     def get_test_record(self, engine: str, keyword: str) -> Optional[Dict]:
         """获取指定测试的记录"""
-        for record in self.data["results"]:
-            if record["engine"] == engine and record["keyword"] == keyword:
-                return record
-        return None
+        return self._index.get(engine, {}).get(keyword)
     
     def update_test_record(self, engine: str, keyword: str, 
                           status: str, screenshot_path: str, 
                           error_message: Optional[str] = None):
         """更新或创建测试记录"""
+        entry = {
+            "op": "upsert",
+            "engine": engine,
+            "keyword": keyword,
+            "status": status,
+            "screenshot_path": screenshot_path,
+            "timestamp": datetime.now().isoformat(),
+            "error_message": error_message
+        }
+        self._apply_upsert(entry)
+        self._append_journal(entry)
+    
+    def _apply_upsert(self, entry: Dict):
+        """按日志记录更新或创建测试记录，并维护统计"""
+        engine = entry["engine"]
+        keyword = entry["keyword"]
+        status = entry["status"]
         record = self.get_test_record(engine, keyword)
         
         if record:
             # 更新现有记录
             old_status = record["status"]
             record["status"] = status
-            record["screenshot_path"] = screenshot_path
-            record["timestamp"] = datetime.now().isoformat()
-            record["error_message"] = error_message
+            record["screenshot_path"] = entry["screenshot_path"]
+            record["timestamp"] = entry["timestamp"]
+            record["error_message"] = entry["error_message"]
             
             # 更新统计
             if old_status != status:
@@ -70,12 +204,13 @@ class DataManager:
                 "engine": engine,
                 "keyword": keyword,
                 "status": status,
-                "screenshot_path": screenshot_path,
-                "timestamp": datetime.now().isoformat(),
-                "error_message": error_message,
+                "screenshot_path": entry["screenshot_path"],
+                "timestamp": entry["timestamp"],
+                "error_message": entry["error_message"],
                 "evaluation": None
             }
             self.data["results"].append(new_record)
+            self._index.setdefault(engine, {})[keyword] = new_record
             
             # 更新统计
             self.data["metadata"]["total_tests"] += 1
@@ -83,18 +218,59 @@ class DataManager:
     
     def update_evaluation(self, engine: str, keyword: str, evaluation: Dict):
         """更新测试记录的AI评测结果"""
-        record = self.get_test_record(engine, keyword)
+        if not self.get_test_record(engine, keyword):
+            return
+        entry = {
+            "op": "evaluation",
+            "engine": engine,
+            "keyword": keyword,
+            "evaluation": evaluation,
+            "evaluated_at": datetime.now().isoformat()
+        }
+        self._apply_evaluation(entry)
+        self._append_journal(entry)
+    
+    def merge_record(self, record: Dict):
+        """合并来自其他存储（如分片）的一条完整记录，保留原有时间戳和评测结果（包括已清除的评测）"""
+        entry = {
+            "op": "upsert",
+            "engine": record["engine"],
+            "keyword": record["keyword"],
+            "status": record["status"],
+            "screenshot_path": record.get("screenshot_path"),
+            "timestamp": record.get("timestamp"),
+            "error_message": record.get("error_message")
+        }
+        self._apply_upsert(entry)
+        self._append_journal(entry)
+        
+        # 有评测时复制评测；评测被显式清除（截图已变化）时也要清除本地的旧评测
+        if record.get("evaluation") or record.get("evaluated_at"):
+            entry = {
+                "op": "evaluation",
+                "engine": record["engine"],
+                "keyword": record["keyword"],
+                "evaluation": record.get("evaluation") or None,
+                "evaluated_at": record.get("evaluated_at")
+            }
+            self._apply_evaluation(entry)
+            self._append_journal(entry)
+    
+    def _apply_evaluation(self, entry: Dict):
+        """按日志记录更新评测结果"""
+        record = self.get_test_record(entry["engine"], entry["keyword"])
         if record:
-            record["evaluation"] = evaluation
-            record["evaluated_at"] = datetime.now().isoformat()
+            record["evaluation"] = entry["evaluation"]
+            record["evaluated_at"] = entry["evaluated_at"]
     
     def get_pending_tests(self, engines: Dict[str, str], keywords: List[str]) -> List[tuple]:
         """获取需要测试的项目（新测试或失败的测试）"""
         pending = []
         
         for engine in engines.keys():
+            engine_records = self._index.get(engine, {})
             for keyword in keywords:
-                record = self.get_test_record(engine, keyword)
+                record = engine_records.get(keyword)
                 
                 # 如果没有记录，或者状态为失败/验证码，则需要重新测试
                 if not record or record["status"] in ["failed", "captcha", "pending"]:
@@ -107,9 +283,8 @@ class DataManager:
         return [r for r in self.data["results"] if r["status"] == "success"]
     
     def get_unevaluated_tests(self) -> List[Dict]:
-        """获取所有未评测的成功测试"""
-        return [r for r in self.data["results"] 
-                if r["status"] == "success" and r["evaluation"]["comment"].startswith("评测异常：")]
+        """获取所有未评测（或评测异常）的成功测试"""
+        return [r for r in self.data["results"] if needs_evaluation(r)]
     
     def get_statistics(self) -> Dict:
         """获取统计信息"""
@@ -143,3 +318,16 @@ class DataManager:
         print(f"⏳ 待处理：{stats['pending']}")
         print(f"📝 已评测：{stats['evaluated']}")
         print("="*50 + "\n")
+
+
+def create_data_manager(backend: Optional[str] = None, **kwargs):
+    """按 DATA_BACKEND 环境变量（json 或 sqlite）创建数据存储"""
+    backend = (backend or os.getenv("DATA_BACKEND", "json")).lower()
+    
+    if backend == "json":
+        return DataManager(**kwargs)
+    if backend == "sqlite":
+        from sqlite_data_manager import SQLiteDataManager
+        return SQLiteDataManager(**kwargs)
+    
+    raise ValueError(f"不支持的数据存储: {backend}，请使用 json 或 sqlite")
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS eval_cache (
+    key TEXT PRIMARY KEY,
+    evaluation TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_eval_cache_last_access ON eval_cache (last_access);
+"""
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的 sha256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_cache_key(image_sha256: str, prompt: str, provider: str, model: str) -> str:
+    """由 (图片哈希, 提示词哈希, 提供商, 模型) 组成缓存键"""
+    prompt_sha256 = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{image_sha256}:{prompt_sha256}:{provider}:{model}"
+
+
+class EvalCache:
+    """按内容寻址的评测结果缓存，持久化在 SQLite 中，超过 max_entries 时按 LRU 淘汰"""
+
+    def __init__(self, cache_file: str = "eval_cache.db", max_entries: int = 10000):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 评测在线程池中执行，连接需要跨线程共享
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """查询缓存，命中时刷新访问时间"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT evaluation FROM eval_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE eval_cache SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, evaluation: Dict):
+        """写入缓存，并淘汰最久未使用的条目"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO eval_cache (key, evaluation, created_at, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET evaluation = excluded.evaluation, last_access = excluded.last_access",
+                (key, json.dumps(evaluation, ensure_ascii=False), now, now)
+            )
+            overflow = self.conn.execute("SELECT COUNT(*) FROM eval_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM eval_cache WHERE key IN "
+                    "(SELECT key FROM eval_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM eval_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+            "entries": entries
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
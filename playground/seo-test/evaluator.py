@@ -1,32 +1,59 @@
 import asyncio
-import base64
 import json
 import os
-from openai import OpenAI
-from data_manager import DataManager
-from dotenv import load_dotenv
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from data_manager import create_data_manager
+from rate_limiter import RateLimiter
+from eval_cache import EvalCache, file_sha256, make_cache_key
+from image_preprocess import (
+    PREPROCESS_PROFILES, PREPROCESS_STATS, PreparedImage, image_mime, preprocess_image,
+    profile_signature
+)
+from cli import get_int_arg
+from json_stream import extract_json
+from providers import get_provider
 
-load_dotenv()
+# 429 / 5xx 的重试次数和指数退避参数（秒）
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 60
 
-# 支持多种AI模型
-# 可选: openai, gemini
-AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini").lower()
+_env_loaded = False
+
+
+def load_env():
+    """第一次读取配置时才加载 .env，只导入解析函数的工具不需要安装 python-dotenv"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_provider_name():
+    """当前AI提供商（AI_PROVIDER 环境变量，可选: openai, gemini, mock）"""
+    load_env()
+    return os.getenv("AI_PROVIDER", "gemini").lower()
 
-if AI_PROVIDER == "openai":
-    # OpenAI GPT-4 Vision
-    client = OpenAI(
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
-    MODEL_NAME = "gpt-4o"  # 或 gpt-4-vision-preview
-elif AI_PROVIDER == "gemini":
-    # Google Gemini
-    import google.generativeai as genai
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    MODEL_NAME = "gemini-2.5-flash"  # 或 gemini-1.5-pro
-else:
-    raise ValueError(f"不支持的AI提供商: {AI_PROVIDER}，请使用 openai 或 gemini")
 
-print(f"✓ 使用AI模型: {AI_PROVIDER} - {MODEL_NAME}")
+def get_current_provider():
+    """当前AI提供商实例（providers.py），SDK 在第一次请求时才导入"""
+    return get_provider(get_provider_name())
+
+
+def get_eval_cache_max_entries():
+    """评测缓存最多保留的条目数（LRU 淘汰）"""
+    load_env()
+    return int(os.getenv("EVAL_CACHE_MAX_ENTRIES", 10000))
+
+
+def preprocess_enabled():
+    """上传前是否预处理截图（PREPROCESS=0 或 --no-preprocess 关闭）"""
+    load_env()
+    return os.getenv("PREPROCESS", "1") != "0" and "--no-preprocess" not in sys.argv
 
 EVAL_PROMPT = """
 你是一名专业的搜索引擎评测专家。
@@ -71,172 +98,290 @@ EVAL_PROMPT = """
 """
 
 
-def evaluate_image_openai(image_path, keyword, engine):
-    """使用OpenAI GPT-4 Vision评测"""
-    with open(image_path, "rb") as f:
-        img_bytes = f.read()
-
-    result = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": EVAL_PROMPT},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": f"搜索引擎：{engine}\n关键词：{keyword}"},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64.b64encode(img_bytes).decode()}"
-                        }
-                    }
-                ]
-            }
-        ],
-        temperature=0.3,
-        max_tokens=500
-    )
-    
-    return result.choices[0].message.content
+def prepare_images(image_path):
+    """上传前的预处理（裁剪、缩放、重新编码），关闭预处理时直接使用原图"""
+    if not preprocess_enabled():
+        return [PreparedImage(image_path, image_mime(image_path))]
+    return preprocess_image(image_path, get_provider_name())
 
 
-def evaluate_image_gemini(image_path, keyword, engine):
-    """使用Google Gemini评测"""
-    import PIL.Image
-    
-    # 加载图片
-    img = PIL.Image.open(image_path)
+def item_text(keyword, engine):
+    return f"搜索引擎：{engine}\n关键词：{keyword}"
+
+
+def call_provider(image_path, keyword, engine):
+    """调用当前AI提供商，返回模型原始文本（异常直接抛出）"""
+    provider = get_current_provider()
+    images = prepare_images(image_path)
     
-    # 创建模型
-    model = genai.GenerativeModel(MODEL_NAME)
+    start = time.perf_counter()
+    try:
+        return provider.evaluate(EVAL_PROMPT, [(item_text(keyword, engine), images)])
+    finally:
+        PREPROCESS_STATS.add_request(provider.name, time.perf_counter() - start)
+
+
+async def call_provider_async(image_path, keyword, engine, executor=None, limiter=None):
+    """call_provider 的异步版本：预处理在线程池中执行，请求走提供商的异步入口
+
+    指定 limiter 时，按图片尺寸 / 切片数估算的 token 数取得配额，请求完成后按实际用量校正。
+    """
+    provider = get_current_provider()
+    loop = asyncio.get_running_loop()
+    images = await loop.run_in_executor(executor, prepare_images, image_path)
+    parts = [(item_text(keyword, engine), images)]
     
-    # 生成评测
-    prompt = f"{EVAL_PROMPT}\n\n搜索引擎：{engine}\n关键词：{keyword}"
-    result = model.generate_content([prompt, img])
+    reserved = None
+    if limiter is not None:
+        estimate = await loop.run_in_executor(executor, provider.estimate_tokens, EVAL_PROMPT, parts)
+        reserved = await limiter.acquire(estimate)
     
-    return result.text
+    usage = {}
+    start = time.perf_counter()
+    try:
+        return await provider.evaluate_async(EVAL_PROMPT, parts, executor=executor, usage=usage)
+    finally:
+        PREPROCESS_STATS.add_request(provider.name, time.perf_counter() - start)
+        if reserved is not None:
+            limiter.reconcile(reserved, usage.get("total_tokens"))
 
 
-def evaluate_image(image_path, keyword, engine):
-    """使用AI评测单张截图"""
+def parse_evaluation(content):
+    """从模型返回文本中解析评测JSON"""
     try:
-        # 根据提供商选择评测函数
-        if AI_PROVIDER == "openai":
-            content = evaluate_image_openai(image_path, keyword, engine)
-        elif AI_PROVIDER == "gemini":
-            content = evaluate_image_gemini(image_path, keyword, engine)
-        else:
-            raise ValueError(f"不支持的AI提供商: {AI_PROVIDER}")
-        
-        # 尝试解析JSON
-        try:
-            # 提取JSON部分（有时AI会在JSON前后添加说明文字）
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            evaluation = json.loads(content)
-            return evaluation
-        except json.JSONDecodeError:
-            print(f"⚠️ JSON解析失败，原始内容：{content}")
-            return {
-                "accuracy_score": 0,
-                "ad_score": 0,
-                "quality_score": 0,
-                "ux_score": 0,
-                "total_score": 0,
-                "comment": f"评测失败：{content[:100]}"
-            }
-    
-    except Exception as e:
-        print(f"✗ 评测失败：{str(e)}")
+        # 提取第一个完整的JSON对象（有时AI会在JSON前后添加代码块标记或说明文字）
+        evaluation = extract_json(content, expect="object")
+        return evaluation
+    except json.JSONDecodeError:
+        print(f"⚠️ JSON解析失败，原始内容：{content}")
         return {
             "accuracy_score": 0,
             "ad_score": 0,
             "quality_score": 0,
             "ux_score": 0,
             "total_score": 0,
-            "comment": f"评测异常：{str(e)}"
+            "comment": f"评测失败：{content[:100]}"
         }
 
 
-async def run_evaluation():
-    """运行AI评测"""
-    data_manager = DataManager()
+def error_evaluation(e):
+    """评测异常时返回的占位结果"""
+    return {
+        "accuracy_score": 0,
+        "ad_score": 0,
+        "quality_score": 0,
+        "ux_score": 0,
+        "total_score": 0,
+        "comment": f"评测异常：{str(e)}"
+    }
+
+
+def get_cache_key(image_path, keyword, engine):
+    """评测缓存键：图片内容 + 实际发送的提示词 + 提供商 + 模型"""
+    prompt = f"{EVAL_PROMPT}\n\n{item_text(keyword, engine)}"
+    return make_cache_key(file_sha256(image_path), prompt, get_provider_name(), get_cache_model())
+
+
+def get_cache_model():
+    """缓存键中的模型部分：预处理配置不同，模型看到的图片也不同"""
+    provider = get_current_provider()
+    model = provider.model
+    if preprocess_enabled() and provider.name in PREPROCESS_PROFILES:
+        model = f"{model}|{profile_signature(PREPROCESS_PROFILES[provider.name])}"
+    return model
+
+
+def is_cacheable(evaluation):
+    """只缓存成功的评测，失败结果下次需要重新请求"""
+    return evaluation.get("total_score", 0) > 0
+
+
+def evaluate_image(image_path, keyword, engine, cache=None):
+    """使用AI评测单张截图"""
+    key = None
+    if cache is not None:
+        key = get_cache_key(image_path, keyword, engine)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    
+    try:
+        content = call_provider(image_path, keyword, engine)
+        evaluation = parse_evaluation(content)
+    except Exception as e:
+        print(f"✗ 评测失败：{str(e)}")
+        return error_evaluation(e)
+    
+    if key is not None and is_cacheable(evaluation):
+        cache.put(key, evaluation)
+    return evaluation
+
+
+def is_retryable_error(e):
+    """判断是否为可重试的错误（429 限流或 5xx 服务端错误）"""
+    # OpenAI SDK 使用 status_code，Google API 异常使用 code
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    message = str(e)
+    return "429" in message or "ResourceExhausted" in type(e).__name__ or "503" in message
+
+
+async def evaluate_image_async(image_path, keyword, engine, limiter, executor,
+                               cache=None, max_retries=MAX_RETRIES):
+    """缓存 + 限流 + 线程池 + 指数退避重试的异步评测"""
+    loop = asyncio.get_running_loop()
+    
+    # 缓存命中时不占用限流配额，也不发起网络请求
+    key = None
+    if cache is not None:
+        key = await loop.run_in_executor(executor, get_cache_key, image_path, keyword, engine)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    
+    for attempt in range(max_retries + 1):
+        try:
+            # SDK 调用是阻塞的，由提供商在线程池中执行（模拟提供商直接异步等待）；限流配额在其中取得
+            content = await call_provider_async(image_path, keyword, engine, executor, limiter)
+            evaluation = parse_evaluation(content)
+            if key is not None and is_cacheable(evaluation):
+                cache.put(key, evaluation)
+            return evaluation
+        except Exception as e:
+            if attempt < max_retries and is_retryable_error(e):
+                delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY) + random.uniform(0, 1)
+                print(f"⏳ {engine} / {keyword} 触发限流或服务端错误，{delay:.1f} 秒后重试（{attempt + 1}/{max_retries}）")
+                await asyncio.sleep(delay)
+                continue
+            print(f"✗ 评测失败：{str(e)}")
+            return error_evaluation(e)
+
+
+def print_evaluation(evaluation):
+    """输出单条评测结果，返回是否成功"""
+    if evaluation.get("total_score", 0) > 0:
+        print(f"✓ 评测完成")
+        print(f"  - 精准度：{evaluation.get('accuracy_score', 0)}/10")
+        print(f"  - 广告占比：{evaluation.get('ad_score', 0)}/10")
+        print(f"  - 页面质量：{evaluation.get('quality_score', 0)}/10")
+        print(f"  - 用户体验：{evaluation.get('ux_score', 0)}/10")
+        print(f"  - 总分：{evaluation.get('total_score', 0):.2f}/10")
+        return True
+    print(f"✗ 评测失败")
+    return False
+
+
+async def evaluate_record(record, data_manager, limiter, executor, cache, counts, total=None):
+    """评测一条成功的截图记录并写回数据，定期保存检查点"""
+    engine = record["engine"]
+    keyword = record["keyword"]
+    image_path = record["screenshot_path"]
+    
+    # 检查文件是否存在
+    if not os.path.exists(image_path):
+        print(f"✗ 文件不存在：{image_path}")
+        counts["failed"] += 1
+        return
+    
+    # 执行评测
+    evaluation = await evaluate_image_async(image_path, keyword, engine, limiter, executor, cache)
+    
+    # 更新数据
+    data_manager.update_evaluation(engine, keyword, evaluation)
+    counts["done"] += 1
+    
+    # 输出结果
+    progress = f"{counts['done']}/{total}" if total else f"{counts['done']}"
+    print(f"\n进度：{progress}")
+    print(f"🔍 评测：{engine} / {keyword}")
+    if print_evaluation(evaluation):
+        counts["success"] += 1
+    else:
+        counts["failed"] += 1
+    
+    # 定期保存检查点（防止中断丢失）
+    if counts["done"] % 5 == 0:
+        data_manager.save_data()
+        print(f"\n💾 已保存进度（{progress}）")
+
+
+def print_evaluation_summary(counts, cache=None):
+    """输出评测结果摘要、缓存命中和预处理统计"""
+    print("\n" + "="*50)
+    print("📊 评测结果摘要")
+    print("="*50)
+    print(f"✓ 成功：{counts['success']}")
+    print(f"✗ 失败：{counts['failed']}")
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(f"💾 缓存：命中 {cache_stats['hits']}，未命中 {cache_stats['misses']}"
+              f"（命中率 {cache_stats['hit_rate']:.1f}%，共 {cache_stats['entries']} 条）")
+    PREPROCESS_STATS.print_report()
+    print("="*50)
+
+
+async def run_evaluation(concurrency=4, use_cache=True, evaluate_all=False):
+    """运行AI评测
+    
+    最多 concurrency 个请求同时进行，速率由提供商配额（RateLimiter）决定。
+    evaluate_all 时重新评测所有成功的截图，已缓存的结果不会产生API调用。
+    """
+    # ThreadPoolExecutor 不接受 0 个线程
+    concurrency = max(1, concurrency)
+    data_manager = create_data_manager()
     
     # 获取未评测的成功测试
-    unevaluated = data_manager.get_unevaluated_tests()
+    if evaluate_all:
+        unevaluated = data_manager.get_successful_tests()
+    else:
+        unevaluated = data_manager.get_unevaluated_tests()
     
     if not unevaluated:
         print("✓ 没有需要评测的数据")
         data_manager.print_summary()
         return
     
+    limiter = RateLimiter.for_provider(get_provider_name())
+    cache = EvalCache(max_entries=get_eval_cache_max_entries()) if use_cache else None
     print(f"\n🤖 开始AI评测，共 {len(unevaluated)} 个项目")
+    print(f"⚡ 并发数：{concurrency}，限流：{limiter.rpm} 请求/分钟，{limiter.tpm} tokens/分钟")
     print("="*50)
     
-    success_count = 0
-    failed_count = 0
-    
-    for i, record in enumerate(unevaluated, 1):
-        engine = record["engine"]
-        keyword = record["keyword"]
-        image_path = record["screenshot_path"]
-        
-        print(f"\n进度：{i}/{len(unevaluated)}")
-        print(f"🔍 评测：{engine} / {keyword}")
-        
-        # 检查文件是否存在
-        if not os.path.exists(image_path):
-            print(f"✗ 文件不存在：{image_path}")
-            failed_count += 1
-            continue
-        
-        # 执行评测
-        evaluation = evaluate_image(image_path, keyword, engine)
-        
-        # 更新数据
-        data_manager.update_evaluation(engine, keyword, evaluation)
-        
-        # 输出结果
-        if evaluation.get("total_score", 0) > 0:
-            print(f"✓ 评测完成")
-            print(f"  - 精准度：{evaluation.get('accuracy_score', 0)}/10")
-            print(f"  - 广告占比：{evaluation.get('ad_score', 0)}/10")
-            print(f"  - 页面质量：{evaluation.get('quality_score', 0)}/10")
-            print(f"  - 用户体验：{evaluation.get('ux_score', 0)}/10")
-            print(f"  - 总分：{evaluation.get('total_score', 0):.2f}/10")
-            success_count += 1
-        else:
-            print(f"✗ 评测失败")
-            failed_count += 1
-        
-        # 每次评测后保存数据（防止中断丢失）
-        if i % 5 == 0:
-            data_manager.save_data()
-            print(f"\n💾 已保存进度（{i}/{len(unevaluated)}）")
-        
-        # 避免API限流
-        await asyncio.sleep(1)
-    
-    # 最终保存
-    data_manager.save_data()
+    counts = {"done": 0, "success": 0, "failed": 0}
+    queue = asyncio.Queue()
+    for record in unevaluated:
+        queue.put_nowait(record)
+    
+    async def worker(executor):
+        while True:
+            try:
+                record = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await evaluate_record(record, data_manager, limiter, executor, cache, counts, len(unevaluated))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*[worker(executor) for _ in range(concurrency)])
+    
+    # 最终保存（折叠日志到快照）
+    data_manager.save_data(compact=True)
     
     # 输出摘要
-    print("\n" + "="*50)
-    print("📊 评测结果摘要")
-    print("="*50)
-    print(f"✓ 成功：{success_count}")
-    print(f"✗ 失败：{failed_count}")
-    print("="*50)
+    print_evaluation_summary(counts, cache)
+    if cache is not None:
+        cache.close()
     
     data_manager.print_summary()
 
 
 async def main():
-    await run_evaluation()
+    await run_evaluation(
+        concurrency=get_int_arg("--concurrency", 4),
+        use_cache="--no-cache" not in sys.argv,
+        evaluate_all="--all" in sys.argv
+    )
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple
+
+
+# 各提供商的预处理配置
+# - max_height：原图最多保留的高度（像素），超出部分裁掉（搜索结果页越往下信息越少）
+# - max_width：缩放后的宽度上限，接近模型实际使用的分辨率即可
+# - tile_height：缩放后按此高度切片，0 表示不切片
+# - format / quality：重新编码的格式和质量
+PREPROCESS_PROFILES = {
+    # GPT-4o 会把图片缩放到短边 768，更高的分辨率只会增加上传量
+    "openai": {"max_height": 6000, "max_width": 768, "tile_height": 2048, "format": "JPEG", "quality": 80},
+    # Gemini 会自行切分大图，不再额外切片
+    "gemini": {"max_height": 6000, "max_width": 768, "tile_height": 0, "format": "WEBP", "quality": 80},
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+
+def image_mime(path: str) -> str:
+    """按扩展名判断原始截图的 MIME 类型（截图存储可能保存为 WebP）"""
+    return MIME_TYPES["WEBP"] if path.lower().endswith(".webp") else MIME_TYPES["PNG"]
+
+
+class PreparedImage(NamedTuple):
+    path: str
+    mime: str
+
+
+def profile_signature(profile: Dict) -> str:
+    """预处理配置的短哈希，用于区分不同配置的输出文件和评测缓存"""
+    raw = json.dumps(profile, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:10]
+
+
+class PreprocessStats:
+    """按提供商统计预处理节省的字节数以及预处理、请求耗时"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.providers: Dict[str, Dict] = {}
+
+    def _entry(self, provider: str) -> Dict:
+        return self.providers.setdefault(provider, {
+            "images": 0,
+            "original_bytes": 0,
+            "output_bytes": 0,
+            "preprocess_seconds": 0.0,
+            "requests": 0,
+            "request_seconds": 0.0
+        })
+
+    def add_preprocess(self, provider: str, original_bytes: int, output_bytes: int, seconds: float):
+        with self.lock:
+            entry = self._entry(provider)
+            entry["images"] += 1
+            entry["original_bytes"] += original_bytes
+            entry["output_bytes"] += output_bytes
+            entry["preprocess_seconds"] += seconds
+
+    def add_request(self, provider: str, seconds: float):
+        with self.lock:
+            entry = self._entry(provider)
+            entry["requests"] += 1
+            entry["request_seconds"] += seconds
+
+    def print_report(self):
+        """输出各提供商的节省字节数和平均耗时"""
+        for provider, entry in self.providers.items():
+            original = entry["original_bytes"]
+            output = entry["output_bytes"]
+            saved = original - output
+            print(f"🖼️  {provider} 预处理：{entry['images']} 张，"
+                  f"{original / 1024 / 1024:.1f} MB → {output / 1024 / 1024:.1f} MB"
+                  f"（节省 {saved / 1024 / 1024:.1f} MB，{(saved / original * 100) if original else 0:.1f}%）")
+            if entry["images"]:
+                print(f"   平均预处理耗时：{entry['preprocess_seconds'] / entry['images'] * 1000:.0f} ms")
+            if entry["requests"]:
+                print(f"   平均请求耗时：{entry['request_seconds'] / entry['requests']:.2f} s")
+
+
+PREPROCESS_STATS = PreprocessStats()
+
+
+def _output_paths(image_path: str, profile: Dict, count: int) -> List[str]:
+    stem = os.path.splitext(image_path)[0]
+    sig = profile_signature(profile)
+    ext = EXTENSIONS[profile["format"]]
+    return [f"{stem}.{sig}.{i}.{ext}" for i in range(count)]
+
+
+def _find_cached(image_path: str, profile: Dict) -> List[str]:
+    """查找原图旁边已有的预处理结果（比原图新才算有效）"""
+    source_mtime = os.path.getmtime(image_path)
+    paths = []
+    for path in _output_paths(image_path, profile, 64):
+        if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+            break
+        paths.append(path)
+    return paths
+
+
+def preprocess_image(image_path: str, provider: str) -> List[PreparedImage]:
+    """裁剪 / 缩放 / 切片 / 重新编码截图，结果缓存在原图旁边"""
+    profile = PREPROCESS_PROFILES.get(provider)
+    if profile is None:
+        return [PreparedImage(image_path, image_mime(image_path))]
+
+    start = time.perf_counter()
+    mime = MIME_TYPES[profile["format"]]
+    original_bytes = os.path.getsize(image_path)
+
+    paths = _find_cached(image_path, profile)
+    if not paths:
+        paths = _render(image_path, profile)
+
+    output_bytes = sum(os.path.getsize(p) for p in paths)
+    PREPROCESS_STATS.add_preprocess(provider, original_bytes, output_bytes, time.perf_counter() - start)
+    return [PreparedImage(path, mime) for path in paths]
+
+
+def _render(image_path: str, profile: Dict) -> List[str]:
+    """执行实际的图片处理并写出文件"""
+    import PIL.Image
+
+    with PIL.Image.open(image_path) as img:
+        img = img.convert("RGB")
+
+        # 裁掉超出 max_height 的部分
+        if profile["max_height"] and img.height > profile["max_height"]:
+            img = img.crop((0, 0, img.width, profile["max_height"]))
+
+        # 按宽度等比缩放
+        if profile["max_width"] and img.width > profile["max_width"]:
+            height = round(img.height * profile["max_width"] / img.width)
+            img = img.resize((profile["max_width"], height), PIL.Image.LANCZOS)
+
+        # 切片
+        tile_height = profile["tile_height"] or img.height
+        tiles = [
+            img.crop((0, top, img.width, min(top + tile_height, img.height)))
+            for top in range(0, img.height, tile_height)
+        ]
+
+    paths = _output_paths(image_path, profile, len(tiles))
+    for tile, path in zip(tiles, paths):
+        tile.save(path, format=profile["format"], quality=profile["quality"])
+    # 删除旧配置下多出来的切片，避免下次被误认为有效缓存
+    for stale in _output_paths(image_path, profile, 64)[len(tiles):]:
+        if not os.path.exists(stale):
+            break
+        os.remove(stale)
+    return paths
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from cli import get_int_arg, get_str_arg
+
+
+def make_png(seed: int, width: int = 64, height: int = 64) -> bytes:
+    """生成内容各不相同的小 PNG（不依赖 Pillow）"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    pixel = seed.to_bytes(3, "big")
+    row = b"\x00" + pixel * width
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * height))
+        + chunk(b"IEND", b"")
+    )
+
+
+def create_dataset(workdir: str, items: int):
+    """在 workdir 中生成 items 条成功的截图记录"""
+    from data_manager import DataManager
+
+    os.makedirs(os.path.join(workdir, "search_screenshots"), exist_ok=True)
+    manager = DataManager(os.path.join(workdir, "search_data.json"))
+    for i in range(items):
+        path = os.path.join("search_screenshots", f"load_{i}.png")
+        with open(os.path.join(workdir, path), "wb") as f:
+            f.write(make_png(i))
+        manager.update_test_record(f"引擎{i % 6}", f"关键词{i}", "success", path)
+    manager.compact()
+    manager.close()
+
+
+async def run_load_test(items=2000, concurrency=32, batch_size=1, workdir=None, verbose=False):
+    """用模拟提供商跑完整的评测流程（限流、并发、缓存、检查点），输出吞吐量"""
+    # 必须在评测模块读取配置前设置
+    os.environ["AI_PROVIDER"] = "mock"
+    workdir = workdir or tempfile.mkdtemp(prefix="seo_load_")
+    create_dataset(workdir, items)
+    os.chdir(workdir)
+
+    from data_manager import create_data_manager
+    from evaluator import get_current_provider, run_evaluation
+    from batch_evaluator import run_batch_evaluation
+
+    provider = get_current_provider()
+    print(f"🧪 压测：{items} 条记录，并发 {concurrency}，每个请求 {batch_size} 张，"
+          f"模拟延迟 {provider.latency}s，错误率 {provider.error_rate}，429 比例 {provider.rate_429}")
+    print(f"   工作目录：{workdir}")
+
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        if batch_size > 1:
+            await run_batch_evaluation(batch_size, concurrency, use_cache=False)
+        else:
+            await run_evaluation(concurrency, use_cache=False)
+    elapsed = time.perf_counter() - start
+
+    stats = create_data_manager().get_statistics()
+    print(f"✓ 完成：{elapsed:.1f} 秒，{items / elapsed * 60:.0f} 条/分钟，模拟请求 {provider.calls} 次")
+    print(f"   已评测 {stats['evaluated']} 条，评测异常 {len(create_data_manager().get_unevaluated_tests())} 条")
+
+
+def main():
+    """命令行：python load_test.py [--items 2000] [--concurrency 32] [--batch-size 1] [--dir 目录] [--verbose]
+
+    模拟提供商的延迟和错误率通过 MOCK_LATENCY / MOCK_ERROR_RATE / MOCK_429_RATE 设置，
+    限流通过 EVAL_RPM / EVAL_TPM 设置。
+    """
+    asyncio.run(run_load_test(
+        items=get_int_arg("--items", 2000),
+        concurrency=get_int_arg("--concurrency", 32),
+        batch_size=get_int_arg("--batch-size", 1),
+        workdir=get_str_arg("--dir"),
+        verbose="--verbose" in sys.argv
+    ))
+
+
+if __name__ == "__main__":
+    main()
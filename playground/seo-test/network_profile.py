@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from search_config import AD_KEEP_DOMAINS, NETWORK_PROFILES, TRACKER_DOMAINS
+
+
+# 可写入磁盘缓存的静态资源类型
+STATIC_RESOURCE_TYPES = {"stylesheet", "script", "font", "image"}
+
+# 没有 Cache-Control max-age 时的缓存有效期（秒），以及单个资源的大小上限
+HTTP_CACHE_TTL = 24 * 3600
+HTTP_CACHE_MAX_BODY = 5 * 1024 * 1024
+
+# 命中缓存时回放的响应头。缓存的响应体来自 route.fetch()，已经解压，
+# 因此不能回放 content-encoding（浏览器会再解压一次），content-length 由 fulfill 按实际长度生成
+REPLAY_HEADERS = ("content-type", "cache-control", "access-control-allow-origin")
+
+# 代取的响应体已解压，交给页面时去掉这些响应头
+DECODED_BODY_DROP_HEADERS = {"content-encoding", "content-length"}
+
+# Vary 中可以忽略的请求头：响应体已解压，与 Accept-Encoding 无关
+VARY_IGNORED = {"accept-encoding"}
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+def _domain_suffixes(host: str):
+    """www.a.example.com → www.a.example.com, a.example.com, example.com"""
+    parts = host.lower().split(".")
+    for i in range(len(parts) - 1):
+        yield ".".join(parts[i:])
+
+
+def _matches(host: str, domains) -> bool:
+    return any(suffix in domains for suffix in _domain_suffixes(host))
+
+
+def _is_closed_error(error: Exception) -> bool:
+    """Playwright 在页面 / 上下文 / 浏览器关闭后抛出的错误"""
+    message = str(error).lower()
+    return "has been closed" in message or "target closed" in message or "page closed" in message
+
+
+def _vary_key(url: str, names, request_headers: Dict[str, str]) -> str:
+    """响应带 Vary 时的缓存键：URL 加上 Vary 列出的请求头取值"""
+    return url + "".join(f"\n{name}: {request_headers.get(name, '')}" for name in names)
+
+
+class HttpCache:
+    """跨运行共享的静态资源磁盘缓存，按 URL 哈希存放响应体和元数据
+
+    响应带 Vary 时，URL 对应的元数据只记录 Vary 的请求头列表，
+    响应本身按 URL 加这些请求头的取值另行存放，不同请求头的请求不会拿到彼此的响应。
+    """
+
+    def __init__(self, cache_dir: str = "http_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, key: str):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, digest[:2], digest)
+        return base + ".body", base + ".json"
+
+    def get(self, url: str, request_headers: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """返回 {"status", "headers", "body"}，未命中或已过期返回 None"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("vary"):
+                body_path, meta_path = self._paths(_vary_key(url, meta["vary"], request_headers or {}))
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            if meta["expires"] < time.time():
+                return None
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        # 旧版本写入的缓存可能带有 content-encoding，回放前按 REPLAY_HEADERS 重新过滤
+        headers = {k: v for k, v in meta["headers"].items() if k in REPLAY_HEADERS}
+        return {"status": meta["status"], "headers": headers, "body": body}
+
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes,
+            request_headers: Optional[Dict[str, str]] = None):
+        """按 Cache-Control 写入缓存，不可缓存的响应直接忽略"""
+        cache_control = headers.get("cache-control", "").lower()
+        if any(d in cache_control for d in ("no-store", "no-cache", "private")):
+            return
+        if len(body) > HTTP_CACHE_MAX_BODY:
+            return
+        match = MAX_AGE_PATTERN.search(cache_control)
+        ttl = int(match.group(1)) if match else HTTP_CACHE_TTL
+        if ttl <= 0:
+            return
+        vary = sorted({name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()}
+                      - VARY_IGNORED)
+        if "*" in vary:
+            return
+
+        expires = time.time() + ttl
+        meta = {
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k in REPLAY_HEADERS},
+            "expires": expires
+        }
+        if vary:
+            # 先写响应，最后写 URL 对应的 Vary 记录
+            self._write(_vary_key(url, vary, request_headers or {}), body, meta)
+            self._write(url, None, {"url": url, "vary": vary, "expires": expires})
+        else:
+            self._write(url, body, meta)
+
+    def _write(self, key: str, body: Optional[bytes], meta: Dict):
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        files = [(meta_path, json.dumps(meta).encode("utf-8"))]
+        if body is not None:
+            files.insert(0, (body_path, body))
+        # 先写响应体再写元数据，中途失败时元数据缺失即视为未命中
+        for path, data in files:
+            # 分片模式下多个进程共享缓存目录，临时文件名带上进程号
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+
+def new_network_totals() -> Dict:
+    """一次运行中所有页面的网络统计"""
+    return {"pages": 0, "requests": 0, "blocked": 0, "cache_hits": 0,
+            "bytes": 0, "cached_bytes": 0, "load_seconds": 0.0}
+
+
+class NetworkMonitor:
+    """单个页面的请求拦截、静态资源缓存和流量统计
+
+    每次截图前调用 begin_page()，截图后 await end_page() 取得本页统计，
+    同时累加到多个 worker 共享的 totals。
+    """
+
+    def __init__(self, page, profile: str = "default", http_cache: Optional[HttpCache] = None,
+                 totals: Optional[Dict] = None):
+        self.page = page
+        self.profile = NETWORK_PROFILES[profile]
+        self.blocked_types = set(self.profile["resource_types"])
+        self.tracker_domains = set(TRACKER_DOMAINS) if self.profile["block_trackers"] else set()
+        self.keep_domains = set(AD_KEEP_DOMAINS)
+        self.http_cache = http_cache
+        self.totals = totals if totals is not None else new_network_totals()
+        # 已在拦截回调中计入流量的请求，requestfinished 时不再重复统计
+        self.accounted = set()
+        self.pending = set()
+        self.stats = None
+        self.begin_page()
+
+    @property
+    def intercepts(self) -> bool:
+        """是否需要注册 page.route（不拦截也不缓存时完全不经过 Python）"""
+        return bool(self.blocked_types or self.tracker_domains or self.http_cache)
+
+    async def attach(self):
+        if self.intercepts:
+            await self.page.route("**/*", self.handle_route)
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_request_finished)
+
+    def begin_page(self):
+        self.stats = {"requests": 0, "blocked": 0, "cache_hits": 0,
+                      "bytes": 0, "cached_bytes": 0, "load_seconds": 0.0}
+
+    def page_loaded(self, seconds: float):
+        """记录从开始导航到结果就绪的耗时"""
+        self.stats["load_seconds"] = seconds
+
+    async def end_page(self) -> Dict:
+        """等待未完成的流量统计，返回本页统计并累加到 totals"""
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        stats = self.stats
+        self.totals["pages"] += 1
+        for key, value in stats.items():
+            self.totals[key] += value
+        self.begin_page()
+        return stats
+
+    def should_block(self, request) -> bool:
+        host = urlsplit(request.url).hostname or ""
+        if _matches(host, self.keep_domains):
+            return False
+        if request.resource_type in self.blocked_types:
+            return True
+        return _matches(host, self.tracker_domains)
+
+    async def handle_route(self, route):
+        request = route.request
+        try:
+            if self.should_block(request):
+                self.stats["blocked"] += 1
+                await route.abort("blockedbyclient")
+                return
+
+            if (self.http_cache is None or request.method != "GET"
+                    or request.resource_type not in STATIC_RESOURCE_TYPES):
+                await route.continue_()
+                return
+
+            cached = self.http_cache.get(request.url, request.headers)
+            if cached is not None:
+                self.accounted.add(request)
+                self.stats["cache_hits"] += 1
+                self.stats["cached_bytes"] += len(cached["body"])
+                await route.fulfill(status=cached["status"], headers=cached["headers"], body=cached["body"])
+                return
+
+            # 未命中时由 Python 代取响应，写入缓存后再交给页面
+            response = await route.fetch()
+            body = await response.body()
+            self.accounted.add(request)
+            self.stats["bytes"] += len(body)
+            if response.status == 200:
+                try:
+                    self.http_cache.put(request.url, response.status, response.headers, body, request.headers)
+                except OSError as e:
+                    # 缓存写入失败（如磁盘已满）不影响本次请求
+                    print(f"⚠️ HTTP缓存写入失败：{e}")
+            headers = {k: v for k, v in response.headers.items() if k not in DECODED_BODY_DROP_HEADERS}
+            await route.fulfill(response=response, headers=headers, body=body)
+        except Exception as e:
+            # 页面已关闭，请求无需再处理
+            if _is_closed_error(e):
+                return
+            # 其他错误：尽量让请求照常发出，否则中止，避免请求一直挂起直到导航超时
+            try:
+                await route.continue_()
+            except Exception:
+                try:
+                    await route.abort()
+                except Exception:
+                    pass
+
+    def _on_request(self, request):
+        self.stats["requests"] += 1
+
+    def _on_request_finished(self, request):
+        if request in self.accounted:
+            self.accounted.discard(request)
+            return
+        task = asyncio.ensure_future(self._add_request_size(request))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _add_request_size(self, request):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.stats["bytes"] += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+
+def format_network_stats(stats: Dict) -> str:
+    """一行文本描述的网络统计"""
+    text = (f"{stats['bytes'] / 1024:.0f} KB，加载 {stats['load_seconds']:.1f}s，"
+            f"拦截 {stats['blocked']}/{stats['requests']} 个请求")
+    if stats["cache_hits"]:
+        text += f"，缓存命中 {stats['cache_hits']} 个（{stats['cached_bytes'] / 1024:.0f} KB）"
+    return text
@@ -0,0 +1,117 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from cli import get_int_arg, get_str_arg
+from data_manager import create_data_manager, needs_evaluation
+from eval_cache import EvalCache
+from evaluator import (
+    evaluate_record, get_eval_cache_max_entries, get_provider_name, print_evaluation_summary
+)
+from rate_limiter import RateLimiter
+from test import run_capture
+
+
+async def run_pipeline(retry_failed_only=False, manual_captcha=False, workers=1, per_engine=1,
+                       eval_concurrency=4, queue_size=8, use_cache=True, block_profile="default",
+                       http_cache=False, compress=None):
+    """截图与评测流水线：截图成功后立即进入队列，由评测 worker 并行消费
+
+    队列容量为 queue_size，评测跟不上时截图 worker 会在入队时等待（背压），
+    整体耗时接近 max(截图, 评测) 而不是两者之和。
+    之前截图成功但尚未评测的记录由单独的任务与截图同时入队，不会推迟截图开始。
+    """
+    eval_concurrency = max(1, eval_concurrency)
+    data_manager = create_data_manager()
+    limiter = RateLimiter.for_provider(get_provider_name())
+    cache = EvalCache(max_entries=get_eval_cache_max_entries()) if use_cache else None
+    # 队列中保存 (engine, keyword)，评测时再读取最新记录；queued 为已入队、尚未被取出的键
+    queue = asyncio.Queue(maxsize=queue_size)
+    queued = set()
+    counts = {"done": 0, "success": 0, "failed": 0}
+
+    print(f"\n🔀 流水线模式：截图 {workers} 个页面，评测并发 {eval_concurrency}，队列容量 {queue_size}")
+
+    async def enqueue(engine, keyword):
+        # 同一条记录已在队列中时不重复入队（如积压的记录又被重新截图）
+        if (engine, keyword) in queued:
+            return
+        queued.add((engine, keyword))
+        await queue.put((engine, keyword))
+
+    async def on_result(engine, keyword, status, filename):
+        # 只有通过异常检测的截图才需要评测；与上次截图重复的记录保留了原有评测
+        record = data_manager.get_test_record(engine, keyword)
+        if record is not None and needs_evaluation(record):
+            await enqueue(engine, keyword)
+
+    async def feed_backlog(backlog):
+        for record in backlog:
+            await enqueue(record["engine"], record["keyword"])
+
+    async def eval_worker(executor):
+        while True:
+            key = await queue.get()
+            if key is None:
+                return
+            queued.discard(key)
+            # 入队后记录可能已被重新截图（失败或已有评测），以最新状态为准
+            record = data_manager.get_test_record(*key)
+            if record is None or not needs_evaluation(record):
+                continue
+            # 单条记录出错（如预处理或写入失败）不能让 worker 退出，
+            # 否则 worker 全部退出后截图端入队会一直阻塞
+            try:
+                await evaluate_record(record, data_manager, limiter, executor, cache, counts)
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"✗ 评测出错：{record['engine']} / {record['keyword']} - {type(e).__name__}: {e}")
+
+    with ThreadPoolExecutor(max_workers=eval_concurrency) as executor:
+        evaluators = [asyncio.create_task(eval_worker(executor)) for _ in range(eval_concurrency)]
+        # 之前截图成功但尚未评测的记录也一并进入流水线，与截图同时进行
+        feeder = asyncio.create_task(feed_backlog(data_manager.get_unevaluated_tests()))
+        try:
+            await run_capture(
+                retry_failed_only, manual_captcha, workers, per_engine,
+                data_manager=data_manager, on_result=on_result,
+                block_profile=block_profile, http_cache=http_cache, compress=compress
+            )
+            await feeder
+
+            # 截图全部完成，通知评测 worker 在队列清空后退出
+            for _ in evaluators:
+                await queue.put(None)
+            await asyncio.gather(*evaluators)
+        finally:
+            feeder.cancel()
+            for task in evaluators:
+                task.cancel()
+
+    # 最终保存（折叠日志到快照）
+    data_manager.save_data(compact=True)
+
+    print_evaluation_summary(counts, cache)
+    if cache is not None:
+        cache.close()
+
+    data_manager.print_summary()
+
+
+async def main():
+    await run_pipeline(
+        retry_failed_only="--retry-failed" in sys.argv,
+        manual_captcha="--manual-captcha" in sys.argv,
+        workers=get_int_arg("--workers", 1),
+        per_engine=get_int_arg("--per-engine", 1),
+        eval_concurrency=get_int_arg("--concurrency", 4),
+        queue_size=get_int_arg("--queue-size", 8),
+        use_cache="--no-cache" not in sys.argv,
+        block_profile=get_str_arg("--block", "default"),
+        http_cache="--http-cache" in sys.argv,
+        compress=get_str_arg("--compress")
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,340 @@
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from image_preprocess import PreparedImage
+from json_stream import consume_stream, is_object_list
+
+
+# 一段请求内容：(说明文字, 该截图预处理后的图片列表)
+Part = Tuple[str, Sequence[PreparedImage]]
+
+# 读不到图片尺寸（未安装 Pillow 或文件无法解析）时每张图片按此 token 数估算
+IMAGE_TOKENS_UNKNOWN = 1500
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def text_tokens(text: str) -> int:
+    """估算文本的 token 数：中文每字约 1 个，其余每 4 个字符约 1 个"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def image_size(path: str) -> Optional[Tuple[int, int]]:
+    """只读取文件头得到图片尺寸，读不到时返回 None"""
+    try:
+        import PIL.Image
+        with PIL.Image.open(path) as img:
+            return img.size
+    except (ImportError, OSError):
+        return None
+
+
+class EvalProvider(ABC):
+    """评测提供商接口
+
+    evaluate() 为同步调用，返回模型的原始文本；evaluate_async() 默认把同步调用放到线程池执行，
+    原生支持异步的提供商可以直接覆盖。batch 为 True 时 parts 包含多张截图，模型应返回JSON数组。
+    支持流式输出的提供商应在得到完整JSON后立即停止读取（见 json_stream.consume_stream）。
+    传入 usage 字典时，提供商把本次请求消耗的 token 数写入 usage["total_tokens"]，供限流器校正配额。
+    """
+
+    name = ""
+    model = ""
+
+    @abstractmethod
+    def evaluate(self, system_prompt: str, parts: List[Part], batch: bool = False,
+                 usage: Optional[Dict] = None) -> str:
+        """返回模型的原始文本"""
+
+    async def evaluate_async(self, system_prompt: str, parts: List[Part], batch: bool = False,
+                             executor=None, usage: Optional[Dict] = None) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.evaluate, system_prompt, parts, batch, usage)
+
+    def image_tokens(self, width: int, height: int) -> int:
+        """单张图片的输入 token 数，默认按 768×768 切片、每片 258 个估算（与 Gemini 的计费方式一致）"""
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+    def estimate_input_tokens(self, system_prompt: str, parts: List[Part]) -> int:
+        """按提示词长度和每张图片（切片）的尺寸估算输入 token 数"""
+        tokens = text_tokens(system_prompt)
+        for text, images in parts:
+            tokens += text_tokens(text)
+            for image in images:
+                size = image_size(image.path)
+                tokens += self.image_tokens(*size) if size else IMAGE_TOKENS_UNKNOWN
+        return tokens
+
+    def estimate_tokens(self, system_prompt: str, parts: List[Part], batch: bool = False) -> int:
+        """限流时预扣的 token 数：输入估算加上输出上限"""
+        return self.estimate_input_tokens(system_prompt, parts) + max_output_tokens(parts, batch)
+
+
+def max_output_tokens(parts: List[Part], batch: bool) -> int:
+    return 300 * len(parts) + 200 if batch else 500
+
+
+def json_expectation(batch: bool) -> Dict:
+    """流式读取时要等待的JSON：批量评测是由对象组成的数组（跳过说明文字里的 [1] 之类），单张评测是对象"""
+    return {"expect": "array", "accept": is_object_list} if batch else {"expect": "object"}
+
+
+class OpenAIProvider(EvalProvider):
+    """OpenAI GPT-4 Vision"""
+
+    name = "openai"
+    model = "gpt-4o"  # 或 gpt-4-vision-preview
+
+    def __init__(self):
+        # 第一次请求时才导入 SDK 并创建客户端
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    def build_request(self, system_prompt: str, parts: List[Part], batch: bool = False) -> Dict:
+        """chat.completions 请求体（在线调用和离线 Batch API 共用）"""
+        content = []
+        for text, images in parts:
+            content.append({"type": "text", "text": text})
+            for image in images:
+                with open(image.path, "rb") as f:
+                    img_bytes = f.read()
+                content.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{image.mime};base64,{base64.b64encode(img_bytes).decode()}"}
+                })
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
+            ],
+            "temperature": 0.3,
+            "max_tokens": max_output_tokens(parts, batch)
+        }
+
+    def image_tokens(self, width, height):
+        # high detail：先缩放到 2048 以内、短边不超过 768，再按 512×512 切片，每片 170，另加 85
+        scale = min(1.0, 2048 / max(width, height))
+        scale *= min(1.0, 768 / (min(width, height) * scale))
+        tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+        return 85 + 170 * tiles
+
+    def evaluate(self, system_prompt, parts, batch=False, usage=None):
+        # 流式读取，JSON完整后关闭连接，后面的说明文字不再生成
+        request = self.build_request(system_prompt, parts, batch)
+        reported = []
+
+        def texts(stream):
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    reported.append(chunk.usage.total_tokens)
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content
+
+        with self.client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        ) as stream:
+            extractor = consume_stream(texts(stream), **json_expectation(batch))
+        if usage is not None:
+            # 用量在流的最后一段才返回；提前停止读取时按输入估算加已生成的文本计算
+            usage["total_tokens"] = reported[-1] if reported else (
+                self.estimate_input_tokens(system_prompt, parts) + text_tokens(extractor.text)
+            )
+        return extractor.text
+
+
+class GeminiProvider(EvalProvider):
+    """Google Gemini"""
+
+    name = "gemini"
+    model = "gemini-2.5-flash"  # 或 gemini-1.5-pro
+
+    def __init__(self):
+        self._genai = None
+        self._lock = threading.Lock()
+
+    @property
+    def genai(self):
+        with self._lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                self._genai = genai
+        return self._genai
+
+    def evaluate(self, system_prompt, parts, batch=False, usage=None):
+        import PIL.Image
+
+        contents = [system_prompt]
+        for text, images in parts:
+            contents.append(text)
+            contents.extend(PIL.Image.open(image.path) for image in images)
+
+        model = self.genai.GenerativeModel(self.model)
+        response = model.generate_content(contents, stream=True)
+        reported = []
+
+        def texts():
+            for chunk in response:
+                # 每一段都带有截至当前的累计用量
+                total = getattr(getattr(chunk, "usage_metadata", None), "total_token_count", None)
+                if total:
+                    reported.append(total)
+                yield gemini_text(chunk)
+
+        try:
+            extractor = consume_stream(texts(), **json_expectation(batch))
+        finally:
+            cancel_gemini_stream(response)
+        if usage is not None and reported:
+            usage["total_tokens"] = reported[-1]
+        return extractor.text
+
+
+def cancel_gemini_stream(response):
+    """提前停止读取时尽量取消 Gemini 的流式调用，让服务端停止生成
+
+    google-generativeai 的 GenerateContentResponse 目前没有公开的 close() / cancel()（resolve() 会读完剩余内容），
+    先尝试响应对象本身的公开方法（SDK 以后提供时直接生效），否则退回到私有的底层流 _iterator：
+    gRPC 传输的流有 cancel()，其他传输尝试 close()。私有属性随 SDK 版本可能变化，
+    不存在或调用失败时只停止读取、等连接自然结束，不影响已经得到的结果。
+    """
+    for stream in (response, getattr(response, "_iterator", None)):
+        for name in ("cancel", "close"):
+            method = getattr(stream, name, None)
+            if callable(method):
+                try:
+                    method()
+                except Exception:
+                    pass
+                return
+
+
+def gemini_text(chunk) -> str:
+    # 流式响应的最后一段可能只有结束原因、没有文本，此时 .text 会抛出 ValueError
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+class MockProviderError(Exception):
+    """模拟的API错误，status_code 与真实 SDK 异常一致，可被 is_retryable_error 识别"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class MockProvider(EvalProvider):
+    """本地模拟提供商，用于离线压测并发、限流和检查点逻辑
+
+    - MOCK_LATENCY：平均响应时间（秒，实际在 0.5~1.5 倍之间随机）
+    - MOCK_ERROR_RATE：返回不可重试错误（400）的概率
+    - MOCK_429_RATE：返回限流错误（429）的概率
+    得分由图片内容的 sha256 决定，同一张截图每次结果相同。
+    """
+
+    name = "mock"
+    model = "mock-vision"
+
+    def __init__(self, latency: float = None, error_rate: float = None, rate_429: float = None):
+        self.latency = float(os.getenv("MOCK_LATENCY", 0.2)) if latency is None else latency
+        self.error_rate = float(os.getenv("MOCK_ERROR_RATE", 0)) if error_rate is None else error_rate
+        self.rate_429 = float(os.getenv("MOCK_429_RATE", 0)) if rate_429 is None else rate_429
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return self.latency * random.uniform(0.5, 1.5)
+
+    def _maybe_fail(self):
+        roll = random.random()
+        if roll < self.rate_429:
+            raise MockProviderError(429, "Too Many Requests（模拟）")
+        if roll < self.rate_429 + self.error_rate:
+            raise MockProviderError(400, "Bad Request（模拟）")
+
+    @staticmethod
+    def score_images(images: Sequence[PreparedImage]) -> Dict:
+        h = hashlib.sha256()
+        for image in images:
+            with open(image.path, "rb") as f:
+                h.update(f.read())
+        digest = h.digest()
+        scores = [3 + digest[i] % 7 for i in range(4)]
+        return {
+            "accuracy_score": scores[0],
+            "ad_score": scores[1],
+            "quality_score": scores[2],
+            "ux_score": scores[3],
+            "total_score": sum(scores) / 4,
+            "comment": f"模拟评测（{h.hexdigest()[:8]}）"
+        }
+
+    def _respond(self, parts, batch):
+        self.calls += 1
+        self._maybe_fail()
+        if not batch:
+            return json.dumps(self.score_images(parts[0][1]), ensure_ascii=False)
+        items = [{"index": i, **self.score_images(images)} for i, (_, images) in enumerate(parts, 1)]
+        return "```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"
+
+    def _report_usage(self, system_prompt, parts, text, usage):
+        if usage is not None:
+            usage["total_tokens"] = self.estimate_input_tokens(system_prompt, parts) + text_tokens(text)
+
+    def evaluate(self, system_prompt, parts, batch=False, usage=None):
+        time.sleep(self._delay())
+        text = self._respond(parts, batch)
+        self._report_usage(system_prompt, parts, text, usage)
+        return text
+
+    async def evaluate_async(self, system_prompt, parts, batch=False, executor=None, usage=None):
+        # 不占用线程池，便于以很高的并发压测
+        await asyncio.sleep(self._delay())
+        text = self._respond(parts, batch)
+        self._report_usage(system_prompt, parts, text, usage)
+        return text
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "gemini": GeminiProvider,
+    "mock": MockProvider,
+}
+
+_instances: Dict[str, EvalProvider] = {}
+_instances_lock = threading.Lock()
+
+
+def get_provider(name: str) -> EvalProvider:
+    """按名称取得提供商实例（第一次使用时创建，之后复用）"""
+    if name not in PROVIDERS:
+        raise ValueError(f"不支持的AI提供商: {name}，请使用 {' 或 '.join(PROVIDERS)}")
+    with _instances_lock:
+        provider = _instances.get(name)
+        if provider is None:
+            provider = _instances[name] = PROVIDERS[name]()
+            print(f"✓ 使用AI模型: {provider.name} - {provider.model}")
+    return provider
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+
+# 各AI提供商的默认配额（每分钟请求数 / 每分钟 token 数），可用环境变量 EVAL_RPM / EVAL_TPM 覆盖
+PROVIDER_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 30000},
+    "gemini": {"rpm": 10, "tpm": 250000},
+    # 本地模拟提供商，用于压测
+    "mock": {"rpm": 6000, "tpm": 12000000},
+}
+
+# 无法按请求内容估算时，单次评测请求的默认 token 数（截图 + 提示词 + 输出）。
+# 正常情况下由提供商按图片尺寸和切片数估算（EvalProvider.estimate_tokens），请求完成后按实际用量校正
+EST_TOKENS_PER_REQUEST = 2000
+
+
+class TokenBucket:
+    """令牌桶：容量为 capacity，每秒补充 rate 个令牌"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # 串行化等待者，保证先到先得
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """取出 amount 个令牌，不足时等待补充，返回实际取出的数量"""
+        # 超过桶容量的请求只能等桶满后放行
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return amount
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """按实际用量校正：amount 为正时退还多扣的令牌，为负时补扣（令牌可以暂时为负，之后的请求多等一会儿）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """同时限制每分钟请求数和每分钟 token 数"""
+
+    def __init__(self, rpm: int, tpm: int):
+        # 配额为 0 或负数时令牌永远不会补充（补充速率也会除零），至少为 1
+        rpm = max(1, rpm)
+        tpm = max(1, tpm)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+
+    async def acquire(self, tokens: int = EST_TOKENS_PER_REQUEST) -> float:
+        """为一次请求取得配额，返回实际预扣的 token 数（传给 reconcile）"""
+        await self.requests.acquire(1)
+        return await self.tokens.acquire(tokens)
+
+    def reconcile(self, reserved: float, used: Optional[int]):
+        """请求完成后按实际用量校正 token 配额；提供商没有报告用量时保持预扣的估算值"""
+        if used is not None:
+            self.tokens.adjust(reserved - used)
+
+    @classmethod
+    def for_provider(cls, provider: str) -> "RateLimiter":
+        """按提供商默认配额创建限流器，环境变量优先"""
+        limits = PROVIDER_LIMITS.get(provider, {"rpm": 60, "tpm": 100000})
+        rpm = int(os.getenv("EVAL_RPM", limits["rpm"]))
+        tpm = int(os.getenv("EVAL_TPM", limits["tpm"]))
+        return cls(rpm, tpm)
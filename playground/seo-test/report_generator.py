@@ -1,207 +1,324 @@
+import hashlib
 import json
 import os
+import sys
 from datetime import datetime
-from data_manager import DataManager
+from data_manager import DataManager, create_data_manager
+from aggregation import Aggregates, EngineAggregate, aggregate
+from search_config import KEYWORD_GROUPS
+from report_writers import CountingWriter, JsonStreamWriter, MarkdownStreamWriter
+
+
+# 增量报告状态文件的格式版本，结构变化时递增以强制全量生成
+STATE_VERSION = 1
 
 
 class ReportGenerator:
     """生成搜索引擎测评报告"""
     
-    def __init__(self, data_manager: DataManager):
+    def __init__(self, data_manager: DataManager, aggregates: Aggregates = None):
         self.data_manager = data_manager
-        self.data = data_manager.data
+        # 所有输出格式共用一次遍历得到的聚合结果（只保留统计量，不保留记录）
+        self.aggregates = aggregates or aggregate(data_manager.iter_records(), KEYWORD_GROUPS, keep_records=False)
+        # 各搜索引擎详细结果在输出文件中的字节范围，增量生成时用于拼接
+        self.spans = {"json": {}, "markdown": {}}
     
-    def generate_json_report(self, output_file="search_report.json"):
-        """生成JSON格式的详细报告"""
-        report = {
+    def generate_json_report(self, output_file="search_report.json", compact=False, reuse=None):
+        """生成JSON格式的详细报告
+        
+        各部分边生成边写入文件，details 按搜索引擎逐条流式写出，内存占用与记录数无关。
+        compact 时输出无缩进的紧凑 JSON。
+        reuse 为 {engine: [start, end]}，这些搜索引擎的详细结果直接从现有文件中拷贝。
+        """
+        summary = {
             "generated_at": datetime.now().isoformat(),
-            "metadata": self.data["metadata"],
+            "metadata": self.data_manager.get_metadata(),
             "statistics": self._calculate_statistics(),
             "rankings": self._calculate_rankings(),
-            "details": self._organize_by_engine()
+            "keyword_group_rankings": self.aggregates.group_rankings()
         }
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        reuse = reuse or {}
+        src = open(output_file, 'rb') if reuse else None
+        tmp_file = output_file + ".tmp"
+        
+        with open(tmp_file, 'wb') as raw:
+            f = CountingWriter(raw)
+            writer = JsonStreamWriter(f, indent=None if compact else 2)
+            writer.begin_object()
+            for key, value in summary.items():
+                writer.value(value, key)
+            
+            writer.begin_array("details")
+            for engine_data in self._organize_by_engine():
+                engine = engine_data["engine"]
+                writer.begin_item()
+                start = f.position
+                if engine in reuse:
+                    f.copy_from(src, *reuse[engine])
+                else:
+                    writer.begin_object(separated=True)
+                    writer.value(engine, "engine")
+                    writer.begin_array("results")
+                    for result in engine_data["results"]:
+                        writer.value(result)
+                    writer.end_array()
+                    writer.end_object()
+                self.spans["json"][engine] = [start, f.position]
+            writer.end_array()
+            writer.end_object()
+        
+        if src is not None:
+            src.close()
+        os.replace(tmp_file, output_file)
         
         print(f"✓ JSON报告已生成：{output_file}")
-        return report
+        return summary
     
-    def generate_markdown_report(self, output_file="search_report.md"):
-        """生成Markdown格式的可读报告"""
+    def generate_markdown_report(self, output_file="search_report.md", reuse=None):
+        """生成Markdown格式的可读报告（逐行流式写入文件）
+        
+        reuse 含义同 generate_json_report。
+        """
         stats = self._calculate_statistics()
         rankings = self._calculate_rankings()
+        reuse = reuse or {}
+        src = open(output_file, 'rb') if reuse else None
+        tmp_file = output_file + ".tmp"
         
-        md_lines = []
-        md_lines.append("# 搜索引擎测评报告\n")
-        md_lines.append(f"**生成时间**：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        md_lines.append("---\n")
-        
-        # 总体统计
-        md_lines.append("## 📊 总体统计\n")
-        md_lines.append(f"- **总测试数**：{stats['total_tests']}")
-        md_lines.append(f"- **成功测试**：{stats['successful_tests']} ({stats['success_rate']:.1f}%)")
-        md_lines.append(f"- **失败测试**：{stats['failed_tests']}")
-        md_lines.append(f"- **验证码拦截**：{stats['captcha_tests']}")
-        md_lines.append(f"- **已评测数**：{stats['evaluated_tests']}\n")
-        
-        # 搜索引擎排名
-        md_lines.append("## 🏆 搜索引擎综合排名\n")
-        md_lines.append("| 排名 | 搜索引擎 | 综合得分 | 精准度 | 广告占比 | 页面质量 | 用户体验 | 评测数 |")
-        md_lines.append("|------|----------|----------|--------|----------|----------|----------|--------|")
-        
-        for i, rank in enumerate(rankings, 1):
-            md_lines.append(
-                f"| {i} | {rank['engine']} | "
-                f"{rank['avg_total']:.2f} | "
-                f"{rank['avg_accuracy']:.2f} | "
-                f"{rank['avg_ad']:.2f} | "
-                f"{rank['avg_quality']:.2f} | "
-                f"{rank['avg_ux']:.2f} | "
-                f"{rank['count']} |"
-            )
-        
-        md_lines.append("")
-        
-        # 各搜索引擎详细表现
-        md_lines.append("## 📝 详细评测结果\n")
-        
-        for engine_data in self._organize_by_engine():
-            engine = engine_data["engine"]
-            results = engine_data["results"]
+        with open(tmp_file, 'wb') as raw:
+            f = CountingWriter(raw)
+            md = MarkdownStreamWriter(f)
+            md.line("# 搜索引擎测评报告\n")
+            md.line(f"**生成时间**：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            md.line("---\n")
+            
+            # 总体统计
+            md.line("## 📊 总体统计\n")
+            md.line(f"- **总测试数**：{stats['total_tests']}")
+            md.line(f"- **成功测试**：{stats['successful_tests']} ({stats['success_rate']:.1f}%)")
+            md.line(f"- **失败测试**：{stats['failed_tests']}")
+            md.line(f"- **验证码拦截**：{stats['captcha_tests']}")
+            md.line(f"- **已评测数**：{stats['evaluated_tests']}\n")
             
-            md_lines.append(f"### {engine}\n")
+            # 搜索引擎排名
+            md.line("## 🏆 搜索引擎综合排名\n")
+            md.line("| 排名 | 搜索引擎 | 综合得分 | 精准度 | 广告占比 | 页面质量 | 用户体验 | 评测数 |")
+            md.line("|------|----------|----------|--------|----------|----------|----------|--------|")
             
-            # 统计该搜索引擎的平均分
-            evaluated = [r for r in results if r.get("evaluation")]
-            if evaluated:
-                avg_total = sum(r["evaluation"]["total_score"] for r in evaluated) / len(evaluated)
-                md_lines.append(f"**平均得分**：{avg_total:.2f}/10\n")
+            for i, rank in enumerate(rankings, 1):
+                md.line(
+                    f"| {i} | {rank['engine']} | "
+                    f"{rank['avg_total']:.2f} | "
+                    f"{rank['avg_accuracy']:.2f} | "
+                    f"{rank['avg_ad']:.2f} | "
+                    f"{rank['avg_quality']:.2f} | "
+                    f"{rank['avg_ux']:.2f} | "
+                    f"{rank['count']} |"
+                )
             
-            md_lines.append("| 关键词 | 状态 | 总分 | 精准度 | 广告 | 质量 | 体验 | 评价 |")
-            md_lines.append("|--------|------|------|--------|------|------|------|------|")
+            md.line("")
             
-            for result in results:
-                keyword = result["keyword"]
-                status = result["status"]
-                
-                if status == "success" and result.get("evaluation"):
-                    eval_data = result["evaluation"]
-                    md_lines.append(
-                        f"| {keyword} | ✓ | "
-                        f"{eval_data['total_score']:.1f} | "
-                        f"{eval_data['accuracy_score']} | "
-                        f"{eval_data['ad_score']} | "
-                        f"{eval_data['quality_score']} | "
-                        f"{eval_data['ux_score']} | "
-                        f"{eval_data.get('comment', '')[:30]}... |"
+            # 按关键词分类的得分
+            md.line("## 🔑 分类得分\n")
+            for group, group_rankings in self.aggregates.group_rankings().items():
+                md.line(f"### {group}类关键词\n")
+                md.line("| 排名 | 搜索引擎 | 综合得分 | 精准度 | 广告占比 | 页面质量 | 用户体验 | 评测数 |")
+                md.line("|------|----------|----------|--------|----------|----------|----------|--------|")
+                for i, rank in enumerate(group_rankings, 1):
+                    md.line(
+                        f"| {i} | {rank['engine']} | "
+                        f"{rank['avg_total']:.2f} | "
+                        f"{rank['avg_accuracy']:.2f} | "
+                        f"{rank['avg_ad']:.2f} | "
+                        f"{rank['avg_quality']:.2f} | "
+                        f"{rank['avg_ux']:.2f} | "
+                        f"{rank['count']} |"
                     )
-                elif status == "captcha":
-                    md_lines.append(f"| {keyword} | 🤖 验证码 | - | - | - | - | - | - |")
-                elif status == "failed":
-                    md_lines.append(f"| {keyword} | ✗ 失败 | - | - | - | - | - | - |")
-                else:
-                    md_lines.append(f"| {keyword} | ⏳ 待处理 | - | - | - | - | - | - |")
+                md.line("")
+            
+            # 各搜索引擎详细表现
+            md.line("## 📝 详细评测结果\n")
             
-            md_lines.append("")
+            for engine_data in self._organize_by_engine():
+                engine = engine_data["engine"]
+                # 片段包含前导换行，拷贝后与重新生成的内容完全一致
+                start = f.position
+                if engine in reuse:
+                    f.copy_from(src, *reuse[engine])
+                else:
+                    self._write_engine_section(md, engine, engine_data["results"])
+                self.spans["markdown"][engine] = [start, f.position]
         
-        # 写入文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(md_lines))
+        if src is not None:
+            src.close()
+        os.replace(tmp_file, output_file)
         
         print(f"✓ Markdown报告已生成：{output_file}")
     
-    def _calculate_statistics(self):
-        """计算统计数据"""
-        results = self.data["results"]
+    def _write_engine_section(self, md, engine, results):
+        """写出单个搜索引擎的详细结果表格"""
+        md.line(f"### {engine}\n")
         
-        total = len(results)
-        successful = sum(1 for r in results if r["status"] == "success")
-        failed = sum(1 for r in results if r["status"] == "failed")
-        captcha = sum(1 for r in results if r["status"] == "captcha")
-        evaluated = sum(1 for r in results if r.get("evaluation"))
+        # 该搜索引擎的平均分
+        evaluated = self.aggregates.engines[engine].evaluated
+        if evaluated.count:
+            md.line(f"**平均得分**：{evaluated.averages()['avg_total']:.2f}/10\n")
         
-        return {
-            "total_tests": total,
-            "successful_tests": successful,
-            "failed_tests": failed,
-            "captcha_tests": captcha,
-            "evaluated_tests": evaluated,
-            "success_rate": (successful / total * 100) if total > 0 else 0
-        }
-    
-    def _calculate_rankings(self):
-        """计算搜索引擎排名"""
-        engine_scores = {}
+        md.line("| 关键词 | 状态 | 总分 | 精准度 | 广告 | 质量 | 体验 | 评价 |")
+        md.line("|--------|------|------|--------|------|------|------|------|")
         
-        for result in self.data["results"]:
-            if result["status"] == "success" and result.get("evaluation"):
-                engine = result["engine"]
+        for result in results:
+            keyword = result["keyword"]
+            status = result["status"]
+            
+            if status == "success" and result.get("evaluation"):
                 eval_data = result["evaluation"]
-                
-                if engine not in engine_scores:
-                    engine_scores[engine] = {
-                        "total_scores": [],
-                        "accuracy_scores": [],
-                        "ad_scores": [],
-                        "quality_scores": [],
-                        "ux_scores": []
-                    }
-                
-                engine_scores[engine]["total_scores"].append(eval_data.get("total_score", 0))
-                engine_scores[engine]["accuracy_scores"].append(eval_data.get("accuracy_score", 0))
-                engine_scores[engine]["ad_scores"].append(eval_data.get("ad_score", 0))
-                engine_scores[engine]["quality_scores"].append(eval_data.get("quality_score", 0))
-                engine_scores[engine]["ux_scores"].append(eval_data.get("ux_score", 0))
-        
-        # 计算平均分并排序
-        rankings = []
-        for engine, scores in engine_scores.items():
-            rankings.append({
-                "engine": engine,
-                "avg_total": sum(scores["total_scores"]) / len(scores["total_scores"]),
-                "avg_accuracy": sum(scores["accuracy_scores"]) / len(scores["accuracy_scores"]),
-                "avg_ad": sum(scores["ad_scores"]) / len(scores["ad_scores"]),
-                "avg_quality": sum(scores["quality_scores"]) / len(scores["quality_scores"]),
-                "avg_ux": sum(scores["ux_scores"]) / len(scores["ux_scores"]),
-                "count": len(scores["total_scores"])
-            })
+                md.line(
+                    f"| {keyword} | ✓ | "
+                    f"{eval_data['total_score']:.1f} | "
+                    f"{eval_data['accuracy_score']} | "
+                    f"{eval_data['ad_score']} | "
+                    f"{eval_data['quality_score']} | "
+                    f"{eval_data['ux_score']} | "
+                    f"{eval_data.get('comment', '')[:30]}... |"
+                )
+            elif status == "captcha":
+                md.line(f"| {keyword} | 🤖 验证码 | - | - | - | - | - | - |")
+            elif status == "failed":
+                md.line(f"| {keyword} | ✗ 失败 | - | - | - | - | - | - |")
+            else:
+                md.line(f"| {keyword} | ⏳ 待处理 | - | - | - | - | - | - |")
         
-        # 按总分排序
-        rankings.sort(key=lambda x: x["avg_total"], reverse=True)
-        return rankings
+        md.line("")
+    
+    def _calculate_statistics(self):
+        """计算统计数据"""
+        return self.aggregates.statistics()
+    
+    def _calculate_rankings(self):
+        """计算搜索引擎排名"""
+        return self.aggregates.rankings()
     
     def _organize_by_engine(self):
-        """按搜索引擎组织数据"""
-        engine_data = {}
-        
-        for result in self.data["results"]:
-            engine = result["engine"]
-            if engine not in engine_data:
-                engine_data[engine] = []
-            engine_data[engine].append(result)
-        
-        return [{"engine": k, "results": v} for k, v in engine_data.items()]
+        """按搜索引擎组织数据（每个搜索引擎的记录按需从存储中逐条读取）"""
+        for engine in self.aggregates.engines:
+            yield {"engine": engine, "results": self.data_manager.iter_records(engine)}
+
+
+def engine_fingerprints(data_manager):
+    """计算每个搜索引擎记录的内容指纹（只哈希会随更新变化的字段）"""
+    hashes = {}
+    for record in data_manager.iter_records():
+        h = hashes.get(record["engine"])
+        if h is None:
+            h = hashes[record["engine"]] = hashlib.sha256()
+        h.update(json.dumps(
+            [record["keyword"], record["status"], record.get("timestamp"), record.get("evaluated_at")],
+            ensure_ascii=False
+        ).encode("utf-8"))
+    return {engine: h.hexdigest() for engine, h in hashes.items()}
+
+
+def _file_signature(path):
+    """输出文件的大小和修改时间，用于确认文件在上次生成后未被改动"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_state(state_file, json_file, md_file, compact):
+    """读取增量状态，状态失效（版本、配置或输出文件不一致）时返回 None"""
+    if not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except json.JSONDecodeError:
+        return None
+    
+    if (state.get("version") != STATE_VERSION
+            or state.get("compact") != compact
+            or state.get("keyword_groups") != list(KEYWORD_GROUPS)
+            or state.get("json_file") != _file_signature(json_file)
+            or state.get("markdown_file") != _file_signature(md_file)):
+        return None
+    return state
+
+
+def generate_reports(data_manager, json_file="search_report.json", md_file="search_report.md",
+                     compact=False, incremental=False, state_file="search_report.state.json"):
+    """生成JSON和Markdown报告
+    
+    incremental 时只重新聚合、渲染记录有变化的搜索引擎，其余搜索引擎沿用
+    状态文件中的统计量，并从现有报告中原样拷贝详细结果。
+    """
+    fingerprints = engine_fingerprints(data_manager)
+    state = _load_state(state_file, json_file, md_file, compact) if incremental else None
+    
+    if state is None:
+        changed = list(fingerprints)
+        generator = ReportGenerator(data_manager)
+        reuse_json = reuse_md = None
+    else:
+        previous = state["engines"]
+        changed = [e for e, fp in fingerprints.items() if previous.get(e, {}).get("fingerprint") != fp]
+        engine_aggregates = []
+        for engine in fingerprints:
+            if engine in changed:
+                agg = aggregate(data_manager.iter_records(engine), KEYWORD_GROUPS, keep_records=False)
+                engine_aggregates.append(agg.engines[engine])
+            else:
+                engine_aggregates.append(EngineAggregate.from_dict(engine, previous[engine]["aggregate"]))
+        generator = ReportGenerator(data_manager, Aggregates.from_engines(engine_aggregates, KEYWORD_GROUPS))
+        reuse_json = {e: previous[e]["json_span"] for e in fingerprints if e not in changed}
+        reuse_md = {e: previous[e]["markdown_span"] for e in fingerprints if e not in changed}
+        print(f"♻️  增量模式：{len(changed)}/{len(fingerprints)} 个搜索引擎需要重新生成")
+    
+    generator.generate_json_report(json_file, compact=compact, reuse=reuse_json)
+    generator.generate_markdown_report(md_file, reuse=reuse_md)
+    
+    # 保存本次的指纹、统计量和各部分位置，供下次增量生成使用
+    new_state = {
+        "version": STATE_VERSION,
+        "compact": compact,
+        "keyword_groups": list(KEYWORD_GROUPS),
+        "json_file": _file_signature(json_file),
+        "markdown_file": _file_signature(md_file),
+        "engines": {
+            engine: {
+                "fingerprint": fingerprint,
+                "aggregate": generator.aggregates.engines[engine].to_dict(),
+                "json_span": generator.spans["json"][engine],
+                "markdown_span": generator.spans["markdown"][engine]
+            }
+            for engine, fingerprint in fingerprints.items()
+        }
+    }
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(new_state, f, ensure_ascii=False)
+    
+    return changed
 
 
 def main():
     """生成报告"""
-    data_manager = DataManager()
+    data_manager = create_data_manager()
     
-    if not data_manager.data["results"]:
+    if not data_manager.get_statistics()["total"]:
         print("✗ 没有数据，请先运行测试")
         return
     
-    generator = ReportGenerator(data_manager)
-    
     print("\n📄 开始生成报告...")
     print("="*50)
     
-    # 生成JSON报告
-    generator.generate_json_report()
-    
-    # 生成Markdown报告
-    generator.generate_markdown_report()
+    # 生成JSON和Markdown报告
+    generate_reports(
+        data_manager,
+        compact="--compact" in sys.argv,
+        incremental="--incremental" in sys.argv
+    )
     
     print("="*50)
     print("✓ 报告生成完成！\n")
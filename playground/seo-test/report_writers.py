@@ -0,0 +1,108 @@
+import json
+from typing import Any, BinaryIO, Optional, TextIO
+
+
+class CountingWriter:
+    """以 UTF-8 写入二进制文件并记录已写入的字节数，用于定位报告中各部分的位置"""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.position = 0
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self.f.write(data)
+        self.position += len(data)
+
+    def copy_from(self, src: BinaryIO, start: int, end: int, chunk_size: int = 1 << 16):
+        """原样拷贝 src 中 [start, end) 的字节"""
+        src.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = src.read(min(chunk_size, remaining))
+            if not data:
+                break
+            self.f.write(data)
+            self.position += len(data)
+            remaining -= len(data)
+
+
+class JsonStreamWriter:
+    """增量写出 JSON，内存占用只与嵌套深度有关
+
+    indent 为 None 时输出紧凑格式（无缩进、无多余空格）；
+    indent 为整数时输出与 json.dump(..., indent=indent) 相同的格式。
+    """
+
+    def __init__(self, f: TextIO, indent: Optional[int] = 2):
+        self.f = f
+        self.indent = indent
+        # 每层容器是否还没有写入过元素
+        self.stack = []
+
+    def _newline(self, depth: int):
+        if self.indent is not None:
+            self.f.write("\n" + " " * (self.indent * depth))
+
+    def begin_item(self, key: Optional[str] = None):
+        """写出元素前的逗号、换行缩进以及对象键"""
+        if self.stack:
+            if self.stack[-1]:
+                self.stack[-1] = False
+            else:
+                self.f.write(",")
+            self._newline(len(self.stack))
+        if key is not None:
+            self.f.write(json.dumps(key, ensure_ascii=False))
+            self.f.write(": " if self.indent is not None else ":")
+
+    def value(self, value: Any, key: Optional[str] = None):
+        """写出一个完整的值"""
+        self.begin_item(key)
+        if self.indent is None:
+            text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = json.dumps(value, ensure_ascii=False, indent=self.indent)
+            # 嵌套值的后续行需要整体缩进到当前层级
+            text = text.replace("\n", "\n" + " " * (self.indent * len(self.stack)))
+        self.f.write(text)
+
+    def _begin(self, key: Optional[str], token: str, separated: bool):
+        if not separated:
+            self.begin_item(key)
+        self.f.write(token)
+        self.stack.append(True)
+
+    def _end(self, token: str):
+        empty = self.stack.pop()
+        if not empty:
+            self._newline(len(self.stack))
+        self.f.write(token)
+
+    def begin_object(self, key: Optional[str] = None, separated: bool = False):
+        """开始一个对象；separated 表示已调用过 begin_item"""
+        self._begin(key, "{", separated)
+
+    def end_object(self):
+        self._end("}")
+
+    def begin_array(self, key: Optional[str] = None, separated: bool = False):
+        """开始一个数组；separated 表示已调用过 begin_item"""
+        self._begin(key, "[", separated)
+
+    def end_array(self):
+        self._end("]")
+
+
+class MarkdownStreamWriter:
+    """逐行写出 Markdown，行之间以换行分隔（末尾不追加换行）"""
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.first = True
+
+    def line(self, text: str = ""):
+        if not self.first:
+            self.f.write("\n")
+        self.first = False
+        self.f.write(text)
\ No newline at end of file
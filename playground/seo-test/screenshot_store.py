@@ -0,0 +1,234 @@
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# 无损重新压缩格式：None 表示原样保存 Chromium 输出的 PNG
+COMPRESS_FORMATS = {
+    None: ("png", None),
+    "png": ("png", {"format": "PNG", "optimize": True}),
+    "webp": ("webp", {"format": "WEBP", "lossless": True, "method": 4}),
+}
+
+# 分块 dHash：整页截图切成高度为宽度 1/DHASH_TILE_RATIO 的分块（最多 DHASH_MAX_TILES 块），
+# 每块缩放到 DHASH_SIZE+1 见方，记录水平和垂直相邻像素的明暗关系（16 → 每块 512 位）。
+# 每一块的汉明距离都不超过 DHASH_MAX_DISTANCE 才算近似重复；只对整页计算一个哈希时，
+# 长页面中某条结果或广告的变化会被平均掉
+DHASH_SIZE = 16
+DHASH_TILE_RATIO = 4
+DHASH_MAX_TILES = 64
+DHASH_MAX_DISTANCE = 4
+
+
+class StoredScreenshot(NamedTuple):
+    path: str
+    sha256: str
+    # None：新截图；"identical"：与上次成功截图字节完全相同；"similar"：与上次成功截图视觉上几乎相同
+    duplicate: Optional[str]
+
+
+def dhash(image_bytes: bytes, size: int = DHASH_SIZE) -> Optional[Tuple[str, int, int]]:
+    """计算分块差值哈希，返回 (各分块的十六进制哈希用逗号连接, 宽, 高)；未安装 Pillow 时返回 None"""
+    try:
+        import PIL.Image
+    except ImportError:
+        return None
+
+    side = size + 1
+    hashes = []
+    with PIL.Image.open(io.BytesIO(image_bytes)) as img:
+        width, height = img.size
+        gray = img.convert("L")
+        tiles = max(1, min(DHASH_MAX_TILES, round(height * DHASH_TILE_RATIO / max(1, width))))
+        for i in range(tiles):
+            top = height * i // tiles
+            bottom = max(top + 1, height * (i + 1) // tiles)
+            pixels = gray.crop((0, top, width, bottom)).resize((side, side), PIL.Image.BILINEAR).tobytes()
+
+            bits = 0
+            for row in range(size):
+                for col in range(size):
+                    pixel = pixels[row * side + col]
+                    bits = (bits << 1) | (1 if pixel > pixels[row * side + col + 1] else 0)
+                    bits = (bits << 1) | (1 if pixel > pixels[(row + 1) * side + col] else 0)
+            hashes.append(f"{bits:0{size * size // 2}x}")
+    return ",".join(hashes), width, height
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def is_similar(a: str, b: str) -> bool:
+    """两个分块 dHash 的分块数相同，且每一块都几乎相同"""
+    tiles_a, tiles_b = a.split(","), b.split(",")
+    return len(tiles_a) == len(tiles_b) and all(
+        len(x) == len(y) and hamming_distance(x, y) <= DHASH_MAX_DISTANCE for x, y in zip(tiles_a, tiles_b)
+    )
+
+
+class ScreenshotStore:
+    """按内容哈希保存截图，并记录每个 (engine, keyword) 的历史
+
+    截图保存在 objects/<sha[:2]>/<sha>.<ext>，sha 为原始截图字节的 sha256，
+    新内容总会写入（字节相同的截图自然共用一个文件）；每次保存在 history.jsonl 追加一行。
+    与同一查询上次成功的截图字节相同或视觉上几乎相同时标记为重复，调用方据此沿用已有评测。
+    """
+
+    def __init__(self, root: str = "search_screenshots", compress: Optional[str] = None):
+        if compress not in COMPRESS_FORMATS:
+            raise ValueError(f"不支持的压缩格式: {compress}，请使用 png 或 webp")
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.history_file = os.path.join(root, "history.jsonl")
+        self.compress = compress
+        self.extension, self.save_options = COMPRESS_FORMATS[compress]
+        os.makedirs(self.objects_dir, exist_ok=True)
+        # {(engine, keyword): [entry, ...]}，按时间顺序
+        self.history: Dict[Tuple[str, str], List[Dict]] = {}
+        # save() 在线程池中执行，多个 worker 同时保存时保护历史记录
+        self._lock = threading.Lock()
+        self._load_history()
+
+    def _load_history(self):
+        if not os.path.exists(self.history_file):
+            return
+        with open(self.history_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.history.setdefault((entry["engine"], entry["keyword"]), []).append(entry)
+
+    def _append_history(self, entry: Dict):
+        self.history.setdefault((entry["engine"], entry["keyword"]), []).append(entry)
+        # 单行一次写入，分片模式下多个进程追加也不会交错
+        with open(self.history_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.{self.extension}")
+
+    def _write_object(self, path: str, data: bytes) -> int:
+        """写入截图文件（可选无损重新压缩），返回写入的字节数"""
+        if self.save_options is not None:
+            try:
+                import PIL.Image
+                with PIL.Image.open(io.BytesIO(data)) as img:
+                    buffer = io.BytesIO()
+                    img.save(buffer, **self.save_options)
+                # 重新压缩反而更大时保留原始数据（PNG 内容本身仍可解码）
+                if buffer.tell() < len(data):
+                    data = buffer.getvalue()
+            except ImportError:
+                pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def last_success(self, engine: str, keyword: str) -> Optional[Dict]:
+        """同一查询最近一次成功的截图（验证码、失败页面的截图不参与重复判断）
+
+        旧版本的历史记录没有 status，无法确认是否成功，也不参与比较。
+        """
+        for entry in reversed(self.history.get((engine, keyword), [])):
+            if entry.get("status") == "success":
+                return entry
+        return None
+
+    def save(self, engine: str, keyword: str, data: bytes, status: str = "success") -> StoredScreenshot:
+        """保存一张截图，返回文件路径，以及成功截图是否与上次成功的截图重复"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        fingerprint = dhash(data) if status == "success" else None
+        with self._lock:
+            return self._save(engine, keyword, data, status, sha256, fingerprint)
+
+    def _save(self, engine: str, keyword: str, data: bytes, status: str, sha256: str,
+              fingerprint: Optional[Tuple[str, int, int]]) -> StoredScreenshot:
+        previous = self.last_success(engine, keyword) if status == "success" else None
+
+        duplicate = None
+        if previous is not None and os.path.exists(previous["path"]):
+            if previous["sha256"] == sha256:
+                duplicate = "identical"
+            elif (fingerprint is not None and previous.get("dhash")
+                  and (fingerprint[1], fingerprint[2]) == (previous["width"], previous["height"])
+                  and is_similar(fingerprint[0], previous["dhash"])):
+                duplicate = "similar"
+
+        # 近似重复只决定是否沿用评测，新截图本身始终保存
+        path = self.object_path(sha256)
+        stored_bytes = 0
+        if not os.path.exists(path):
+            stored_bytes = self._write_object(path, data)
+
+        self._append_history({
+            "engine": engine,
+            "keyword": keyword,
+            "status": status,
+            "sha256": sha256,
+            "path": path,
+            "dhash": fingerprint[0] if fingerprint else None,
+            "width": fingerprint[1] if fingerprint else None,
+            "height": fingerprint[2] if fingerprint else None,
+            "bytes": len(data),
+            "stored_bytes": stored_bytes,
+            "duplicate": duplicate,
+            "timestamp": datetime.now().isoformat()
+        })
+        return StoredScreenshot(path, sha256, duplicate)
+
+    def disk_usage(self) -> Dict:
+        """磁盘占用统计"""
+        objects = 0
+        disk_bytes = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                # 评测预处理生成的缓存文件（多一段配置哈希）与原截图放在一起，不计入文件数
+                if name.count(".") == 1:
+                    objects += 1
+                disk_bytes += os.path.getsize(os.path.join(dirpath, name))
+
+        entries = [entry for history in self.history.values() for entry in history]
+        return {
+            "captures": len(entries),
+            "queries": len(self.history),
+            "objects": objects,
+            "identical": sum(1 for e in entries if e["duplicate"] == "identical"),
+            "similar": sum(1 for e in entries if e["duplicate"] == "similar"),
+            "captured_bytes": sum(e["bytes"] for e in entries),
+            "stored_bytes": sum(e["stored_bytes"] for e in entries),
+            "disk_bytes": disk_bytes
+        }
+
+    def print_usage(self):
+        usage = self.disk_usage()
+        captured = usage["captured_bytes"]
+        saved = captured - usage["stored_bytes"]
+        print(f"🗂️  截图存储：{usage['captures']} 次截图，{usage['queries']} 个查询，{usage['objects']} 个文件")
+        print(f"   重复截图：字节相同 {usage['identical']} 次，视觉近似 {usage['similar']} 次")
+        print(f"   截图原始大小 {captured / 1024 / 1024:.1f} MB → 实际写入 {usage['stored_bytes'] / 1024 / 1024:.1f} MB"
+              f"（节省 {(saved / captured * 100) if captured else 0:.1f}%）")
+        print(f"   目录占用：{usage['disk_bytes'] / 1024 / 1024:.1f} MB（含评测预处理缓存）")
+
+
+def main():
+    """命令行：python screenshot_store.py 输出截图存储的磁盘占用"""
+    root = sys.argv[1] if len(sys.argv) > 1 else "search_screenshots"
+    ScreenshotStore(root).print_usage()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# 搜索引擎和测试关键词配置，截图、评测和报告模块共用
+
+SEARCH_ENGINES = {
+    "百度": "https://www.baidu.com/s?wd=",
+    "搜狗": "https://www.sogou.com/web?query=",
+    "夸克": "https://ai.quark.cn/s?q=",
+    "Google": "https://www.google.com/search?q=",
+    "Bing": "https://www.bing.com/search?q=",
+    "Brave": "https://search.brave.com/search?q="
+}
+
+ACCURACY_KEYWORDS = [
+    "vscode 扩展 esbuild external 错误",
+    "RTCPeerConnection 文件传输慢原因",
+    "http2 和 http3 有什么区别",
+    "Git 交互式 rebase 教程",
+    "Docker 网络 bridge 与 host 区别",
+    "IPv6 地址结构"
+]
+
+AD_KEYWORDS = [
+    "最便宜的机票",
+    "个人贷款利率",
+    "汽车保险报价",
+    "AI 工具免费版",
+    "减肥方法有效",
+    "微信电脑版下载"
+]
+
+# 关键词分类，报告中按分类统计得分
+KEYWORD_GROUPS = {
+    "精准度": ACCURACY_KEYWORDS,
+    "广告": AD_KEYWORDS
+}
+
+# 页面异常检测关键词（不区分大小写）
+CAPTCHA_KEYWORDS = [
+    "验证码", "captcha", "人机验证", "安全验证",
+    "请输入验证码", "滑动验证", "点击验证",
+    "robot check", "security check", "verify"
+]
+
+# 错误页面关键词，只在页面标题中匹配
+ERROR_KEYWORDS = [
+    "404", "500", "503", "error",
+    "页面不存在", "page not found", "服务器错误",
+    "network error", "连接超时"
+]
+
+# 各搜索引擎的页面检测规则，未配置的字段使用 DEFAULT_ENGINE_RULE
+# - result_selector：搜索结果容器，存在即认为结果已加载（SEARCH_ENGINES 中的每个引擎都应配置）
+# - captcha_selector：验证码相关元素（只在没有搜索结果、且元素实际可见时才判定为验证码）
+# - min_text_length：没有 result_selector 时，可见文本至少多长才算正常加载；
+#   这只是兜底判断，可见的验证码元素或正文中的验证码提示优先
+DEFAULT_ENGINE_RULE = {
+    "result_selector": None,
+    "captcha_selector": "iframe[src*='captcha'], iframe[src*='recaptcha'], [id*='captcha' i], [class*='captcha' i]",
+    "min_text_length": 200
+}
+
+ENGINE_RULES = {
+    "百度": {"result_selector": "#content_left, #results"},
+    "搜狗": {"result_selector": "#main .results, .vrwrap, .rb"},
+    "夸克": {"result_selector": "#results .sc, .c-container, .qk-result"},
+    "Google": {"result_selector": "#search, #rso"},
+    "Bing": {"result_selector": "#b_results"},
+    "Brave": {"result_selector": "#results .snippet, #results"},
+}
+
+# 截图时的网络拦截配置（test.py --block=<profile>）
+# 统计和追踪类请求不影响页面内容，直接拦截
+TRACKER_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "analytics.google.com",
+    "hm.baidu.com", "bat.bing.com", "clarity.ms", "c.bing.com",
+    "pb.sogou.com", "log.mmstat.com", "arms-retcode.aliyuncs.com",
+    "cnzz.com", "umeng.com", "scorecardresearch.com", "hotjar.com",
+    "connect.facebook.net",
+]
+
+# 广告密度是评测维度之一，广告投放域名即使在拦截名单中也必须放行
+AD_KEEP_DOMAINS = [
+    "googleadservices.com", "googlesyndication.com", "doubleclick.net",
+    "adservice.google.com", "pos.baidu.com", "cpro.baidu.com",
+]
+
+# - resource_types：按资源类型拦截（图片会影响广告展示，任何配置都不拦截）
+# - block_trackers：是否拦截 TRACKER_DOMAINS
+NETWORK_PROFILES = {
+    "off": {"resource_types": [], "block_trackers": False},
+    "default": {"resource_types": ["media", "ping"], "block_trackers": True},
+    # 字体也拦截，截图中的图标字体可能显示为方块
+    "aggressive": {"resource_types": ["media", "ping", "font", "texttrack", "manifest"], "block_trackers": True},
+}
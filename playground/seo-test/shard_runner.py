@@ -0,0 +1,170 @@
+import asyncio
+import glob
+import multiprocessing
+import os
+import re
+import sys
+from typing import Dict, List, Tuple
+
+from cli import get_int_arg, get_str_arg
+from data_manager import DataManager, create_data_manager
+from test import plan_tests, run_capture
+
+
+SHARD_DIR = "shards"
+SHARD_FILE_PATTERN = re.compile(r"^search_data\.shard(\d+)\.")
+
+
+def shard_data_file(shard_id: int) -> str:
+    """分片的快照文件路径（日志为同名 .journal.jsonl）"""
+    return os.path.join(SHARD_DIR, f"search_data.shard{shard_id}.json")
+
+
+def shard_profile_dir(shard_id: int) -> str:
+    """分片的浏览器配置目录，分片 0 沿用单进程模式的 browser_profile_1"""
+    return f"browser_profile_{shard_id + 1}"
+
+
+def split_tests(pending_tests: List[Tuple[str, str]], shards: int) -> List[List[Tuple[str, str]]]:
+    """把 (engine, keyword) 矩阵拆分成最多 shards 份
+
+    分片数不超过搜索引擎数时按搜索引擎整体分配（任务多的先分给最空闲的分片），
+    同一搜索引擎只在一个进程内访问，--per-engine 限制仍然全局有效；
+    分片数更多时只能把同一搜索引擎的关键词轮流分到各个分片。
+    """
+    by_engine: Dict[str, List[Tuple[str, str]]] = {}
+    for engine, keyword in pending_tests:
+        by_engine.setdefault(engine, []).append((engine, keyword))
+
+    buckets: List[List[Tuple[str, str]]] = [[] for _ in range(max(1, shards))]
+    if len(buckets) <= len(by_engine):
+        for tests in sorted(by_engine.values(), key=len, reverse=True):
+            min(buckets, key=len).extend(tests)
+    else:
+        ordered = [test for tests in by_engine.values() for test in tests]
+        for i, test in enumerate(ordered):
+            buckets[i % len(buckets)].append(test)
+
+    return [bucket for bucket in buckets if bucket]
+
+
+def run_shard(shard_id: int, tests: List[Tuple[str, str]], options: Dict):
+    """子进程入口：独立的浏览器配置目录和分片数据文件"""
+    data_manager = DataManager(shard_data_file(shard_id))
+    asyncio.run(run_capture(
+        workers=options["workers"],
+        per_engine=options["per_engine"],
+        data_manager=data_manager,
+        block_profile=options["block_profile"],
+        http_cache=options["http_cache"],
+        pending_tests=tests,
+        user_data_dir=shard_profile_dir(shard_id),
+        compress=options["compress"]
+    ))
+    data_manager.close()
+
+
+def merge_shards(data_manager=None) -> int:
+    """把所有分片的记录合并到主数据存储，合并成功后删除分片文件，返回合并条数"""
+    # 分片进程崩溃时可能只留下日志、没有快照，两者都要找
+    # 按文件名解析分片编号，SHARD_DIR 路径本身包含 "." 时也能正确还原快照路径
+    shard_ids = set()
+    for path in glob.glob(os.path.join(SHARD_DIR, "search_data.shard*.*")):
+        match = SHARD_FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            shard_ids.add(int(match.group(1)))
+    shard_files = [shard_data_file(shard_id) for shard_id in sorted(shard_ids)]
+    if not shard_files:
+        print("✓ 没有需要合并的分片")
+        return 0
+
+    data_manager = data_manager or create_data_manager()
+    merged = 0
+    for shard_file in shard_files:
+        shard = DataManager(shard_file)
+        for record in shard.iter_records():
+            data_manager.merge_record(record)
+            merged += 1
+        shard.close()
+        print(f"✓ 已合并 {shard_file}：{len(shard.data['results'])} 条记录")
+
+    data_manager.save_data(compact=True)
+
+    for shard_file in shard_files:
+        for path in (shard_file, os.path.splitext(shard_file)[0] + ".journal.jsonl"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return merged
+
+
+def run_sharded(shards: int, retry_failed_only=False, workers=1, per_engine=1,
+                block_profile="default", http_cache=False, compress=None):
+    """将截图任务拆分到 shards 个进程（各自一个 Chromium），完成后合并结果"""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+    # 先合并上次未合并的分片，避免重复测试
+    data_manager = create_data_manager()
+    merge_shards(data_manager)
+
+    pending_tests = plan_tests(data_manager, retry_failed_only)
+    parts = split_tests(pending_tests, shards)
+    if not parts:
+        print("✓ 没有需要测试的项目")
+        data_manager.print_summary()
+        return
+
+    print(f"🧩 分片模式：{len(parts)} 个进程，每个进程 {workers} 个页面")
+    for shard_id, tests in enumerate(parts):
+        engines = sorted(set(engine for engine, _ in tests))
+        print(f"   分片 {shard_id}：{len(tests)} 个项目（{', '.join(engines)}）")
+
+    options = {
+        "workers": workers,
+        "per_engine": per_engine,
+        "block_profile": block_profile,
+        "http_cache": http_cache,
+        "compress": compress
+    }
+    # Playwright 不支持在 fork 出的子进程中复用，统一使用 spawn
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_shard, args=(shard_id, tests, options), name=f"shard-{shard_id}")
+        for shard_id, tests in enumerate(parts)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            print(f"⚠️  {process.name} 异常退出（exitcode={process.exitcode}），已完成的记录仍会合并")
+
+    merged = merge_shards(data_manager)
+    print(f"\n✓ 共合并 {merged} 条记录")
+    data_manager.print_summary()
+
+
+def main():
+    """命令行：python shard_runner.py --shards 4 [--workers N] [--per-engine N] [--retry-failed]
+    python shard_runner.py --merge 只合并已有的分片"""
+    if "--merge" in sys.argv:
+        merged = merge_shards()
+        print(f"\n✓ 共合并 {merged} 条记录")
+        return
+
+    if "--manual-captcha" in sys.argv:
+        print("⚠️  分片模式下子进程无法读取终端输入，已忽略 --manual-captcha")
+
+    run_sharded(
+        shards=get_int_arg("--shards", os.cpu_count() or 1),
+        retry_failed_only="--retry-failed" in sys.argv,
+        workers=get_int_arg("--workers", 1),
+        per_engine=get_int_arg("--per-engine", 1),
+        block_profile=get_str_arg("--block", "default"),
+        http_cache="--http-cache" in sys.argv,
+        compress=get_str_arg("--compress")
+    )
+
+
+if __name__ == "__main__":
+    main()
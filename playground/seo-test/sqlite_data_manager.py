@@ -0,0 +1,306 @@
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import List, Dict, Optional, Iterator
+
+from data_manager import DataManager
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    engine TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    status TEXT NOT NULL,
+    screenshot_path TEXT,
+    timestamp TEXT,
+    error_message TEXT,
+    evaluation TEXT,
+    evaluated_at TEXT,
+    evaluated INTEGER NOT NULL DEFAULT 0,
+    eval_failed INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (engine, keyword)
+);
+CREATE INDEX IF NOT EXISTS idx_results_status ON results (status);
+CREATE INDEX IF NOT EXISTS idx_results_eval_failed ON results (eval_failed, status);
+CREATE INDEX IF NOT EXISTS idx_results_evaluated ON results (evaluated, status);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 需要重新测试的状态
+RETRY_STATUSES = ("failed", "captcha", "pending")
+
+
+def _is_eval_failed(evaluation: Optional[Dict]) -> bool:
+    """评测是否因异常失败"""
+    return bool(evaluation) and str(evaluation.get("comment", "")).startswith("评测异常：")
+
+
+class SQLiteDataManager:
+    """基于 SQLite 的测试数据存储，公共方法与 DataManager 保持一致
+
+    所有查询都走索引，内存占用不随结果数量增长。
+    """
+
+    def __init__(self, data_file: str = "search_data.db"):
+        self.data_file = data_file
+        self.conn = sqlite3.connect(data_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict:
+        """将数据库行转换为与 JSON 存储相同结构的记录"""
+        record = {
+            "engine": row["engine"],
+            "keyword": row["keyword"],
+            "status": row["status"],
+            "screenshot_path": row["screenshot_path"],
+            "timestamp": row["timestamp"],
+            "error_message": row["error_message"],
+            "evaluation": json.loads(row["evaluation"]) if row["evaluation"] else None
+        }
+        if row["evaluated_at"]:
+            record["evaluated_at"] = row["evaluated_at"]
+        return record
+
+    @property
+    def data(self) -> Dict:
+        """兼容 DataManager.data 的完整数据视图（会加载全部记录，大数据量时请用 iter_records）"""
+        return {
+            "metadata": self.get_metadata(),
+            "results": list(self.iter_records())
+        }
+
+    def get_metadata(self) -> Dict:
+        """获取元数据（统计部分由索引查询实时计算）"""
+        stats = self.get_statistics()
+        return {
+            "last_updated": self._get_meta("last_updated"),
+            "total_tests": stats["total"],
+            "success": stats["success"],
+            "failed": stats["failed"],
+            "captcha": stats["captcha"],
+            "pending": stats["pending"]
+        }
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def save_data(self, compact: bool = False):
+        """提交事务；compact 时同时把 WAL 合并回数据库文件"""
+        self.conn.execute(
+            "INSERT INTO metadata (key, value) VALUES ('last_updated', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (datetime.now().isoformat(),)
+        )
+        self.conn.commit()
+        if compact:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"✓ 数据已保存到 {self.data_file}")
+
+    def close(self):
+        """提交并关闭数据库连接"""
+        self.conn.commit()
+        self.conn.close()
+
+    def iter_records(self, engine: Optional[str] = None) -> Iterator[Dict]:
+        """逐条遍历所有记录，指定 engine 时只遍历该搜索引擎的记录"""
+        if engine is not None:
+            rows = self.conn.execute("SELECT * FROM results WHERE engine = ? ORDER BY id", (engine,))
+        else:
+            rows = self.conn.execute("SELECT * FROM results ORDER BY id")
+        for row in rows:
+            yield self._row_to_record(row)
+
+    def get_test_record(self, engine: str, keyword: str) -> Optional[Dict]:
+        """获取指定测试的记录"""
+        row = self.conn.execute(
+            "SELECT * FROM results WHERE engine = ? AND keyword = ?", (engine, keyword)
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def update_test_record(self, engine: str, keyword: str,
+                          status: str, screenshot_path: str,
+                          error_message: Optional[str] = None):
+        """更新或创建测试记录"""
+        self.conn.execute(
+            "INSERT INTO results (engine, keyword, status, screenshot_path, timestamp, error_message) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(engine, keyword) DO UPDATE SET "
+            "status = excluded.status, screenshot_path = excluded.screenshot_path, "
+            "timestamp = excluded.timestamp, error_message = excluded.error_message",
+            (engine, keyword, status, screenshot_path, datetime.now().isoformat(), error_message)
+        )
+
+    def update_evaluation(self, engine: str, keyword: str, evaluation: Dict):
+        """更新测试记录的AI评测结果"""
+        self.conn.execute(
+            "UPDATE results SET evaluation = ?, evaluated_at = ?, evaluated = ?, eval_failed = ? "
+            "WHERE engine = ? AND keyword = ?",
+            (
+                json.dumps(evaluation, ensure_ascii=False),
+                datetime.now().isoformat(),
+                1 if evaluation else 0,
+                1 if _is_eval_failed(evaluation) else 0,
+                engine,
+                keyword
+            )
+        )
+
+    def merge_record(self, record: Dict):
+        """合并来自其他存储（如分片）的一条完整记录，保留原有时间戳和评测结果（包括已清除的评测）"""
+        evaluation = record.get("evaluation")
+        self.conn.execute(
+            "INSERT INTO results (engine, keyword, status, screenshot_path, timestamp, error_message) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(engine, keyword) DO UPDATE SET "
+            "status = excluded.status, screenshot_path = excluded.screenshot_path, "
+            "timestamp = excluded.timestamp, error_message = excluded.error_message",
+            (record["engine"], record["keyword"], record["status"], record.get("screenshot_path"),
+             record.get("timestamp"), record.get("error_message"))
+        )
+        if evaluation:
+            self.conn.execute(
+                "UPDATE results SET evaluation = ?, evaluated_at = ?, evaluated = 1, eval_failed = ? "
+                "WHERE engine = ? AND keyword = ?",
+                (json.dumps(evaluation, ensure_ascii=False), record.get("evaluated_at"),
+                 1 if _is_eval_failed(evaluation) else 0, record["engine"], record["keyword"])
+            )
+        elif record.get("evaluated_at"):
+            # 评测被显式清除（截图已变化），本地的旧评测同样失效
+            self.conn.execute(
+                "UPDATE results SET evaluation = NULL, evaluated_at = ?, evaluated = 0, eval_failed = 0 "
+                "WHERE engine = ? AND keyword = ?",
+                (record["evaluated_at"], record["engine"], record["keyword"])
+            )
+    
+    def get_pending_tests(self, engines: Dict[str, str], keywords: List[str]) -> List[tuple]:
+        """获取需要测试的项目（新测试或失败的测试）"""
+        engine_names = list(engines.keys())
+        if not engine_names or not keywords:
+            return []
+
+        # 只取出不需要重测的记录，其余组合都需要测试
+        placeholders = ",".join("?" * len(engine_names))
+        done = set(
+            (row["engine"], row["keyword"])
+            for row in self.conn.execute(
+                f"SELECT engine, keyword FROM results "
+                f"WHERE engine IN ({placeholders}) AND status NOT IN (?, ?, ?)",
+                (*engine_names, *RETRY_STATUSES)
+            )
+        )
+
+        return [
+            (engine, keyword)
+            for engine in engine_names
+            for keyword in keywords
+            if (engine, keyword) not in done
+        ]
+
+    def get_successful_tests(self) -> List[Dict]:
+        """获取所有成功的测试记录"""
+        rows = self.conn.execute("SELECT * FROM results WHERE status = 'success' ORDER BY id")
+        return [self._row_to_record(row) for row in rows]
+
+    def get_unevaluated_tests(self) -> List[Dict]:
+        """获取所有未评测（或评测异常）的成功测试"""
+        rows = self.conn.execute(
+            "SELECT * FROM results WHERE (eval_failed = 1 OR evaluated = 0) AND status = 'success' ORDER BY id"
+        )
+        return [self._row_to_record(row) for row in rows]
+
+    def get_statistics(self) -> Dict:
+        """获取统计信息"""
+        stats = {
+            "total": 0,
+            "success": 0,
+            "failed": 0,
+            "captcha": 0,
+            "pending": 0,
+            "evaluated": 0
+        }
+
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) AS count, SUM(evaluated) AS evaluated FROM results GROUP BY status"
+        )
+        for row in rows:
+            stats[row["status"]] = stats.get(row["status"], 0) + row["count"]
+            stats["total"] += row["count"]
+            stats["evaluated"] += row["evaluated"] or 0
+
+        return stats
+
+    # 摘要输出只依赖 get_statistics，直接复用 JSON 存储的实现
+    print_summary = DataManager.print_summary
+
+    def import_json(self, json_file: str = "search_data.json") -> int:
+        """从 search_data.json（含未折叠的日志）一次性导入全部记录，返回导入条数"""
+        source = DataManager(json_file)
+        rows = [
+            (
+                r["engine"],
+                r["keyword"],
+                r["status"],
+                r.get("screenshot_path"),
+                r.get("timestamp"),
+                r.get("error_message"),
+                json.dumps(r["evaluation"], ensure_ascii=False) if r.get("evaluation") else None,
+                r.get("evaluated_at"),
+                1 if r.get("evaluation") else 0,
+                1 if _is_eval_failed(r.get("evaluation")) else 0
+            )
+            for r in source.data["results"]
+        ]
+        source.close()
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO results (engine, keyword, status, screenshot_path, timestamp, "
+                "error_message, evaluation, evaluated_at, evaluated, eval_failed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(engine, keyword) DO UPDATE SET "
+                "status = excluded.status, screenshot_path = excluded.screenshot_path, "
+                "timestamp = excluded.timestamp, error_message = excluded.error_message, "
+                "evaluation = excluded.evaluation, evaluated_at = excluded.evaluated_at, "
+                "evaluated = excluded.evaluated, eval_failed = excluded.eval_failed",
+                rows
+            )
+
+        print(f"✓ 已从 {json_file} 导入 {len(rows)} 条记录到 {self.data_file}")
+        return len(rows)
+
+
+def main():
+    """命令行：python sqlite_data_manager.py --import [search_data.json] [search_data.db]"""
+    if "--import" not in sys.argv:
+        print("用法：python sqlite_data_manager.py --import [search_data.json] [search_data.db]")
+        return
+
+    args = [a for a in sys.argv[1:] if a != "--import"]
+    json_file = args[0] if len(args) > 0 else "search_data.json"
+    db_file = args[1] if len(args) > 1 else "search_data.db"
+
+    if not os.path.exists(json_file):
+        print(f"✗ 文件不存在：{json_file}")
+        return
+
+    manager = SQLiteDataManager(db_file)
+    manager.import_json(json_file)
+    manager.save_data(compact=True)
+    manager.print_summary()
+    manager.close()
+
+
+if __name__ == "__main__":
+    main()
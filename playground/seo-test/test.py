@@ -2,95 +2,61 @@ import asyncio
 import os
 import sys
 import random
-from playwright.async_api import async_playwright
-from data_manager import DataManager
+import time
+from collections import deque
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from data_manager import create_data_manager
+from cli import get_int_arg, get_str_arg
+from search_config import SEARCH_ENGINES, ACCURACY_KEYWORDS, AD_KEYWORDS
+from anomaly import PAGE_PROBE_JS, PAGE_READY_JS, classify_page, get_engine_rule, get_ready_rule
+from network_profile import HttpCache, NetworkMonitor, format_network_stats, new_network_totals
+from screenshot_store import ScreenshotStore
 
 
-SEARCH_ENGINES = {
-    "百度": "https://www.baidu.com/s?wd=",
-    "搜狗": "https://www.sogou.com/web?query=",
-    "夸克": "https://ai.quark.cn/s?q=",
-    "Google": "https://www.google.com/search?q=",
-    "Bing": "https://www.bing.com/search?q=",
-    "Brave": "https://search.brave.com/search?q="
-}
-
-ACCURACY_KEYWORDS = [
-    "vscode 扩展 esbuild external 错误",
-    "RTCPeerConnection 文件传输慢原因",
-    "http2 和 http3 有什么区别",
-    "Git 交互式 rebase 教程",
-    "Docker 网络 bridge 与 host 区别",
-    "IPv6 地址结构"
-]
-
-AD_KEYWORDS = [
-    "最便宜的机票",
-    "个人贷款利率",
-    "汽车保险报价",
-    "AI 工具免费版",
-    "减肥方法有效",
-    "微信电脑版下载"
-]
-
 OUTPUT_DIR = "search_screenshots"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# 等待搜索结果 / 验证码 / 错误信号的最长时间（毫秒）
+READY_TIMEOUT = 15000
+
 
 async def detect_page_anomaly(page, engine_name):
-    """检测页面是否存在异常（验证码、错误页面等）"""
+    """检测页面是否存在异常（验证码、错误页面等）
+    
+    一次 page.evaluate 取回标题、可见文本和选择器命中情况，
+    再用预编译的关键词正则和 ENGINE_RULES 中的规则判断。
+    """
     try:
-        # 获取页面内容
-        content = await page.content()
-        title = await page.title()
-        
-        # 检测验证码相关关键词
-        captcha_keywords = [
-            "验证码", "captcha", "人机验证", "安全验证",
-            "请输入验证码", "滑动验证", "点击验证",
-            "robot check", "security check", "verify"
-        ]
-        
-        content_lower = content.lower()
-        title_lower = title.lower()
-        
-        for keyword in captcha_keywords:
-            if keyword in content_lower or keyword in title_lower:
-                return "captcha", f"检测到验证码：{keyword}"
-        
-        # 检测错误页面
-        error_keywords = [
-            "404", "500", "503", "error",
-            "页面不存在", "page not found", "服务器错误",
-            "network error", "连接超时"
-        ]
-        
-        for keyword in error_keywords:
-            if keyword in title_lower:
-                return "failed", f"检测到错误页面：{keyword}"
-        
-        # 检测页面是否基本加载完成（根据不同搜索引擎检测关键元素）
-        if engine_name == "百度":
-            has_results = await page.locator("#content_left, #results").count() > 0
-        elif engine_name == "Google":
-            has_results = await page.locator("#search, #rso").count() > 0
-        elif engine_name == "Bing":
-            has_results = await page.locator("#b_results").count() > 0
-        else:
-            # 其他搜索引擎简单检测是否有内容
-            has_results = len(content) > 1000
-        
-        if not has_results:
-            return "failed", "页面未正常加载，缺少搜索结果元素"
-        
-        return "success", None
+        rule = get_engine_rule(engine_name)
+        probe = await page.evaluate(PAGE_PROBE_JS, rule)
+        return classify_page(probe, rule)
         
     except Exception as e:
         return "failed", f"异常检测失败：{str(e)}"
 
 
-async def capture_screenshot(page, engine_name, keyword, data_manager, manual_captcha=False):
-    """执行搜索、检测异常并截图"""
+async def wait_for_page_ready(page, engine_name, timeout=READY_TIMEOUT):
+    """等待搜索结果、验证码或错误信号中最先出现的一个
+    
+    返回 "results" / "captcha" / "error"，超时返回 None。
+    """
+    try:
+        handle = await page.wait_for_function(
+            PAGE_READY_JS, arg=get_ready_rule(engine_name), timeout=timeout, polling=250
+        )
+        return await handle.json_value()
+    except PlaywrightTimeoutError:
+        return None
+
+
+async def capture_screenshot(page, engine_name, keyword, data_manager, manual_captcha=False,
+                             captcha_lock=None, network=None, store=None):
+    """执行搜索、检测异常并截图
+    
+    network 为可选的 NetworkMonitor，用于记录本页的加载耗时。
+    store 为 ScreenshotStore 时按内容哈希保存截图；与上次成功的截图重复时保留已有评测，
+    否则清除旧评测，让评测模块重新评测。未指定时按旧方式写入 {engine}_{keyword}.png。
+    """
     url = SEARCH_ENGINES[engine_name] + keyword.replace(" ", "+")
     filename = f"{OUTPUT_DIR}/{engine_name}_{keyword}.png"
     
@@ -100,37 +66,55 @@ async def capture_screenshot(page, engine_name, keyword, data_manager, manual_ca
         # 随机延迟（模拟人类行为）
         await page.wait_for_timeout(random.randint(1000, 2000))
         
-        # 访问页面
-        await page.goto(url, timeout=30000)
+        # 访问页面（DOM 就绪即返回，不等待全部资源）
+        load_started = time.perf_counter()
+        await page.goto(url, timeout=30000, wait_until="domcontentloaded")
         
-        # 随机等待时间
-        await page.wait_for_timeout(random.randint(3000, 5000))
+        # 等待结果出现，遇到验证码或错误页面时立即返回
+        signal = await wait_for_page_ready(page, engine_name)
+        if network is not None:
+            network.page_loaded(time.perf_counter() - load_started)
         
-        # 模拟随机鼠标移动（避免被检测）
-        for _ in range(random.randint(2, 4)):
-            await page.mouse.move(
-                random.randint(100, 500), 
-                random.randint(200, 600)
-            )
-            await page.wait_for_timeout(random.randint(200, 500))
+        if signal == "results":
+            # 结果已出现，短暂停留让剩余内容渲染
+            await page.wait_for_timeout(random.randint(500, 1500))
+            
+            # 模拟随机鼠标移动（避免被检测）
+            for _ in range(random.randint(2, 4)):
+                await page.mouse.move(
+                    random.randint(100, 500), 
+                    random.randint(200, 600)
+                )
+                await page.wait_for_timeout(random.randint(200, 500))
         
         # 检测页面异常
         status, error_message = await detect_page_anomaly(page, engine_name)
         
         # 如果检测到验证码且启用手动模式，等待用户处理
         if status == "captcha" and manual_captcha:
-            print(f"⚠️  检测到验证码！")
-            print(f"📌 请在浏览器中手动完成验证，完成后按回车继续...")
-            input()  # 等待用户按回车
+            async with (captcha_lock or asyncio.Lock()):
+                print(f"⚠️  检测到验证码！（{engine_name} / {keyword}）")
+                print(f"📌 请在浏览器中手动完成验证，完成后按回车继续...")
+                # 在线程中等待输入，避免阻塞其他 worker
+                await asyncio.get_running_loop().run_in_executor(None, input)
             
             # 重新检测
-            await page.wait_for_timeout(2000)
+            await wait_for_page_ready(page, engine_name)
             status, error_message = await detect_page_anomaly(page, engine_name)
             if status == "success":
                 print(f"✓ 验证码已通过")
         
-        # 截图
-        await page.screenshot(path=filename, full_page=True)
+        # 截图（异常页面只截当前视口，节省时间）
+        duplicate = None
+        if store is not None:
+            image = await page.screenshot(full_page=(status == "success"))
+            # 哈希、dHash 和重新压缩都是 CPU 密集操作，放到线程池中，避免阻塞其他 worker
+            stored = await asyncio.get_running_loop().run_in_executor(
+                None, store.save, engine_name, keyword, image, status
+            )
+            filename, duplicate = stored.path, stored.duplicate
+        else:
+            await page.screenshot(path=filename, full_page=(status == "success"))
         
         # 更新数据
         data_manager.update_test_record(
@@ -141,8 +125,15 @@ async def capture_screenshot(page, engine_name, keyword, data_manager, manual_ca
             error_message=error_message
         )
         
+        # 截图内容变化后旧评测不再有效：无论当前存储中有没有评测都显式清除，
+        # 分片模式下分片存储里没有旧评测，清除标记会在合并时传递到主存储
+        if store is not None and status == "success" and duplicate is None:
+            data_manager.update_evaluation(engine_name, keyword, None)
+        
         # 输出结果
-        if status == "success":
+        if status == "success" and duplicate is not None:
+            print(f"♻️  与上次截图{'相同' if duplicate == 'identical' else '几乎相同'}，沿用已有评测：{filename}")
+        elif status == "success":
             print(f"✓ 成功：{filename}")
         elif status == "captcha":
             print(f"🤖 验证码：{error_message}")
@@ -166,14 +157,143 @@ async def capture_screenshot(page, engine_name, keyword, data_manager, manual_ca
         return "failed", filename
 
 
-async def run_capture(retry_failed_only=False, manual_captcha=False):
-    """运行截图测试"""
-    data_manager = DataManager()
+STEALTH_SCRIPT = """
+    // 隐藏webdriver属性
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
     
-    if manual_captcha:
-        print("\n🔧 手动验证码模式已启用")
+    // 伪装Chrome对象
+    window.chrome = {
+        runtime: {}
+    };
     
-    # 确定需要测试的项目
+    // 伪装permissions
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+    
+    // 伪装plugins
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+    
+    // 伪装languages
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['zh-CN', 'zh', 'en']
+    });
+"""
+
+
+async def launch_browser(p, user_data_dir="browser_profile_1"):
+    """启动持久化浏览器上下文并注入反检测脚本"""
+    # 启动浏览器（使用更多反检测参数）
+    browser = await p.chromium.launch_persistent_context(
+        user_data_dir=user_data_dir,
+        headless=False,
+        viewport={"width": 1280, "height": 1000},
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+        locale="zh-CN",
+        geolocation={"longitude": 121.47, "latitude": 31.23},
+        timezone_id="Asia/Shanghai",
+        # 添加更多参数避免检测
+        args=[
+            '--disable-blink-features=AutomationControlled',
+            '--disable-dev-shm-usage',
+            '--no-sandbox',
+        ]
+    )
+    
+    # 注入更完整的反检测脚本（对上下文内所有页面生效）
+    await browser.add_init_script(STEALTH_SCRIPT)
+    return browser
+
+
+class EngineScheduler:
+    """按搜索引擎限制并发的任务调度器
+    
+    多个 worker 共享同一个调度器，每次取任务时轮转选择一个
+    当前并发数未达上限的搜索引擎，保证每个搜索引擎只被礼貌地访问。
+    """
+    
+    def __init__(self, pending_tests, per_engine=1):
+        # 上限小于 1 时没有引擎能取到任务，所有 worker 会永远等待
+        self.per_engine = max(1, per_engine)
+        self.queues = {}
+        for engine, keyword in pending_tests:
+            self.queues.setdefault(engine, deque()).append(keyword)
+        self.active = {engine: 0 for engine in self.queues}
+        self.order = deque(self.queues.keys())
+        self.cond = asyncio.Condition()
+    
+    def _remaining(self):
+        return any(self.queues.values())
+    
+    async def acquire(self):
+        """取出下一个可执行的 (engine, keyword)，全部完成时返回 None"""
+        async with self.cond:
+            while self._remaining():
+                for _ in range(len(self.order)):
+                    engine = self.order[0]
+                    self.order.rotate(-1)
+                    if self.queues[engine] and self.active[engine] < self.per_engine:
+                        self.active[engine] += 1
+                        return engine, self.queues[engine].popleft()
+                # 所有还有任务的搜索引擎都已满载，等待其他 worker 释放
+                await self.cond.wait()
+            return None
+    
+    async def release(self, engine):
+        """释放搜索引擎的一个并发名额"""
+        async with self.cond:
+            self.active[engine] -= 1
+            self.cond.notify_all()
+
+
+async def capture_worker(worker_id, browser, scheduler, data_manager, counts, total,
+                         manual_captcha=False, captcha_lock=None, on_result=None,
+                         block_profile="default", http_cache=None, network_totals=None, store=None):
+    """单个截图 worker：独占一个页面，从调度器循环领取任务
+    
+    on_result 为可选的异步回调 on_result(engine, keyword, status, filename)，
+    回调阻塞时（如下游队列已满）worker 会暂停领取新任务。
+    """
+    page = await browser.new_page()
+    network = NetworkMonitor(page, block_profile, http_cache, network_totals)
+    await network.attach()
+    
+    while True:
+        task = await scheduler.acquire()
+        if task is None:
+            break
+        engine, keyword = task
+        
+        try:
+            counts["started"] += 1
+            print(f"\n进度：{counts['started']}/{total}（worker {worker_id}）")
+            # DataManager 只在事件循环线程中同步调用，worker 之间不会交错写入
+            network.begin_page()
+            status, filename = await capture_screenshot(
+                page, engine, keyword, data_manager, manual_captcha, captcha_lock, network, store
+            )
+            print(f"🌐 网络：{format_network_stats(await network.end_page())}")
+            counts[status if status in ("success", "captcha") else "failed"] += 1
+            if on_result is not None:
+                await on_result(engine, keyword, status, filename)
+            
+            # 同一搜索引擎的相邻两次访问之间随机延迟（模拟人类行为）
+            await page.wait_for_timeout(random.randint(1500, 3000))
+        finally:
+            await scheduler.release(engine)
+    
+    await page.close()
+
+
+def plan_tests(data_manager, retry_failed_only=False):
+    """确定需要测试的 (engine, keyword) 列表"""
     if retry_failed_only:
         all_keywords = ACCURACY_KEYWORDS + AD_KEYWORDS
         pending_tests = data_manager.get_pending_tests(SEARCH_ENGINES, all_keywords)
@@ -184,94 +304,83 @@ async def run_capture(retry_failed_only=False, manual_captcha=False):
             for kw in ACCURACY_KEYWORDS + AD_KEYWORDS:
                 pending_tests.append((engine, kw))
         print(f"\n🚀 完整测试模式：将测试 {len(pending_tests)} 个项目")
+    return pending_tests
+
+
+async def run_capture(retry_failed_only=False, manual_captcha=False, workers=1, per_engine=1,
+                      data_manager=None, on_result=None, block_profile="default", http_cache=False,
+                      pending_tests=None, user_data_dir="browser_profile_1", compress=None):
+    """运行截图测试
+    
+    workers 为并发页面数，per_engine 为每个搜索引擎同时进行的最大请求数。
+    data_manager / on_result 供流水线模式（pipeline.py）共享数据并接收截图结果。
+    block_profile 为 search_config.NETWORK_PROFILES 中的拦截配置，
+    http_cache 为 True 时静态资源缓存到 http_cache/ 目录，跨运行复用。
+    pending_tests / user_data_dir 供分片模式（shard_runner.py）指定本分片的任务和浏览器配置目录。
+    compress 为截图的无损重新压缩格式（png / webp），None 表示原样保存。
+    """
+    data_manager = data_manager or create_data_manager()
+    per_engine = max(1, per_engine)
+    
+    if manual_captcha:
+        print("\n🔧 手动验证码模式已启用")
+    
+    # 确定需要测试的项目
+    if pending_tests is not None:
+        print(f"\n🧩 分片模式：将测试 {len(pending_tests)} 个项目")
+    else:
+        pending_tests = plan_tests(data_manager, retry_failed_only)
     
     if not pending_tests:
         print("✓ 没有需要测试的项目")
         data_manager.print_summary()
         return
     
+    if workers > 1:
+        print(f"⚡ 并发模式：{workers} 个页面，每个搜索引擎最多 {per_engine} 个并发")
+    
+    print(f"🌐 网络拦截配置：{block_profile}{'，静态资源磁盘缓存已启用' if http_cache else ''}")
+    
     async with async_playwright() as p:
-        # 启动浏览器（使用更多反检测参数）
-        browser = await p.chromium.launch_persistent_context(
-            user_data_dir="browser_profile_1",
-            headless=False,
-            viewport={"width": 1280, "height": 1000},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            locale="zh-CN",
-            geolocation={"longitude": 121.47, "latitude": 31.23},
-            timezone_id="Asia/Shanghai",
-            # 添加更多参数避免检测
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-            ]
-        )
-        
-        page = await browser.new_page()
-        
-        # 注入更完整的反检测脚本
-        await page.add_init_script("""
-            // 隐藏webdriver属性
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            // 伪装Chrome对象
-            window.chrome = {
-                runtime: {}
-            };
-            
-            // 伪装permissions
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-            
-            // 伪装plugins
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            // 伪装languages
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['zh-CN', 'zh', 'en']
-            });
-        """)
+        browser = await launch_browser(p, user_data_dir)
         
         # 执行测试
-        success_count = 0
-        failed_count = 0
-        captcha_count = 0
+        counts = {"started": 0, "success": 0, "failed": 0, "captcha": 0}
+        scheduler = EngineScheduler(pending_tests, per_engine)
+        # 多个 worker 同时遇到验证码时，逐个提示用户处理
+        captcha_lock = asyncio.Lock()
+        cache = HttpCache() if http_cache else None
+        network_totals = new_network_totals()
+        store = ScreenshotStore(OUTPUT_DIR, compress)
         
-        for i, (engine, keyword) in enumerate(pending_tests, 1):
-            print(f"\n进度：{i}/{len(pending_tests)}")
-            status, _ = await capture_screenshot(page, engine, keyword, data_manager, manual_captcha)
-            
-            if status == "success":
-                success_count += 1
-            elif status == "captcha":
-                captcha_count += 1
-            else:
-                failed_count += 1
-            
-            # 每个测试之间随机延迟（模拟人类行为）
-            await page.wait_for_timeout(random.randint(1500, 3000))
+        await asyncio.gather(*[
+            capture_worker(
+                i, browser, scheduler, data_manager, counts, len(pending_tests),
+                manual_captcha, captcha_lock, on_result, block_profile, cache, network_totals, store
+            )
+            for i in range(1, max(1, workers) + 1)
+        ])
         
         await browser.close()
         
-        # 保存数据
-        data_manager.save_data()
+        # 保存数据（折叠日志到快照）
+        data_manager.save_data(compact=True)
         
         # 输出摘要
         print("\n" + "="*50)
         print("📊 本次测试结果")
         print("="*50)
-        print(f"✓ 成功：{success_count}")
-        print(f"✗ 失败：{failed_count}")
-        print(f"🤖 验证码：{captcha_count}")
+        print(f"✓ 成功：{counts['success']}")
+        print(f"✗ 失败：{counts['failed']}")
+        print(f"🤖 验证码：{counts['captcha']}")
+        if network_totals["pages"]:
+            pages = network_totals["pages"]
+            print(f"🌐 网络：共 {network_totals['bytes'] / 1024 / 1024:.1f} MB，"
+                  f"平均每页 {network_totals['bytes'] / pages / 1024:.0f} KB、"
+                  f"加载 {network_totals['load_seconds'] / pages:.1f}s，"
+                  f"拦截 {network_totals['blocked']} 个请求，"
+                  f"缓存命中 {network_totals['cache_hits']} 个（{network_totals['cached_bytes'] / 1024 / 1024:.1f} MB）")
+        store.print_usage()
         print("="*50)
         
         data_manager.print_summary()
@@ -281,8 +390,16 @@ async def main():
     # 检查命令行参数
     retry_failed_only = "--retry-failed" in sys.argv
     manual_captcha = "--manual-captcha" in sys.argv
+    workers = get_int_arg("--workers", 1)
+    per_engine = get_int_arg("--per-engine", 1)
+    block_profile = get_str_arg("--block", "default")
+    http_cache = "--http-cache" in sys.argv
+    compress = get_str_arg("--compress")
     
-    await run_capture(retry_failed_only, manual_captcha)
+    await run_capture(
+        retry_failed_only, manual_captcha, workers, per_engine,
+        block_profile=block_profile, http_cache=http_cache, compress=compress
+    )
 
 
 if __name__ == "__main__":
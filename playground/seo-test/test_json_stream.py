@@ -0,0 +1,101 @@
+import importlib.util
+import json
+import os
+import time
+
+import pytest
+
+# playground/mcp 中有一份相同的 json_stream.py，两份都按同样的用例测试
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULE_PATHS = {
+    "seo-test": os.path.join(HERE, "json_stream.py"),
+    "mcp": os.path.join(HERE, "..", "mcp", "json_stream.py"),
+}
+
+
+@pytest.fixture(params=sorted(MODULE_PATHS))
+def js(request):
+    spec = importlib.util.spec_from_file_location(f"json_stream_{request.param}", MODULE_PATHS[request.param])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_copies_are_identical():
+    sources = set()
+    for path in MODULE_PATHS.values():
+        with open(path, encoding="utf-8") as f:
+            sources.add(f.read())
+    assert len(sources) == 1
+
+
+def test_markdown_fence_and_prose(js):
+    assert js.extract_json('```json\n{"score": 8}\n```') == {"score": 8}
+    assert js.extract_json('评测结果如下：{"score": 8} 以上。', expect="object") == {"score": 8}
+
+
+def test_brackets_and_escapes_inside_strings(js):
+    text = '{"reason": "包含 } 和 [ 以及 \\" 引号", "score": 3}'
+    assert js.extract_json(text) == json.loads(text)
+
+
+def test_expect_skips_other_type(js):
+    assert js.extract_json('[1, 2] 然后 {"a": 1}', expect="object") == {"a": 1}
+    assert js.extract_json('{"a": 1} 然后 [1, 2]', expect="array") == [1, 2]
+
+
+def test_accept_skips_unmatched_candidates(js):
+    text = 'see [1] 结果：[{"index": 1, "score": 7}]'
+    assert js.extract_json(text, expect="array") == [1]
+    assert js.extract_json(text, expect="array", accept=js.is_object_list) == [{"index": 1, "score": 7}]
+
+
+def test_falls_back_to_inner_candidate(js):
+    assert js.extract_json('{注意 {"a": [1, 2]}}') == {"a": [1, 2]}
+    assert js.extract_json('{ 未闭合的说明 {"a": 1}') == {"a": 1}
+    assert js.extract_json('{ 括号不匹配 ] {"a": 1}') == {"a": 1}
+
+
+def test_not_found_raises(js):
+    with pytest.raises(json.JSONDecodeError):
+        js.extract_json("没有JSON")
+    with pytest.raises(json.JSONDecodeError):
+        js.extract_json("[1]", accept=js.is_object_list)
+
+
+def test_leading_mode_fails_on_prose(js):
+    extractor = js.JsonStreamExtractor(expect="object", leading=True)
+    extractor.feed("好的，{")
+    assert extractor.failed
+    assert js.extract_json('  ```json {"tool": "x"}', leading=True) == {"tool": "x"}
+
+
+@pytest.mark.parametrize("text", ["{" * 20000, "[" * 20000, '{"a": ' * 20000, "[]]" * 20000])
+def test_pathological_input_is_linear(js, text):
+    start = time.perf_counter()
+    with pytest.raises(json.JSONDecodeError):
+        js.extract_json(text, accept=js.is_object_list)
+    assert time.perf_counter() - start < 1
+
+
+def test_stream_stops_after_complete_json(js):
+    read = []
+
+    def chunks():
+        for chunk in ['前言 {"sc', 'ore": 9', '}', " 后面的说明", "不应读取"]:
+            read.append(chunk)
+            yield chunk
+
+    extractor = js.consume_stream(chunks(), expect="object")
+    assert extractor.value == {"score": 9}
+    assert read[-1] == "}"
+    assert extractor.trailing == ""
+
+
+def test_feed_char_by_char_matches_whole_text(js):
+    text = 'x [1] {"a": "}", "b": [{"c": null}]} tail'
+    extractor = js.JsonStreamExtractor()
+    for char in text:
+        if extractor.feed(char):
+            break
+    assert extractor.value == js.extract_json(text) == [1]